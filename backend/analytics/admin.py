@@ -1,10 +1,26 @@
 from django.contrib import admin
-from .models import ExamUpload
+from .models import ExamTask, ExamUpload, ResultCacheEntry, ResultCacheStats, StageTiming, StageTotal, Student, Subject
+
+class StageTimingInline(admin.TabularInline):
+    # wall/CPU time and peak memory of every pipeline stage in the last run
+    model = StageTiming
+    fields = ('stage', 'outcome', 'wall_seconds', 'cpu_seconds', 'peak_rss_mb')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Peak RSS (MB)')
+    def peak_rss_mb(self, obj):
+        return round(obj.peak_rss_bytes / 1024 ** 2, 1)
+
 
 @admin.register(ExamUpload)
 class ExamUploadAdmin(admin.ModelAdmin):
     # columns to show in the list view
-    list_display = ('title', 'uploaded_by', 'uploaded_at','status', 'message')
+    list_display = ('title', 'uploaded_by', 'uploaded_at','status', 'attempts', 'message')
     # adds side filters for easy filtering
     list_filter = ('status', 'uploaded_at' ,'uploaded_by')
     # enables search box or bar to search by title or message
@@ -12,6 +28,55 @@ class ExamUploadAdmin(admin.ModelAdmin):
     search_fields = ('title', 'message', 'uploaded_by__username', 'uploaded_by__email')
     
      # Make the file read-only in admin so you don't accidentally change it
-    readonly_fields = ('uploaded_at','uploaded_by')
+    readonly_fields = ('uploaded_at','uploaded_by', 'queued_at', 'started_at', 'heartbeat_at', 'finished_at', 'attempts', 'worker_id', 'profile_file')
+    # per-stage timings of the last run
+    inlines = [StageTimingInline]
     # default ordering of records
     ordering = ('-uploaded_at',)
+
+
+@admin.register(ExamTask)
+class ExamTaskAdmin(admin.ModelAdmin):
+    # deferred artifact builds queued by downloads
+    list_display = ('exam', 'kind', 'status', 'attempts', 'queued_at', 'finished_at', 'message')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('exam', 'kind', 'queued_at', 'started_at', 'heartbeat_at', 'finished_at', 'attempts', 'worker_id')
+    ordering = ('-queued_at',)
+
+
+@admin.register(ResultCacheEntry)
+class ResultCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'size_bytes', 'hits', 'created_at', 'last_used_at')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'size_bytes', 'hits', 'created_at', 'last_used_at', 'analysis_summary')
+    # least recently used first: the next ones to be evicted
+    ordering = ('last_used_at',)
+
+
+@admin.register(ResultCacheStats)
+class ResultCacheStatsAdmin(admin.ModelAdmin):
+    # storage-wide hit/miss counters for the result cache
+    list_display = ('hits', 'misses', 'hit_rate', 'evictions')
+    readonly_fields = ('hits', 'misses', 'evictions')
+
+
+@admin.register(StageTotal)
+class StageTotalAdmin(admin.ModelAdmin):
+    # cumulative per-stage counters behind the Prometheus metrics
+    list_display = ('stage', 'outcome', 'runs', 'wall_seconds', 'cpu_seconds')
+    readonly_fields = list_display
+
+
+@admin.register(Student)
+class StudentAdmin(admin.ModelAdmin):
+    # filled by the pipeline from every upload (see analytics/scores.py)
+    list_display = ('name', 'adm_no', 'upi', 'owner', 'created_at')
+    search_fields = ('name', 'adm_no', 'upi', 'owner__username')
+    readonly_fields = ('owner', 'key', 'search_name', 'created_at')
+
+
+@admin.register(Subject)
+class SubjectAdmin(admin.ModelAdmin):
+    list_display = ('name', 'owner')
+    search_fields = ('name', 'owner__username')
+    readonly_fields = ('owner', 'key')
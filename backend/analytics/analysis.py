@@ -1,148 +1,490 @@
 # backend/analytics/analysis.pyadmin
 
 import pandas as pd
-import numpy as np
-from django.core.files.base import ContentFile
-from io import BytesIO
-import traceback
+from django.core.files.base import ContentFile, File
+from tempfile import SpooledTemporaryFile, TemporaryDirectory
+import cProfile
+import hashlib
+import json
+import logging
+import marshal
+import os
+import zipfile
+from typing import NamedTuple
+from django.conf import settings
 
 # Import our helper modules
 from .visualizer import subject_performance_chart, pass_rate_chart
-from .utils import generate_student_reports, get_grade_details
+from .utils import generate_student_reports, get_school_name, safe_filename
+from .grading import compile_grading_scheme
+from .cache import normalize_ignore_columns, store_cached_result
+from .columns import ENGINE_VERSION as COLUMN_RULES_VERSION, classify_columns, numeric_subjects
+from .exports import SheetSpec, broadsheet_sheets, write_workbook
+from .ingest import file_fingerprint, load_frame, read_exam_file, save_frame
+from .instrumentation import DEFERRED, FAILED, RAN, SKIPPED, STAGES, PipelineTimer, progress_payload, write_progress
+from .sandbox import classify_exception, failure_message
+from .scores import store_scores
+
+logger = logging.getLogger(__name__)
+
+
+# What a rebuild run (process_exam_file(rebuild=True)) saves: its outputs, never the status or settings
+REBUILD_FIELDS = [
+    'processed_file', 'subject_chart', 'passrate_chart', 'stream_artifacts', 'reports_zip',
+    'parsed_data', 'analysis_data', 'analysis_summary', 'pipeline_state', 'profile_file', 'updated_at',
+]
+
+
+def process_exam_file(exam_instance, incremental=False, prefetch=None, rebuild=False):
+    """
+    Runs the analysis pipeline for one upload.
+
+    incremental=True is the "regrade" mode: the parsed sheet and the graded
+    frame saved by the previous run are reused, and every later stage only
+    re-runs when its inputs changed (compared by fingerprint).
+    prefetch is the set of artifacts to render now (default: the
+    ARTIFACT_PREFETCH setting); the others are deferred until first download.
+    rebuild=True re-runs a COMPLETED exam only to recreate its snapshot and
+    artifacts (analytics/artifacts.py): status, message and progress are left
+    alone, and a failure is raised instead of recorded.
+    Every stage is timed (see analytics/instrumentation.py) and the run is
+    profiled when exam_instance.profile_enabled is set.
+    Returns {stage: 'ran' | 'skipped' | 'deferred' | 'failed'}.
+    """
+    # Stages this run will go through (batch uploads add 'streams' once the file is read)
+    plan = [s for s in STAGES if s != 'streams']
+    timer = PipelineTimer(
+        on_stage=None if rebuild else lambda name: write_progress(exam_instance, name, len(timer.records), len(plan))
+    )
+    profiler = _start_profiler(exam_instance)
+    saved_state = exam_instance.pipeline_state or {}
+    state = saved_state if incremental else {}
+    previous = state.get('fingerprints', {})
+    fingerprints = {}
 
-def process_exam_file(exam_instance):
     try:
-        # --- 1. READ FILE ---
-        file_path = exam_instance.file.path
-        if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        # --- 1. READ FILE (or reuse the Parquet snapshot of the same file) ---
+        # Retries and re-grades of an unchanged upload never parse the sheet again.
+        with timer.stage('read') as read:
+            fingerprints['read'] = file_fingerprint(exam_instance.file)
+            df = None
+            if fingerprints['read'] and saved_state.get('fingerprints', {}).get('read') == fingerprints['read']:
+                df = load_frame(exam_instance.parsed_data)
+            if df is None:
+                df, ingest_report = read_exam_file(exam_instance.file.path, exam_instance.sheets_as_streams)
+                save_frame(exam_instance.parsed_data, df, "parsed")
+            else:
+                ingest_report = saved_state.get('ingest', {})
+                read['outcome'] = SKIPPED
+
+        # A ZIP of stream sheets or a multi-sheet workbook: one job for the whole school
+        batch = bool(ingest_report.get('streams'))
+        if batch:
+            plan = list(STAGES)
 
         # --- 2. DYNAMIC COLUMN DETECTION ---
-        df.columns = df.columns.str.strip() 
-        
-        # Base metadata (Always ignored)
-        metadata_keywords = [
-            'id', 'adm', 'admission', 'index', 'name', 'phone', 'stream', 'gender', 'sex', 
-            'total', 'pos', 'rank', 'dev', 'grade', 'points', 'kcpe', 'upi', 'number'
-        ]
-        
-        # APPEND USER'S CUSTOM IGNORE COLUMNS (The Safety Valve)
-        if exam_instance.custom_ignore_columns:
-            # Convert string "UPI, Nemis" -> list ['upi', 'nemis']
-            extras = [x.strip().lower() for x in exam_instance.custom_ignore_columns.split(',')]
-            metadata_keywords.extend(extras)
-        
-        numeric_cols = df.select_dtypes(include=[np.number]).columns
-        
-        # Determine Subjects
-        subject_cols = []
-        for col in numeric_cols:
-            c_lower = col.lower()
-            # If the column name matches ANY keyword in the list, ignore it
-            if not any(k in c_lower for k in metadata_keywords):
-                subject_cols.append(col)
-        
-        if not subject_cols:
-            raise ValueError(f"No subjects detected. Ignored columns containing: {metadata_keywords}")
-
-        # --- 3. CALCULATIONS ---
-        df[subject_cols] = df[subject_cols].fillna(0)
-        df['Total'] = df[subject_cols].sum(axis=1)
-        df['Average'] = df['Total'] / len(subject_cols)
-        
-        # --- 4. APPLY DYNAMIC GRADING ---
-        scheme = exam_instance.grading_scheme # <--- Get JSON from DB
+        with timer.stage('detection') as stage:
+            fingerprints['detection'] = _fingerprint(COLUMN_RULES_VERSION, normalize_ignore_columns(exam_instance.custom_ignore_columns))
+            if read['outcome'] == SKIPPED and previous.get('detection') == fingerprints['detection'] and state.get('subjects'):
+                subject_cols = state['subjects']
+                stage['outcome'] = SKIPPED
+            else:
+                subject_cols = detect_subject_columns(df, exam_instance.custom_ignore_columns)
+
+        # --- 3. CALCULATIONS (totals, averages, ranks) ---
+        with timer.stage('calculations') as calculations:
+            analysed = None
+            if subject_cols == state.get('subjects'):
+                analysed = load_frame(exam_instance.analysis_data)
+            if analysed is not None:
+                df = analysed
+                calculations['outcome'] = SKIPPED
+            else:
+                df = calculate_totals(df, subject_cols, by_stream=batch)
 
-        def apply_grade_logic(row):
-            # This returns (Grade, Remark, Points)
-            g, r, p = get_grade_details(row['Average'], scheme)
-            # We only want Grade and Points for the dataframe columns
-            return pd.Series([g, p])
+        # --- 4. APPLY DYNAMIC GRADING ---
+        # Compiled once per scheme, then every average AND every subject score
+        # is graded in one vectorized pass (shared with the PDF reports below).
+        with timer.stage('grading') as grading_stage:
+            grading = compile_grading_scheme(exam_instance.grading_scheme)
+            fingerprints['grading'] = _fingerprint(exam_instance.grading_scheme)
+            if calculations['outcome'] == SKIPPED and previous.get('grading') == fingerprints['grading']:
+                grading_stage['outcome'] = SKIPPED
+            else:
+                grades = grading.grade_exam(df['Average'], df[subject_cols])
+                apply_grades(df, grades)
 
-        # Create new columns based on the Average
-        df[['Overall Grade', 'Points']] = df.apply(apply_grade_logic, axis=1)
-        
-        # Ranking
-        df['Rank'] = df['Total'].rank(ascending=False, method='min')
-        df = df.sort_values(by='Rank')
+            if RAN in (calculations['outcome'], grading_stage['outcome']):
+                save_frame(exam_instance.analysis_data, df, "analysis")
 
         # --- 5. PREPARE DASHBOARD METADATA ---
-        subject_means = df[subject_cols].mean().sort_values(ascending=False)
-        # --- FIX STARTS HERE: Smart Name Detection ---
-        best_student_name = "Unknown"
-        
-        # List of possible headers for the student name
-        name_candidates = ['name', 'student', 'student name', 'names', 'full name']
-        
-        # Loop through columns to find the one that contains the name
-        for col in df.columns:
-            if col.lower().strip() in name_candidates:
-                # We found the name column!
-                # Since df is sorted by Rank, iloc[0] is the top student
-                best_student_name = str(df.iloc[0][col])
-                break
-        # --- FIX ENDS HERE ---
-        # Count Pass Rate based on "ME" (Meeting Expectations) threshold (usually 50)
-        # We can find the threshold dynamically from the scheme if needed, defaulting to 50
-        pass_threshold = 50
-        
-        summary_stats = {
-            "student_count": len(df),
-            "class_mean": round(df['Average'].mean(), 2),
-            "top_student": best_student_name.title(), 
-            "top_score": float(df.iloc[0]['Total']),
-            "pass_rate": round((len(df[df['Average'] >= pass_threshold]) / len(df)) * 100, 1),
-            "best_subject": subject_means.index[0] if not subject_means.empty else "N/A",
-            "worst_subject": subject_means.index[-1] if not subject_means.empty else "N/A"
-        }
-        
-        exam_instance.analysis_summary = summary_stats
-        
-        # --- 6. SAVE EXCEL ---
-        output_io = BytesIO()
-        with pd.ExcelWriter(output_io, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Broadsheet', index=False)
-            
-            sub_analysis = pd.DataFrame({
-                'Mean': subject_means, 
-                'Highest': df[subject_cols].max(),
-                'Lowest': df[subject_cols].min()
-            })
-            sub_analysis.to_excel(writer, sheet_name='Subject Analysis')
-            
-        output_io.seek(0)
-        exam_instance.processed_file.save(f"Analyzed_{exam_instance.title}.xlsx", ContentFile(output_io.read()), save=False)
-
-        # --- 7. CHARTS ---
-        try:
-            sub_means_df = subject_means.reset_index()
-            sub_means_df.columns = ['Subject', 'Mean Score']
-            c1 = subject_performance_chart(sub_means_df)
-            exam_instance.subject_chart.save(f"sub_chart.png", ContentFile(c1.read()), save=False)
+        with timer.stage('summary'):
+            subject_means = df[subject_cols].mean().sort_values(ascending=False)
+            exam_instance.analysis_summary = build_summary(df, subject_means)
+            if batch:
+                streams_table = stream_analysis(df, subject_cols)
+                exam_instance.analysis_summary['streams'] = stream_summaries(streams_table)
 
-            c2 = pass_rate_chart(df)
-            exam_instance.passrate_chart.save(f"pass_chart.png", ContentFile(c2.read()), save=False)
-        except Exception as e:
-            print(f"Chart Error: {e}")
+        # The dashboard numbers are final: publish them before the artifacts are rendered
+        if not rebuild:
+            write_progress(exam_instance, 'summary', len(timer.records), len(plan), summary=exam_instance.analysis_summary)
 
-        # --- 8. PDF REPORTS ---
-        try:
-            # Pass the WHOLE exam_instance so utils can access grading_scheme
-            zip_buffer = generate_student_reports(df, exam_instance)
-            exam_instance.reports_zip.save(f"Reports.zip", ContentFile(zip_buffer.read()), save=False)
-        except Exception as e:
-            print(f"Report Error: {e}")
-            traceback.print_exc() # Print full error to console for debugging
+        # --- 5b. SCORE TABLES (per-student history, per-subject trends) ---
+        with timer.stage('scores') as stage:
+            fingerprints['scores'] = _fingerprint(df, subject_cols, fingerprints['grading'])
+            if incremental and previous.get('scores') == fingerprints['scores']:
+                stage['outcome'] = SKIPPED
+            else:
+                store_scores(exam_instance, df, subject_cols, grading=grading)
+
+        # --- 6-8. ARTIFACTS (workbook, charts, per-stream files, PDF reports) ---
+        # Only the artifacts in the prefetch policy are rendered now; the rest are
+        # built on first download (see analytics/artifacts.py).
+        context = AnalysisContext(df, subject_cols, subject_means, grading, batch)
+        fingerprints.update(artifact_fingerprints(exam_instance, context, fingerprints))
+        prefetch = artifact_prefetch() if prefetch is None else set(prefetch)
+        built = state.get('built', previous)
+        for name in artifact_names(batch):
+            with timer.stage(name) as stage:
+                stage['outcome'] = _artifact_stage(
+                    exam_instance, name, context, fingerprints[name], built, prefetch, incremental,
+                )
 
         # --- 9. FINISH ---
-        exam_instance.status = 'COMPLETED'
-        exam_instance.message = "Analysis completed successfully."
-        exam_instance.save()
+        with timer.stage('save'):
+            _store_profile(exam_instance, profiler)
+            exam_instance.pipeline_state = {
+                'ingest': ingest_report,
+                'subjects': subject_cols,
+                'fingerprints': fingerprints,
+                'built': {name: fp for name, fp in built.items() if fp == fingerprints.get(name)},
+                'stages': timer.outcomes,
+            }
+            if rebuild:
+                exam_instance.save(update_fields=REBUILD_FIELDS)
+            else:
+                exam_instance.status = 'COMPLETED'
+                exam_instance.message = "Analysis completed successfully."
+                exam_instance.progress = {
+                    **progress_payload('done', len(plan), len(plan), summary_ready=True),
+                    'stages': timer.outcomes,  # what a (queued) regrade actually re-ran
+                }
+                exam_instance.save()
+
+        # --- 10. CACHE RESULT (identical re-uploads and retries reuse it) ---
+        try:
+            store_cached_result(exam_instance)
+        except Exception:
+            logger.exception("Result cache error for exam %s", exam_instance.pk)
 
     except Exception as e:
+        if rebuild:
+            raise
+        failed_stage = next((r['stage'] for r in reversed(timer.records) if r['outcome'] == FAILED), None)
+        code = classify_exception(e, failed_stage)
         exam_instance.status = 'FAILED'
-        exam_instance.message = f"Error: {str(e)}"
-        print(f"CRITICAL ERROR: {traceback.format_exc()}")
-        exam_instance.save()
\ No newline at end of file
+        exam_instance.message = failure_message(code, str(e) or type(e).__name__)
+        exam_instance.progress = {**(exam_instance.progress or {}), 'failed': True, 'failure': code}
+        logger.exception("Analysis of exam %s failed [%s]", exam_instance.pk, code)
+        _store_profile(exam_instance, profiler)
+        exam_instance.save()
+
+    # --- 11. RECORD STAGE TIMINGS ---
+    try:
+        timer.save(exam_instance)
+    except Exception:
+        logger.exception("Timing record error for exam %s", exam_instance.pk)
+
+    return timer.outcomes
+
+
+def detect_subject_columns(df, custom_ignore_columns=None):
+    """Numeric columns that are not metadata (ids, names, totals...) are subjects."""
+    roles = classify_columns(df, custom_ignore_columns)
+    if not roles.subjects:
+        raise ValueError(f"No subjects detected. Ignored columns: {[str(c) for c in roles.ignored]}")
+    return roles.subjects
+
+
+def calculate_totals(df, subject_cols, by_stream=False):
+    """
+    Adds Total, Average and Rank, sorted best first. Works on a copy.
+    by_stream=True (batch uploads) also adds each student's Stream Rank.
+    """
+    df = numeric_subjects(df.copy(), subject_cols)
+    df[subject_cols] = df[subject_cols].fillna(0)
+    df['Total'] = df[subject_cols].sum(axis=1)
+    df['Average'] = df['Total'] / len(subject_cols)
+
+    # Ranking (school-wide, then within each stream)
+    df['Rank'] = df['Total'].rank(ascending=False, method='min')
+    if by_stream:
+        df['Stream Rank'] = df.groupby('Stream')['Total'].rank(ascending=False, method='min')
+    return df.sort_values(by='Rank')
+
+
+def apply_grades(df, grades):
+    """Writes Overall Grade and Points into the broadsheet, just before Rank."""
+    for name, values in (('Overall Grade', grades.overall_grade), ('Points', grades.overall_points)):
+        if name in df.columns:
+            df[name] = values
+        else:
+            df.insert(df.columns.get_loc('Rank'), name, values)
+
+
+def build_summary(df, subject_means):
+    """The dashboard numbers stored in ExamUpload.analysis_summary."""
+    # Since df is sorted by Rank, iloc[0] is the top student
+    name_col = find_name_column(df)
+    best_student_name = str(df.iloc[0][name_col]) if name_col else "Unknown"
+
+    # Count Pass Rate based on "ME" (Meeting Expectations) threshold (usually 50)
+    # We can find the threshold dynamically from the scheme if needed, defaulting to 50
+    pass_threshold = 50
+
+    return {
+        "student_count": len(df),
+        "class_mean": round(float(df['Average'].mean()), 2),
+        "top_student": best_student_name.title(),
+        "top_score": float(df.iloc[0]['Total']),
+        "pass_rate": round((len(df[df['Average'] >= pass_threshold]) / len(df)) * 100, 1),
+        "best_subject": subject_means.index[0] if not subject_means.empty else "N/A",
+        "worst_subject": subject_means.index[-1] if not subject_means.empty else "N/A",
+        "grade_distribution": {str(k): int(v) for k, v in df['Overall Grade'].value_counts().items()},
+    }
+
+
+def find_name_column(df):
+    """Smart Name Detection: the column holding the student's name, or None."""
+    return classify_columns(df).name
+
+
+# --- ARTIFACTS ---
+
+# artifact -> the ExamUpload file fields it fills
+ARTIFACT_OUTPUTS = {
+    'excel': ('processed_file',),
+    'charts': ('subject_chart', 'passrate_chart'),
+    'streams': ('stream_artifacts',),
+    'reports': ('reports_zip',),
+}
+
+# A failed chart or PDF render doesn't fail the analysis; a failed workbook does
+SOFT_FAIL_ARTIFACTS = ('charts', 'reports')
+
+
+class AnalysisContext(NamedTuple):
+    """Everything an artifact builder needs: the graded frame and what was derived from it."""
+    df: pd.DataFrame
+    subject_cols: list
+    subject_means: pd.Series
+    grading: object
+    batch: bool
+
+
+def artifact_names(batch):
+    return [name for name in ARTIFACT_OUTPUTS if batch or name != 'streams']
+
+
+def artifact_prefetch():
+    """ARTIFACT_PREFETCH: comma-separated artifact names, 'all' or 'none'."""
+    policy = getattr(settings, 'ARTIFACT_PREFETCH', 'charts')
+    if isinstance(policy, str):
+        policy = [x.strip().lower() for x in policy.split(',') if x.strip()]
+    if 'all' in policy:
+        return set(ARTIFACT_OUTPUTS)
+    return set(policy) & set(ARTIFACT_OUTPUTS)
+
+
+def artifact_fingerprints(exam_instance, context, fingerprints):
+    """Input fingerprints of every artifact (needs the 'grading' and 'detection' ones)."""
+    df = context.df
+    pass_count = int((df['Average'] >= 50).sum())
+    return {
+        'excel': _fingerprint(df, exam_instance.title),
+        # Charts only plot subject means and the pass/fail split, so a grading change never redraws them
+        'charts': _fingerprint(context.subject_means.round(6).to_dict(), pass_count, len(df)),
+        'streams': _fingerprint(df, exam_instance.title),
+        'reports': _fingerprint(
+            df, exam_instance.title, get_school_name(exam_instance),
+            fingerprints['grading'], fingerprints['detection'],
+        ),
+    }
+
+
+def build_artifact(exam_instance, name, context):
+    """Renders one artifact into its ExamUpload file field(s) (not saved to the DB)."""
+    df, subject_cols, subject_means = context.df, context.subject_cols, context.subject_means
+
+    if name == 'excel':
+        sub_analysis = pd.DataFrame({
+            'Mean': subject_means,
+            'Highest': df[subject_cols].max(),
+            'Lowest': df[subject_cols].min()
+        })
+        streams = stream_analysis(df, subject_cols) if context.batch else None
+        sheets = broadsheet_sheets(df, subject_cols, sub_analysis, streams)
+
+        # Streamed straight into a temp file, then handed to storage (never a whole workbook in memory)
+        with TemporaryDirectory() as tmp:
+            path = write_workbook(os.path.join(tmp, 'broadsheet.xlsx'), sheets, context.grading.bands)
+            with open(path, 'rb') as fh:
+                exam_instance.processed_file.save(f"Analyzed_{exam_instance.title}.xlsx", File(fh), save=False)
+
+    elif name == 'charts':
+        sub_means_df = subject_means.reset_index()
+        sub_means_df.columns = ['Subject', 'Mean Score']
+        c1 = subject_performance_chart(sub_means_df)
+        exam_instance.subject_chart.save(f"sub_chart.png", ContentFile(c1.read()), save=False)
+
+        c2 = pass_rate_chart(df)
+        exam_instance.passrate_chart.save(f"pass_chart.png", ContentFile(c2.read()), save=False)
+
+    elif name == 'streams':
+        with build_stream_artifacts(df, subject_cols, context.grading.bands) as streams_zip:
+            exam_instance.stream_artifacts.save("Streams.zip", File(streams_zip, name="Streams.zip"), save=False)
+
+    elif name == 'reports':
+        # Pass the WHOLE exam_instance so utils can access grading_scheme
+        # The ZIP lives in a spooled temp file and is streamed into storage chunk by chunk
+        with generate_student_reports(df, exam_instance, grading=context.grading) as zip_file:
+            exam_instance.reports_zip.save(f"Reports.zip", File(zip_file, name="Reports.zip"), save=False)
+
+    else:
+        raise ValueError(f"Unknown artifact: {name}")
+
+
+def _artifact_stage(exam_instance, name, context, fingerprint, built, prefetch, incremental):
+    """
+    Keeps, renders or defers one artifact; updates `built` ({artifact: fingerprint
+    of the inputs its current file was rendered from}). Returns the stage outcome.
+    """
+    fields = [getattr(exam_instance, f) for f in ARTIFACT_OUTPUTS[name]]
+    if incremental and all(fields) and built.get(name) == fingerprint:
+        return SKIPPED
+
+    if name not in prefetch:
+        # Whatever is stored was rendered from other inputs: drop it, build on first download
+        for field in fields:
+            if field:
+                field.delete(save=False)
+        built.pop(name, None)
+        return DEFERRED
+
+    try:
+        build_artifact(exam_instance, name, context)
+    except Exception:
+        if name not in SOFT_FAIL_ARTIFACTS:
+            raise
+        built.pop(name, None)
+        logger.exception("%s artifact failed for exam %s", name.title(), exam_instance.pk)
+        return RAN
+    built[name] = fingerprint
+    return RAN
+
+
+# --- BATCH (MULTI-STREAM) HELPERS ---
+
+def stream_analysis(df, subject_cols, pass_threshold=50):
+    """
+    One row per stream: size, mean, pass rate, top student and subject means,
+    computed with a single groupby over the whole-school frame.
+    """
+    groups = df.groupby('Stream', sort=True)
+    table = pd.DataFrame({
+        'Students': groups.size(),
+        'Mean': groups['Average'].mean().round(2),
+        'Pass Rate': ((df['Average'] >= pass_threshold).groupby(df['Stream']).mean() * 100).round(1),
+    })
+    name_col = find_name_column(df)
+    # df is sorted by Rank, so each stream's first row is its top student
+    top = groups.head(1).set_index('Stream')
+    table['Top Student'] = top[name_col].astype(str).str.title() if name_col else "Unknown"
+    table['Top Score'] = top['Total'].astype(float)
+    table = table.join(groups[subject_cols].mean().round(2))
+    table.index.name = 'Stream'
+    return table.sort_values('Mean', ascending=False)
+
+
+def stream_summaries(table):
+    """analysis_summary['streams']: the stream table as JSON-safe dicts, best stream first."""
+    subjects = [c for c in table.columns if c not in ('Students', 'Mean', 'Pass Rate', 'Top Student', 'Top Score')]
+    summaries = []
+    for stream, row in table.iterrows():
+        means = row[subjects].astype(float).sort_values(ascending=False)
+        summaries.append({
+            "stream": str(stream),
+            "student_count": int(row['Students']),
+            "class_mean": float(row['Mean']),
+            "pass_rate": float(row['Pass Rate']),
+            "top_student": str(row['Top Student']),
+            "top_score": float(row['Top Score']),
+            "best_subject": str(means.index[0]) if len(means) else "N/A",
+            "worst_subject": str(means.index[-1]) if len(means) else "N/A",
+        })
+    return summaries
+
+
+def build_stream_artifacts(df, subject_cols, bands=()):
+    """
+    Streams.zip: <stream>/Broadsheet.xlsx plus the two charts for every
+    stream. Returns a rewound spooled temp file; close it when done.
+    `bands` colour the scores like the school broadsheet's.
+    """
+    target = SpooledTemporaryFile(max_size=getattr(settings, 'REPORT_SPOOL_MAX_MEMORY', 8 * 1024 * 1024), suffix='.zip')
+    try:
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for stream, rows in df.groupby('Stream', sort=True):
+                folder = safe_filename(stream) or 'Stream'
+
+                with TemporaryDirectory() as tmp:
+                    path = os.path.join(tmp, 'Broadsheet.xlsx')
+                    write_workbook(path, [SheetSpec('Broadsheet', rows, score_columns=subject_cols)], bands)
+                    archive.write(path, f"{folder}/Broadsheet.xlsx")
+
+                try:
+                    means = rows[subject_cols].mean().sort_values(ascending=False).reset_index()
+                    means.columns = ['Subject', 'Mean Score']
+                    archive.writestr(f"{folder}/sub_chart.png", subject_performance_chart(means).read())
+                    archive.writestr(f"{folder}/pass_chart.png", pass_rate_chart(rows).read())
+                except Exception:
+                    logger.exception("Chart error for stream %s", stream)
+    except BaseException:
+        target.close()
+        raise
+    target.seek(0)
+    return target
+
+
+# --- INCREMENTAL RE-GRADE HELPERS ---
+
+def _fingerprint(*parts):
+    """Stable hash of stage inputs. DataFrames are hashed by content, everything else as JSON."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            digest.update(json.dumps([str(c) for c in part.columns]).encode())
+            digest.update(pd.util.hash_pandas_object(part, index=False).to_numpy().tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+# --- PROFILING ---
+
+def _start_profiler(exam_instance):
+    """cProfile for the whole run when staff opted this exam in (or ANALYSIS_PROFILE_ALL is on)."""
+    if not (exam_instance.profile_enabled or getattr(settings, 'ANALYSIS_PROFILE_ALL', False)):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _store_profile(exam_instance, profiler):
+    """Saves the stats in the .prof format pstats.Stats(path) and snakeviz read."""
+    if profiler is None:
+        return
+    profiler.disable()
+    profiler.create_stats()
+    exam_instance.profile_file.save(f"{exam_instance.slug or 'exam'}.prof", ContentFile(marshal.dumps(profiler.stats)), save=False)
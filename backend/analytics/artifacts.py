@@ -0,0 +1,190 @@
+# backend/analytics/artifacts.py
+"""
+On-demand artifacts.
+
+process_exam_file only renders the artifacts named in ARTIFACT_PREFETCH; the
+rest (workbook, per-stream ZIP, PDF report cards) are built from the graded
+snapshot the first time someone downloads them. The download only queues the
+build (an ExamTask, analytics/jobs.py) and answers 202; the analysis workers
+build it, so the web process never forks or waits on a render. One task per
+exam and artifact makes concurrent first downloads build once.
+
+On the worker the build runs in a sandboxed child (analytics/sandbox.py): the
+PDF renderer pool, a huge sheet or a crash stay under the analysis limits. A
+failed build is reported to the next download only; the exam stays COMPLETED.
+"""
+
+import logging
+
+from django.db import transaction
+
+from .analysis import (
+    ARTIFACT_OUTPUTS, AnalysisContext, artifact_prefetch, build_artifact, process_exam_file,
+)
+from .cache import fill_cached_artifacts
+from .grading import compile_grading_scheme
+from .ingest import load_frame
+from .jobs import enqueue_task
+from .models import ExamTask, ExamUpload
+from .sandbox import classify_exception, failure_message, run_sandboxed, sandbox_enabled
+from .utils import student_report_card
+
+logger = logging.getLogger(__name__)
+
+
+# Download key (the ExamUpload file field) -> the artifact that fills it
+FIELD_ARTIFACTS = {field: name for name, fields in ARTIFACT_OUTPUTS.items() for field in fields}
+
+
+class ArtifactUnavailable(Exception):
+    """The exam has no finished analysis to build from."""
+
+
+class ArtifactPending(Exception):
+    """The artifact is queued or being built; ask again shortly."""
+
+
+def artifact_ready(exam, name):
+    """True when the artifact's file(s) exist and were rendered from the current inputs."""
+    if not all(getattr(exam, field) for field in ARTIFACT_OUTPUTS[name]):
+        return False
+    state = exam.pipeline_state or {}
+    if 'built' not in state:
+        # Cache-restored results (and runs from before lazy artifacts) hold current files
+        return True
+    return state['built'].get(name) == state.get('fingerprints', {}).get(name)
+
+
+def ensure_artifact(exam, name):
+    """
+    Returns the exam when `name` is up to date (whatever the exam is doing now:
+    a re-grade in progress doesn't hide files that are still current).
+    Otherwise queues the build for a COMPLETED exam and raises ArtifactPending,
+    or raises ArtifactUnavailable (not finished, or the last build failed).
+    """
+    if name not in ARTIFACT_OUTPUTS:
+        raise ValueError(f"Unknown artifact: {name}")
+    if artifact_ready(exam, name):
+        return exam
+    if exam.status != ExamUpload.Status.COMPLETED:
+        raise ArtifactUnavailable("Analysis is not finished yet.")
+
+    failed = ExamTask.objects.filter(exam=exam, kind=name, status=ExamUpload.Status.FAILED).first()
+    if failed is not None:
+        # Report it once; the next download queues a fresh attempt
+        failed.delete()
+        raise ArtifactUnavailable(failed.message or "The file could not be built; try again.")
+    enqueue_task(exam, name)
+    raise ArtifactPending("The file is being prepared; try again in a moment.")
+
+
+def build_deferred_artifact(exam, name, on_tick=None):
+    """
+    Worker side of ensure_artifact (run by analytics/jobs.py run_task): builds
+    `name` unless it became current or the exam was re-queued meanwhile.
+    Raises ArtifactUnavailable when the build fails.
+    """
+    exam.refresh_from_db()
+    if artifact_ready(exam, name):
+        return
+    if exam.status != ExamUpload.Status.COMPLETED:
+        raise ArtifactUnavailable("Analysis is not finished yet.")
+
+    files = _isolated(_build, exam, name, on_tick=on_tick)
+    if files is None:
+        exam.refresh_from_db()
+        if not artifact_ready(exam, name):
+            raise ArtifactUnavailable("The file could not be built; try again.")
+    else:
+        for field, path in files.items():
+            setattr(exam, field, path)
+        _record_built(exam, name)
+
+    # Identical re-uploads restored from the cache get this artifact too
+    try:
+        fill_cached_artifacts(exam)
+    except Exception:
+        logger.exception("Result cache error while filling exam %s's cached artifacts", exam.pk)
+
+
+def student_report(exam, adm):
+    """One student's report card from the graded snapshot: (filename, pdf_bytes) or None."""
+    return student_report_card(graded_snapshot(exam), exam, adm)
+
+
+def graded_snapshot(exam):
+    """The graded broadsheet frame of a COMPLETED exam (for the CSV/Parquet exports)."""
+    if exam.status != ExamUpload.Status.COMPLETED:
+        raise ArtifactUnavailable("Analysis is not finished yet.")
+    df = load_frame(exam.analysis_data)
+    if df is None:
+        raise ArtifactUnavailable("No graded results stored for this exam.")
+    return df
+
+
+def _build(exam, name):
+    """
+    Child side of build_deferred_artifact. Returns the new file names ({field: name}),
+    or None after a rebuild run, which saves its own fields.
+    """
+    context = _snapshot_context(exam)
+    if context is None:
+        # No graded snapshot (a run from before snapshots): one rebuild run that keeps
+        # what the exam already has and adds this artifact
+        present = {a for a, fields in ARTIFACT_OUTPUTS.items() if all(getattr(exam, f) for f in fields)}
+        process_exam_file(exam, prefetch=artifact_prefetch() | present | {name}, rebuild=True)
+        return None
+    build_artifact(exam, name, context)
+    return {field: getattr(exam, field).name for field in ARTIFACT_OUTPUTS[name]}
+
+
+def _isolated(target, exam, *args, on_tick=None):
+    """target(exam, *args) in a sandboxed child (in-process without the sandbox); failures raise ArtifactUnavailable."""
+    if not sandbox_enabled():
+        try:
+            return target(exam, *args)
+        except Exception as e:
+            logger.exception("Artifact build failed for exam %s", exam.pk)
+            raise ArtifactUnavailable(failure_message(classify_exception(e), str(e) or type(e).__name__))
+    result = run_sandboxed(target, (exam, *args), on_tick=on_tick)
+    if result.code is not None:
+        logger.warning("Artifact build failed for exam %s [%s] %s", exam.pk, result.code, result.detail)
+        raise ArtifactUnavailable(failure_message(result.code, result.detail))
+    return result.value
+
+
+def _snapshot_context(exam):
+    state = exam.pipeline_state or {}
+    df = load_frame(exam.analysis_data)
+    if df is None or not state.get('subjects') or 'built' not in state:
+        return None
+    subject_cols = state['subjects']
+    return AnalysisContext(
+        df=df,
+        subject_cols=subject_cols,
+        subject_means=df[subject_cols].mean().sort_values(ascending=False),
+        grading=compile_grading_scheme(exam.grading_scheme),
+        batch=bool(state.get('ingest', {}).get('streams')),
+    )
+
+
+def _record_built(exam, name):
+    """
+    Saves the new file field(s) and marks the artifact built, unless a re-grade
+    changed its inputs in the meantime (then the file is dropped again).
+    """
+    fields = ARTIFACT_OUTPUTS[name]
+    with transaction.atomic():
+        current = ExamUpload.objects.select_for_update().get(pk=exam.pk)
+        state = current.pipeline_state or {}
+        fingerprint = exam.pipeline_state['fingerprints'].get(name)
+        if state.get('fingerprints', {}).get(name) != fingerprint:
+            for field in fields:
+                getattr(exam, field).delete(save=False)
+            raise ArtifactUnavailable("The exam was re-graded while the file was being built; try again.")
+        state.setdefault('built', {})[name] = fingerprint
+        for field in fields:
+            setattr(current, field, getattr(exam, field).name)
+        current.pipeline_state = state
+        current.save(update_fields=[*fields, 'pipeline_state', 'updated_at'])
+    exam.pipeline_state = state
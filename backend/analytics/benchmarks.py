@@ -0,0 +1,331 @@
+# backend/analytics/benchmarks.py
+"""
+Synthetic exam data for benchmarks (see the `benchmark_*` management commands).
+Nothing here touches the database or media storage.
+"""
+
+from io import BytesIO
+from types import SimpleNamespace
+
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+import numpy as np
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from .models import default_grading_scheme
+
+plt.switch_backend('Agg')  # only the pyplot reference charts below use pyplot
+
+SUBJECTS = [
+    'Mathematics', 'English', 'Kiswahili', 'Integrated Science', 'Social Studies',
+    'Pre-Technical Studies', 'Agriculture', 'Creative Arts', 'CRE', 'Business Studies',
+    'Computer Science', 'French', 'German', 'Music', 'Home Science', 'Physical Education',
+]
+
+
+def synthetic_scores(students=500, subjects=10, seed=42):
+    """Raw upload-shaped sheet: Adm No, Name, Stream + one integer score column per subject."""
+    rng = np.random.default_rng(seed)
+    names = [SUBJECTS[i % len(SUBJECTS)] + ('' if i < len(SUBJECTS) else f' {i // len(SUBJECTS) + 1}')
+             for i in range(subjects)]
+    # Per-student ability plus per-subject noise gives realistic spreads and ties
+    ability = rng.normal(58, 14, size=(students, 1))
+    scores = np.clip(np.rint(ability + rng.normal(0, 10, size=(students, subjects))), 0, 100).astype(int)
+
+    df = pd.DataFrame(scores, columns=names)
+    df.insert(0, 'Stream', rng.choice(['East', 'West', 'North', 'South'], size=students))
+    df.insert(0, 'Name', [f'Student {i:05d}' for i in range(students)])
+    df.insert(0, 'Adm No', np.arange(1000, 1000 + students))
+    return df
+
+
+def messy_scores(students=500, subjects=10, seed=42, missing=0.03):
+    """
+    What schools actually upload: padded and oddly cased headers, numeric
+    metadata columns that must not be graded (phone, KCPE, UPI) and blank
+    cells for absent students.
+    """
+    rng = np.random.default_rng(seed + 1)
+    df = synthetic_scores(students, subjects, seed)
+    subject_cols = list(df.columns[3:])
+
+    scores = df[subject_cols].astype(float)
+    scores = scores.mask(rng.random(scores.shape) < missing)
+    df[subject_cols] = scores
+
+    df.insert(3, 'KCPE Marks', rng.integers(200, 450, size=students))
+    df.insert(3, 'Phone', rng.integers(700000000, 799999999, size=students))
+    df['UPI Number'] = rng.integers(10 ** 6, 10 ** 7, size=students)
+
+    styles = [str.upper, str.lower, str.title, lambda h: f'  {h} ', lambda h: f'{h}\t']
+    df.columns = [styles[i % len(styles)](c) if c in subject_cols else c for i, c in enumerate(df.columns)]
+    return df
+
+
+def sheet_bytes(df, fmt='csv'):
+    """Serializes a frame the way a teacher would upload it: 'csv' or 'xlsx'."""
+    if fmt == 'csv':
+        return df.to_csv(index=False).encode()
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, engine='openpyxl')
+    return buffer.getvalue()
+
+
+def graded_frame(students=500, subjects=10, seed=42):
+    """The frame generate_student_reports receives: scores plus Total/Average/Overall Grade/Rank."""
+    from .grading import compile_grading_scheme
+
+    df = synthetic_scores(students, subjects, seed)
+    subject_cols = list(df.columns[3:])
+    df['Total'] = df[subject_cols].sum(axis=1)
+    df['Average'] = df['Total'] / len(subject_cols)
+    grades = compile_grading_scheme(default_grading_scheme()).grade_exam(df['Average'], df[subject_cols])
+    df['Overall Grade'] = grades.overall_grade
+    df['Points'] = grades.overall_points
+    df['Rank'] = df['Total'].rank(ascending=False, method='min')
+    return df.sort_values(by='Rank')
+
+
+def fake_exam(title='Benchmark Exam'):
+    """Just enough of an ExamUpload for the report/grading code paths."""
+    return SimpleNamespace(
+        title=title,
+        grading_scheme=default_grading_scheme(),
+        custom_ignore_columns='',
+        uploaded_by=None,
+    )
+
+
+# --- BASELINES ---
+
+def compare_results(baseline, current, threshold=0.25, min_seconds=0.05, min_rss_bytes=32 * 1024 ** 2):
+    """
+    Stage-by-stage regressions of `current` against `baseline` (both in the
+    benchmark_pipeline JSON layout). A stage regresses when it is more than
+    `threshold` slower AND at least `min_seconds` slower, so sub-millisecond
+    noise never fails a run; peak RSS works the same way with `min_rss_bytes`.
+    Returns a list of human-readable regression lines.
+    """
+    regressions = []
+    for scenario, result in current.get('scenarios', {}).items():
+        base = baseline.get('scenarios', {}).get(scenario)
+        if not base:
+            continue
+        for stage, now in result['stages'].items():
+            before = base['stages'].get(stage)
+            if not before:
+                continue
+            slower = now['wall_seconds'] - before['wall_seconds']
+            if slower > min_seconds and now['wall_seconds'] > before['wall_seconds'] * (1 + threshold):
+                regressions.append(
+                    f"{scenario} {stage}: {before['wall_seconds']:.3f}s -> {now['wall_seconds']:.3f}s"
+                )
+            grown = now['peak_rss_bytes'] - before['peak_rss_bytes']
+            if grown > min_rss_bytes and now['peak_rss_bytes'] > before['peak_rss_bytes'] * (1 + threshold):
+                regressions.append(
+                    f"{scenario} {stage} peak RSS: {before['peak_rss_bytes'] / 1e6:.0f}MB -> {now['peak_rss_bytes'] / 1e6:.0f}MB"
+                )
+    return regressions
+
+
+# --- PYPLOT CHARTS (the pre-ChartEngine visualizer, kept as the benchmark reference) ---
+
+def pyplot_subject_performance_chart(subject_means_df):
+    """
+    Horizontal Bar Chart: Subject vs Mean Score
+    """
+    data = subject_means_df.sort_values('Mean Score', ascending=True)
+    
+    plt.figure(figsize=(10, 6))
+    
+    # Modern color palette
+    colors = ['#e74c3c' if x < 50 else '#2ecc71' for x in data['Mean Score']]
+    
+    bars = plt.barh(data['Subject'], data['Mean Score'], color=colors, alpha=0.8)
+    
+    plt.title('Subject Performance Analysis', fontsize=14, pad=20)
+    plt.xlabel('Mean Score', fontsize=12)
+    plt.xlim(0, 100)
+    
+    # Add values to the end of bars
+    for bar in bars:
+        width = bar.get_width()
+        plt.text(width + 1, bar.get_y() + bar.get_height()/2, 
+                 f'{width:.1f}', va='center', fontsize=10)
+
+    plt.tight_layout()
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format='png', dpi=100)
+    img_buffer.seek(0)
+    plt.close()
+    return img_buffer
+
+def pyplot_pass_rate_chart(df):
+    """
+    Donut Chart: Pass vs Fail
+    """
+    pass_count = len(df[df['Average'] >= 50])
+    fail_count = len(df[df['Average'] < 50])
+    
+    plt.figure(figsize=(6, 6))
+    
+    # Donut chart style
+    wedges, texts, autotexts = plt.pie(
+        [pass_count, fail_count],
+        labels=['Pass (>=50)', 'Fail (<50)'],
+        autopct='%1.1f%%',
+        startangle=90,
+        colors=['#3498db', '#e67e22'],
+        pctdistance=0.85,
+        explode=(0.05, 0)
+    )
+    
+    # Draw circle for donut effect
+    centre_circle = plt.Circle((0,0), 0.70, fc='white')
+    fig = plt.gcf()
+    fig.gca().add_artist(centre_circle)
+    
+    plt.title('Class Pass Rate', fontsize=14)
+    plt.tight_layout()
+    
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format='png', dpi=100)
+    img_buffer.seek(0)
+    plt.close()
+    return img_buffer
+
+def pyplot_grade_distribution_chart(df):
+    """
+    New Chart: Shows count of A, B, C, etc.
+    This is CRITICAL for Kenyan Exam Analysis.
+    """
+    # Order of grades
+    grade_order = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'D-', 'E']
+    
+    # Count grades
+    grade_counts = df['Overall Grade'].value_counts().reindex(grade_order, fill_value=0)
+    
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x=grade_counts.index, y=grade_counts.values, palette="viridis")
+    
+    plt.title('Grade Distribution', fontsize=14)
+    plt.ylabel('Number of Students')
+    plt.xlabel('Grade')
+    
+    img_buffer = BytesIO()
+    plt.savefig(img_buffer, format='png', dpi=100)
+    img_buffer.seek(0)
+    plt.close()
+    return img_buffer
+
+
+# --- CANVAS REPORT CARDS (the pre-template renderer, kept as the benchmark reference) ---
+
+def canvas_report_card(header, student):
+    """Draws one student's whole report card from scratch. Returns (filename, pdf_bytes)."""
+    school_name, exam_title, subject_cols, class_size = header
+    (student_name, adm, rank, total_score, avg_score, overall_grade,
+     scores, subject_grades, subject_remarks) = student
+
+    pdf_buffer = BytesIO()
+    p = canvas.Canvas(pdf_buffer, pagesize=A4)
+    width, height = A4
+
+    # --- HEADER ---
+    p.setFont("Helvetica-Bold", 18)
+    p.drawCentredString(width / 2, height - 50, school_name) 
+
+    p.setFont("Helvetica-Bold", 12)
+    p.drawCentredString(width / 2, height - 75, "COMPETENCY BASED ASSESSMENT")
+    p.drawCentredString(width / 2, height - 95, exam_title)
+
+    p.setLineWidth(2)
+    p.line(30, height - 105, width - 30, height - 105)
+
+    # --- STUDENT DETAILS ---
+    p.setFont("Helvetica-Bold", 11)
+    p.drawString(50, height - 140, f"NAME: {student_name}")
+    p.drawString(50, height - 160, f"ADM NO: {adm}")
+
+    p.drawString(350, height - 140, f"POSITION: {rank} / {class_size}")
+    p.drawString(350, height - 160, f"PERFORMANCE: {overall_grade}")
+
+    # --- RESULTS TABLE ---
+    y = height - 200
+
+    # Table Headers
+    p.setFillColor(colors.lightgrey)
+    p.rect(50, y-5, 500, 20, fill=True, stroke=False)
+    p.setFillColor(colors.black)
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(60, y, "SUBJECT")
+    p.drawString(250, y, "SCORE")
+    p.drawString(330, y, "LEVEL")
+    p.drawString(400, y, "REMARK")
+
+    y -= 25
+    p.setFont("Helvetica", 10)
+
+    for subject, score, grade, remark in zip(subject_cols, scores, subject_grades, subject_remarks):
+        p.drawString(60, y, subject.title())
+        p.drawString(250, y, f"{score:.0f}") 
+        p.drawString(330, y, grade)
+        p.drawString(400, y, remark)
+
+        p.setLineWidth(0.5)
+        p.setStrokeColor(colors.lightgrey)
+        p.line(50, y-5, 550, y-5)
+        y -= 20
+
+    # --- FOOTER SUMMARY ---
+    y -= 30
+    p.setStrokeColor(colors.black)
+    p.setLineWidth(1)
+    p.rect(50, y-40, 500, 40)
+    p.setFont("Helvetica-Bold", 12)
+
+    p.drawString(60, y-25, f"TOTAL: {total_score:.0f}")
+    p.drawString(200, y-25, f"AVERAGE: {avg_score:.2f}")
+    p.drawString(400, y-25, f"LEVEL: {overall_grade}")
+
+    p.setFont("Helvetica-Oblique", 8)
+    p.drawCentredString(width/2, 30, "Generated by School Analytics System")
+
+    p.showPage()
+    p.save()
+
+    clean_name = "".join([c for c in student_name if c.isalnum() or c==' ']).strip()
+    return f"{rank}_{clean_name}.pdf", pdf_buffer.getvalue()
+
+
+# --- ITERROWS PAYLOADS (the pre-columnar report card inputs, kept as the benchmark reference) ---
+
+def iterrows_payloads(df, adm_col_name, score_matrix, subject_grades, subject_remarks):
+    """Yields the report card payloads the way report_card_inputs used to: one boxed row at a time."""
+    for pos, (index, row) in enumerate(df.iterrows()):
+        student_name = str(row.get('Name', row.get('name', f'Student {index+1}'))).upper()
+        rank = int(row.get('Rank', 0))
+
+        # Safely get totals/averages
+        try: total_score = float(row.get('Total', 0))
+        except: total_score = 0.0
+
+        try: avg_score = float(row.get('Average', 0))
+        except: avg_score = 0.0
+
+        # --- USE DETECTED ADMISSION COLUMN ---
+        if adm_col_name:
+            raw_adm = row.get(adm_col_name, "N/A")
+            # Remove decimals (e.g., 4344.0 -> 4344)
+            adm = str(raw_adm).split('.')[0]
+        else:
+            adm = "N/A"
+
+        yield (
+            student_name, adm, rank, total_score, avg_score, row.get('Overall Grade', '-'),
+            tuple(score_matrix[pos]), tuple(subject_grades[pos]), tuple(subject_remarks[pos]),
+        )
@@ -0,0 +1,283 @@
+# backend/analytics/cache.py
+"""
+Content-addressed result cache.
+
+An analysis is fully determined by the uploaded bytes plus the settings that
+shape its output. Hash those, and an identical re-upload (or a retry of a
+finished job) can copy the stored artifacts instead of re-running the pipeline.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .ingest import file_fingerprint, load_frame
+from .instrumentation import progress_payload
+from .jobs import SCORES_TASK, enqueue_task
+from .models import ExamUpload, ResultCacheEntry, ResultCacheStats
+from .scores import store_scores
+from .storage import ContentAddressedStorage, is_content_addressed
+from .utils import get_school_name
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pipeline output changes, so stale artifacts are never served
+CACHE_VERSION = 5
+
+ARTIFACT_FIELDS = ('processed_file', 'subject_chart', 'passrate_chart', 'reports_zip', 'stream_artifacts')
+
+
+def artifact_filename(exam, field):
+    """The file names process_exam_file gives each artifact (and downloads are saved as)."""
+    return {
+        'processed_file': f"Analyzed_{exam.title}.xlsx",
+        'subject_chart': "sub_chart.png",
+        'passrate_chart': "pass_chart.png",
+        'reports_zip': "Reports.zip",
+        'stream_artifacts': "Streams.zip",
+    }[field]
+
+
+def normalize_ignore_columns(value):
+    """'UPI, Nemis , upi' -> ['nemis', 'upi'] (order and case don't change the analysis)."""
+    return sorted({x.strip().lower() for x in (value or '').split(',') if x.strip()})
+
+
+def result_cache_key(exam):
+    """sha256 over the file bytes and every setting that shapes the artifacts."""
+    digest = hashlib.sha256()
+    with exam.file.open('rb') as fh:
+        for chunk in fh.chunks():
+            digest.update(chunk)
+
+    settings_blob = json.dumps({
+        'version': CACHE_VERSION,
+        'grading_scheme': exam.grading_scheme,
+        'ignore': normalize_ignore_columns(exam.custom_ignore_columns),
+        'sheets_as_streams': exam.sheets_as_streams,
+        'school': get_school_name(exam),
+        # The title is printed on every report card and names the workbook
+        'title': exam.title,
+        'class_pdf': getattr(settings, 'REPORT_CLASS_PDF', False),
+    }, sort_keys=True, separators=(',', ':'))
+    digest.update(settings_blob.encode())
+    return digest.hexdigest()
+
+
+def _count(field, amount=1):
+    ResultCacheStats.objects.get_or_create(pk=1)
+    ResultCacheStats.objects.filter(pk=1).update(**{field: F(field) + amount})
+
+
+def _copy_artifacts(source, target, names_from):
+    for field in ARTIFACT_FIELDS:
+        src = getattr(source, field)
+        if src:
+            _share_file(src, getattr(target, field), artifact_filename(names_from, field))
+
+
+def _share_file(src, dest, filename):
+    """
+    Points dest at src's blob when both are content-addressed (no copy); otherwise
+    copies the bytes. Raises OSError when src is gone from storage.
+    """
+    if is_content_addressed(src.name) and isinstance(dest.storage, ContentAddressedStorage):
+        if not src.storage.exists(src.name):
+            raise FileNotFoundError(src.name)
+        dest.name = src.name
+        return
+    with src.open('rb') as fh:
+        dest.save(filename, File(fh), save=False)
+
+
+def _entry_size(entry):
+    files = [getattr(entry, f) for f in (*ARTIFACT_FIELDS, 'analysis_data')]
+    return sum(f.size for f in files if f)
+
+
+def _restore_snapshot(entry, exam):
+    """
+    Gives a cache hit the entry's graded snapshot and stage fingerprints, so the
+    artifacts the entry doesn't hold are built from the snapshot on first
+    download (analytics/artifacts.py) instead of re-running the pipeline, and
+    the score tables are filled from it (restore_scores).
+    """
+    from .analysis import ARTIFACT_OUTPUTS
+
+    state = entry.pipeline_state or {}
+    if not entry.analysis_data:
+        return
+    suffix = os.path.splitext(entry.analysis_data.name)[1]
+    _share_file(entry.analysis_data, exam.analysis_data, f"analysis{suffix}")
+    if not state.get('fingerprints'):
+        # An entry from before stage fingerprints: the snapshot only feeds the score tables
+        exam.pipeline_state = {'subjects': entry.subjects} if entry.subjects else {}
+        return
+    # Same bytes, but the read fingerprint names the upload (parsed_data is not carried over)
+    fingerprints = {**state['fingerprints'], 'read': file_fingerprint(exam.file)}
+    exam.pipeline_state = {
+        **state,
+        'fingerprints': fingerprints,
+        'built': {
+            name: fingerprints.get(name)
+            for name, fields in ARTIFACT_OUTPUTS.items() if all(getattr(exam, f) for f in fields)
+        },
+    }
+
+
+def restore_scores(exam):
+    """
+    Fills the score tables of a cache hit from the graded snapshot it was given.
+    Runs on a worker (an ExamTask queued by restore_cached_result); raises
+    ValueError when the snapshot can't be read.
+    """
+    subjects = (exam.pipeline_state or {}).get('subjects')
+    if exam.status != ExamUpload.Status.COMPLETED or not (exam.analysis_data and subjects):
+        return
+    df = load_frame(exam.analysis_data)
+    if df is None:
+        raise ValueError(f"The graded snapshot {exam.analysis_data.name} is unreadable.")
+    store_scores(exam, df, subjects)
+
+
+def restore_cached_result(exam, key=None, count_miss=True, defer_scores=False):
+    """
+    On a hit, copies the cached artifacts and summary onto `exam`, marks it
+    COMPLETED and returns True. On a miss, returns False and changes nothing.
+    The score tables are filled here too, or with defer_scores (the upload
+    request) by a worker, so the request never writes a whole class's scores.
+    """
+    if not getattr(settings, 'RESULT_CACHE_ENABLED', True):
+        return False
+    key = key or result_cache_key(exam)
+    entry = ResultCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        if count_miss:
+            _count('misses')
+        return False
+
+    try:
+        _copy_artifacts(entry, exam, names_from=exam)
+    except (OSError, ValueError):
+        # Artifacts vanished from storage: drop the entry and recompute
+        logger.exception("Result cache entry %s is unreadable, evicting it", key)
+        entry.delete()
+        _count('misses')
+        return False
+
+    try:
+        _restore_snapshot(entry, exam)
+    except (OSError, ValueError):
+        # Artifacts still restore; missing ones are then built with a full run
+        logger.exception("Result cache entry %s has an unreadable snapshot", key)
+        exam.pipeline_state = {}
+
+    exam.analysis_summary = entry.analysis_summary
+    exam.status = ExamUpload.Status.COMPLETED
+    exam.message = "Analysis completed successfully (cached result)."
+    exam.progress = progress_payload('done', 1, 1, summary_ready=True)
+    exam.finished_at = timezone.now()
+    exam.save()
+
+    if defer_scores:
+        enqueue_task(exam, SCORES_TASK)
+    else:
+        try:
+            restore_scores(exam)
+        except Exception:
+            logger.exception("Score storage error for exam %s", exam.pk)
+
+    ResultCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    _count('hits')
+    return True
+
+
+def store_cached_result(exam, key=None):
+    """Copies a COMPLETED exam's artifacts into the cache, then evicts down to the size limit."""
+    if not getattr(settings, 'RESULT_CACHE_ENABLED', True) or exam.status != ExamUpload.Status.COMPLETED:
+        return None
+    key = key or result_cache_key(exam)
+    if ResultCacheEntry.objects.filter(key=key).exists():
+        return None
+
+    entry = ResultCacheEntry(key=key, analysis_summary=exam.analysis_summary)
+    _copy_artifacts(exam, entry, names_from=exam)
+    if exam.analysis_data:
+        # Keep the suffix: load_frame picks the reader by it (pickle fallback of save_frame)
+        suffix = os.path.splitext(exam.analysis_data.name)[1]
+        with exam.analysis_data.open('rb') as fh:
+            entry.analysis_data.save(f"analysis{suffix}", File(fh), save=False)
+        state = exam.pipeline_state or {}
+        entry.subjects = state.get('subjects', [])
+        entry.pipeline_state = {k: state[k] for k in ('ingest', 'subjects', 'fingerprints') if k in state}
+    entry.size_bytes = _entry_size(entry)
+    try:
+        with transaction.atomic():
+            entry.save()
+    except IntegrityError:
+        # Another worker cached the same result first; drop our copies
+        for field in ARTIFACT_FIELDS:
+            if getattr(entry, field):
+                getattr(entry, field).delete(save=False)
+        if entry.analysis_data:
+            entry.analysis_data.delete(save=False)
+        return None
+
+    evict_cache()
+    return entry
+
+
+def fill_cached_artifacts(exam, key=None):
+    """Adds artifacts built on demand (see analytics/artifacts.py) to the exam's existing cache entry."""
+    if not getattr(settings, 'RESULT_CACHE_ENABLED', True) or exam.status != ExamUpload.Status.COMPLETED:
+        return None
+    key = key or result_cache_key(exam)
+    entry = ResultCacheEntry.objects.filter(key=key).first()
+    if entry is None:
+        return None
+
+    missing = [f for f in ARTIFACT_FIELDS if getattr(exam, f) and not getattr(entry, f)]
+    for field in missing:
+        _share_file(getattr(exam, field), getattr(entry, field), artifact_filename(exam, field))
+    if missing:
+        entry.size_bytes = _entry_size(entry)
+        entry.save(update_fields=[*missing, 'size_bytes'])
+    return entry
+
+
+def evict_cache(max_bytes=None):
+    """Size-based LRU: deletes least recently used entries until the total fits. Returns the count."""
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+    total = ResultCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    evicted = 0
+    for entry in ResultCacheEntry.objects.order_by('last_used_at').iterator():
+        if total <= max_bytes:
+            break
+        total -= entry.size_bytes
+        entry.delete()  # django_cleanup removes the files (shared blobs: the GC sweep)
+        evicted += 1
+    if evicted:
+        _count('evictions', evicted)
+    return evicted
+
+
+def cache_stats():
+    stats = ResultCacheStats.objects.filter(pk=1).first() or ResultCacheStats()
+    usage = ResultCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+    return {
+        "hits": stats.hits,
+        "misses": stats.misses,
+        "evictions": stats.evictions,
+        "hit_rate": stats.hit_rate,
+        "entries": ResultCacheEntry.objects.count(),
+        "size_bytes": usage,
+        "max_bytes": getattr(settings, 'RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3),
+    }
@@ -0,0 +1,188 @@
+# backend/analytics/columns.py
+"""
+Column classification.
+
+One engine decides what every column of a sheet is, for the analysis pipeline
+and the report cards alike: the admission column, the name and UPI columns,
+metadata (ids, phones, totals, ranks, grades...) and the subjects.
+
+- Headers are split into lower-case words ("AdmNo", "adm_no", "ADM NO." ->
+  adm no), and the metadata vocabulary plus the exam's custom_ignore_columns
+  are compiled into ONE regex per ignore list, so a header is classified with
+  a single search. Matching whole words (or word stems like adm*, total*)
+  keeps subjects such as "English Composition" from being dropped for
+  containing "pos".
+- A column is numeric when its dtype is, or, for text columns, when most of a
+  sample of at most SAMPLE_ROWS evenly spaced values parse as numbers; whole
+  columns are never converted just to be classified.
+- What the headers decide (the roles and the metadata columns) is cached
+  (Django cache) by header signature: column names, dtype kinds and the
+  ignore list. Schools re-uploading the same template skip the header scan;
+  only the numeric check of the remaining columns runs again, since it
+  depends on the values. The 'columns' cache is shared (a database table, or
+  Redis): entries written by a forked analysis child outlive it and are seen
+  by every process.
+"""
+
+import hashlib
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+
+# Bump when the rules change: cached classifications of older rules are ignored
+ENGINE_VERSION = 3
+SAMPLE_ROWS = 200
+NUMERIC_SHARE = 0.5
+
+# Header words that mark a column as metadata. Stems match any word they start
+# ('adm' -> admission, admno), words only themselves ('pos' is not 'postal').
+METADATA_STEMS = (
+    'adm', 'index', 'name', 'student', 'phone', 'stream', 'total', 'rank', 'position',
+    'dev', 'grade', 'point', 'kcpe', 'upi', 'number', 'comment', 'remark',
+)
+METADATA_WORDS = ('id', 'no', 'pos', 'gender', 'sex', 'sum', 'average', 'avg', 'mean', 'stdev')
+
+NAME_HEADERS = ('name', 'student', 'student name', 'names', 'full name')
+
+# Admission column: the first strong clue wins, weak clues only when there is none
+ADM_STRONG = re.compile(r'adm|reg|upi')
+ADM_WEAK = re.compile(r'index|student id|unique')
+
+_WORDS = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+class ColumnRoles(NamedTuple):
+    subjects: list
+    adm: object
+    name: object
+    upi: object
+    ignored: list
+
+
+def header_words(header):
+    """'AdmNo' / 'ADM_NO.' / ' adm no ' -> 'adm no' (what the metadata regex runs on)."""
+    return ' '.join(word.lower() for word in _WORDS.findall(str(header)))
+
+
+def ignore_list(custom_ignore_columns):
+    """'UPI, Nemis No,' -> ('upi', 'nemis no'): lower-cased, blanks dropped."""
+    if not custom_ignore_columns:
+        return ()
+    return tuple(sorted({x.strip().lower() for x in custom_ignore_columns.split(',') if x.strip()}))
+
+
+@lru_cache(maxsize=256)
+def metadata_matcher(ignored=()):
+    """
+    The compiled metadata regex for an ignore list. It runs on
+    "<header words>|<raw lower-cased header>": the vocabulary matches words,
+    the custom entries match anywhere in the header (as they always have).
+    """
+    parts = [
+        rf"\b(?:{'|'.join(METADATA_STEMS)})\w*",
+        rf"\b(?:{'|'.join(METADATA_WORDS)})\b",
+    ]
+    parts.extend(re.escape(item) for item in ignored)
+    return re.compile('|'.join(parts))
+
+
+def is_metadata(header, ignored=()):
+    raw = str(header).lower().strip()
+    return metadata_matcher(ignored).search(f"{header_words(header)}|{raw}") is not None
+
+
+def identity_columns(headers):
+    """
+    The admission, UPI, name and stream columns, from the headers alone (the
+    CSV reader types them as text before reading a single row).
+    """
+    found = []
+    for col in headers:
+        lower = str(col).lower()
+        words = set(header_words(col).split())
+        if ADM_STRONG.search(lower) or ADM_WEAK.search(lower) or lower.strip() in NAME_HEADERS or words & {'upi', 'stream'}:
+            found.append(col)
+    return found
+
+
+def looks_numeric(series):
+    """Numeric dtype, or a text column whose sampled values mostly parse as numbers."""
+    if pd.api.types.is_bool_dtype(series):
+        return False
+    if pd.api.types.is_numeric_dtype(series):
+        return True
+    if not (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)):
+        return False
+    step = max(len(series) // SAMPLE_ROWS, 1)
+    sample = series.iloc[::step].iloc[:SAMPLE_ROWS].dropna()
+    if sample.empty:
+        return False
+    return pd.to_numeric(sample, errors='coerce').notna().mean() >= NUMERIC_SHARE
+
+
+def header_signature(df, ignored=()):
+    parts = [str(ENGINE_VERSION), '|'.join(ignored)]
+    parts.extend(f"{col!r}:{dtype.kind}" for col, dtype in df.dtypes.items())
+    return hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+
+
+def _classify(columns, ignored):
+    """Column positions from the headers alone: (candidate subjects, adm, name, upi, ignored)."""
+    candidates, skipped = [], []
+    adm_strong = adm_weak = name = upi = None
+    for pos, col in enumerate(columns):
+        lower = str(col).lower()
+        if adm_strong is None and ADM_STRONG.search(lower):
+            adm_strong = pos
+        elif adm_weak is None and ADM_WEAK.search(lower):
+            adm_weak = pos
+        if name is None and lower.strip() in NAME_HEADERS:
+            name = pos
+        if upi is None and 'upi' in header_words(col).split():
+            upi = pos
+
+        if is_metadata(col, ignored):
+            skipped.append(pos)
+        else:
+            candidates.append(pos)
+    adm = adm_strong if adm_strong is not None else adm_weak
+    return candidates, adm, name, upi, skipped
+
+
+def classify_columns(df, custom_ignore_columns=None):
+    """
+    The ColumnRoles of a frame: the header scan comes from the cache when the
+    header was seen before; the subjects are the non-metadata columns that
+    look numeric in this frame.
+    """
+    ignored = ignore_list(custom_ignore_columns)
+    key = f"columns:{header_signature(df, ignored)}"
+    cache = caches['columns']
+    positions = cache.get(key)
+    if positions is None:
+        positions = _classify(df.columns, ignored)
+        cache.set(key, positions, getattr(settings, 'COLUMN_CACHE_TIMEOUT', 90 * 24 * 3600))
+
+    candidates, adm, name, upi, skipped = positions
+    subjects = [pos for pos in candidates if looks_numeric(df.iloc[:, pos])]
+    columns = df.columns
+    return ColumnRoles(
+        subjects=[columns[pos] for pos in subjects],
+        adm=columns[adm] if adm is not None else None,
+        name=columns[name] if name is not None else None,
+        upi=columns[upi] if upi is not None else None,
+        ignored=[columns[pos] for pos in skipped],
+    )
+
+
+def numeric_subjects(df, subject_cols):
+    """The frame with its text subject columns parsed as numbers (unreadable cells become NaN)."""
+    text = [col for col in subject_cols if not pd.api.types.is_numeric_dtype(df[col])]
+    if text:
+        df[text] = df[text].apply(pd.to_numeric, errors='coerce').astype(np.float64)
+    return df
@@ -0,0 +1,196 @@
+# backend/analytics/events.py
+"""
+Live progress over server-sent events.
+
+Analysis workers (separate processes) announce changes with publish(exam_id):
+a Postgres NOTIFY carrying only the id. Each ASGI process runs one ProgressHub
+per event loop that LISTENs on a single connection, re-reads the changed rows
+in one query and fans the snapshots out to the open streams. An idle stream is
+a queue and a suspended coroutine: no thread, no DB connection, no polling.
+
+SQLite has no NOTIFY: there the hub re-reads every watched row once per
+PROGRESS_POLL_INTERVAL instead (still one query for all streams). On Postgres
+the same sweep runs every PROGRESS_RESYNC_INTERVAL to catch transitions made
+with .update() (e.g. the stale-job reaper), which send no notification.
+"""
+
+import asyncio
+import json
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .instrumentation import progress_snapshot
+from .models import ExamUpload
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'exam_progress'
+
+# Statuses after which a stream has nothing left to say
+FINAL_STATUSES = (ExamUpload.Status.COMPLETED, ExamUpload.Status.FAILED)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _has_notify():
+    return connection.vendor == 'postgresql'
+
+
+# --- 1. PUBLISHING (workers, sync) ---
+
+def publish(exam_id):
+    """Tells every ASGI process that the exam's progress row changed. Never raises."""
+    if not _has_notify():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, str(exam_id)])
+    except Exception:
+        logger.exception("Progress notify failed for exam %s", exam_id)
+
+
+# --- 2. FAN-OUT (ASGI processes, async) ---
+
+def _snapshots(exam_ids):
+    rows = ExamUpload.objects.filter(id__in=exam_ids).only('id', 'status', 'message', 'progress', 'analysis_summary')
+    return {str(exam.id): progress_snapshot(exam) for exam in rows}
+
+
+class ProgressHub:
+    """Subscribers per exam id, fed by one listener task for the whole event loop."""
+
+    def __init__(self):
+        self.subscribers = {}  # exam id -> set of asyncio.Queue
+        self.last = {}         # exam id -> last snapshot sent (JSON), to drop no-op updates
+        self.task = None
+
+    def subscribe(self, exam_id, snapshot):
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(exam_id, set()).add(queue)
+        self.last.setdefault(exam_id, _encode(snapshot))
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return queue
+
+    def unsubscribe(self, exam_id, queue):
+        queues = self.subscribers.get(exam_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[exam_id]
+            self.last.pop(exam_id, None)
+
+    async def refresh(self, exam_ids):
+        """Re-reads the rows and pushes the snapshots that changed."""
+        exam_ids = [i for i in exam_ids if i in self.subscribers]
+        if not exam_ids:
+            return
+        for exam_id, snapshot in (await sync_to_async(_snapshots)(exam_ids)).items():
+            encoded = _encode(snapshot)
+            if self.last.get(exam_id) == encoded:
+                continue
+            self.last[exam_id] = encoded
+            for queue in self.subscribers.get(exam_id, ()):
+                queue.put_nowait(snapshot)
+
+    async def _run(self):
+        listener = None
+        try:
+            if _has_notify():
+                listener = await _listen()
+            while self.subscribers:
+                if listener is None:
+                    await asyncio.sleep(_setting('PROGRESS_POLL_INTERVAL', 1.0))
+                    changed = list(self.subscribers)
+                else:
+                    changed = await _drain(listener, _setting('PROGRESS_RESYNC_INTERVAL', 30.0))
+                    changed = changed if changed is not None else list(self.subscribers)
+                await self.refresh(changed)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Progress hub stopped")
+        finally:
+            if listener is not None:
+                await listener.close()
+
+
+async def _listen():
+    import psycopg
+
+    params = connection.get_connection_params()
+    params.pop('cursor_factory', None)  # Django's sync cursor class
+    conn = await psycopg.AsyncConnection.connect(**params, autocommit=True)
+    await conn.execute(f"LISTEN {CHANNEL}")
+    return conn
+
+
+async def _drain(conn, timeout):
+    """Exam ids notified within `timeout` seconds (batched), or None when the wait timed out."""
+    ids = set()
+    async for notify in conn.notifies(timeout=timeout, stop_after=1):
+        ids.add(notify.payload)
+    if not ids:
+        return None
+    # Collect whatever else arrived meanwhile so a burst costs one query
+    async for notify in conn.notifies(timeout=0.05):
+        ids.add(notify.payload)
+    return list(ids)
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    """The hub of the running event loop (each ASGI worker process has its own)."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = ProgressHub()
+    return _hubs[loop]
+
+
+# --- 3. SSE FORMATTING ---
+
+def _encode(snapshot):
+    return json.dumps(snapshot, default=str, sort_keys=True)
+
+
+def sse_event(snapshot):
+    return f"event: progress\ndata: {_encode(snapshot)}\n\n"
+
+
+async def progress_events(exam_id, snapshot):
+    """
+    The SSE body for one exam: the current snapshot, then every change until the
+    analysis finishes or PROGRESS_STREAM_SECONDS pass (clients reconnect). A comment
+    line every PROGRESS_KEEPALIVE seconds keeps proxies from closing idle streams.
+    """
+    yield f"retry: {int(_setting('PROGRESS_POLL_INTERVAL', 1.0) * 1000) + 1000}\n"
+    yield sse_event(snapshot)
+    if snapshot['status'] in FINAL_STATUSES:
+        return
+
+    hub = get_hub()
+    queue = hub.subscribe(exam_id, snapshot)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _setting('PROGRESS_STREAM_SECONDS', 600)
+    keepalive = _setting('PROGRESS_KEEPALIVE', 15)
+    try:
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                snapshot = await asyncio.wait_for(queue.get(), timeout=min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_event(snapshot)
+            if snapshot['status'] in FINAL_STATUSES:
+                return
+    finally:
+        hub.unsubscribe(exam_id, queue)
@@ -0,0 +1,188 @@
+# backend/analytics/exports.py
+"""
+Broadsheet exports.
+
+The analyzed workbook is streamed row by row straight into a file on disk:
+XlsxWriter in constant_memory mode (rows are flushed as they are written),
+or openpyxl's write-only workbook when XlsxWriter isn't installed. Neither
+builds a cell object graph, so memory stays flat however big the school is.
+
+Styling is declared per range, never per cell: a frozen header row (and name
+column), an autofilter, and conditional formats that colour every subject
+score and the Overall Grade by the exam's grade bands.
+
+CSV and Parquet variants of the graded broadsheet are for bulk consumers
+(spreadsheets at scale, data pipelines); they are produced from the graded
+snapshot on request.
+"""
+
+import io
+
+import pandas as pd
+
+from .columns import classify_columns
+
+try:
+    import xlsxwriter
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
+# Grade band fills, best band first (spread over however many bands the scheme has)
+BAND_COLOURS = ('#C6EFCE', '#DDEBF7', '#FFEB9C', '#F8CBAD', '#FFC7CE')
+HEADER_COLOUR = '#D9D9D9'
+CSV_CHUNK_ROWS = 5000
+
+
+def band_colours(bands):
+    """(low, high, grade, colour) for each band, highest band first."""
+    ordered = sorted(bands, key=lambda band: band[0], reverse=True)
+    last = max(len(ordered) - 1, 1)
+    return [
+        (low, high, grade, BAND_COLOURS[round(i * (len(BAND_COLOURS) - 1) / last)])
+        for i, (low, high, grade) in enumerate(ordered)
+    ]
+
+
+def _rows(frame):
+    """The frame's rows as tuples of plain values; missing values become None (blank cells)."""
+    columns = []
+    for name in frame.columns:
+        series = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+        columns.append(series.astype(object).where(series.notna(), None).tolist())
+    return zip(*columns)
+
+
+class SheetSpec:
+    """One worksheet: a frame plus the ranges to style."""
+
+    def __init__(self, name, frame, score_columns=(), grade_columns=(), freeze_columns=0):
+        self.name = name
+        self.frame = frame
+        self.header = [str(c) for c in frame.columns]
+        self.score_columns = [frame.columns.get_loc(c) for c in score_columns]
+        self.grade_columns = [frame.columns.get_loc(c) for c in grade_columns]
+        self.freeze_columns = freeze_columns
+
+
+def broadsheet_sheets(df, subject_cols, subject_analysis, stream_table=None):
+    """The workbook layout: Broadsheet, Subject Analysis and (batch uploads) Stream Analysis."""
+    name_col = classify_columns(df).name
+    grade_cols = [c for c in ('Overall Grade',) if c in df.columns]
+    sheets = [
+        SheetSpec('Broadsheet', df, score_columns=subject_cols, grade_columns=grade_cols,
+                  freeze_columns=df.columns.get_loc(name_col) + 1 if name_col is not None else 0),
+        SheetSpec('Subject Analysis', subject_analysis.rename_axis('Subject').reset_index(), freeze_columns=1),
+    ]
+    if stream_table is not None:
+        sheets.append(SheetSpec('Stream Analysis', stream_table.reset_index(), freeze_columns=1))
+    return sheets
+
+
+def write_workbook(path, sheets, bands=()):
+    """Streams the sheets into an .xlsx at `path`; `bands` are (low, high, grade) grade bands."""
+    bands = band_colours(bands)
+    if HAS_XLSXWRITER:
+        _write_xlsxwriter(path, sheets, bands)
+    else:
+        _write_openpyxl(path, sheets, bands)
+    return path
+
+
+def _write_xlsxwriter(path, sheets, bands):
+    # Cells are data: a name like "=1+1" or a URL stays text
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False, 'strings_to_numbers': False,
+    })
+    try:
+        header_format = workbook.add_format({'bold': True, 'bg_color': HEADER_COLOUR, 'border': 1})
+        fills = {colour: workbook.add_format({'bg_color': colour}) for *_, colour in bands}
+        for sheet in sheets:
+            ws = workbook.add_worksheet(sheet.name[:31])
+            last_row = len(sheet.frame)
+            for col, title in enumerate(sheet.header):
+                ws.set_column(col, col, min(max(len(title) + 2, 10), 40))
+            ws.freeze_panes(1, sheet.freeze_columns)
+            if sheet.header:
+                ws.autofilter(0, 0, last_row, len(sheet.header) - 1)
+
+            if last_row:
+                for col in sheet.score_columns:
+                    for low, high, _, colour in bands:
+                        ws.conditional_format(1, col, last_row, col, {
+                            'type': 'cell', 'criteria': 'between', 'minimum': low, 'maximum': high, 'format': fills[colour],
+                        })
+                for col in sheet.grade_columns:
+                    for _, _, grade, colour in bands:
+                        ws.conditional_format(1, col, last_row, col, {
+                            'type': 'cell', 'criteria': '==', 'value': f'"{grade}"', 'format': fills[colour],
+                        })
+
+            # constant_memory: rows must be written top to bottom, each flushed when the next starts
+            ws.write_row(0, 0, sheet.header, header_format)
+            for row, values in enumerate(_rows(sheet.frame), start=1):
+                ws.write_row(row, 0, values)
+    finally:
+        workbook.close()
+
+
+def _write_openpyxl(path, sheets, bands):
+    from openpyxl import Workbook
+    from openpyxl.formatting.rule import CellIsRule
+    from openpyxl.styles import PatternFill
+    from openpyxl.utils import get_column_letter
+
+    def fill(colour):
+        return PatternFill('solid', start_color=colour.lstrip('#'), end_color=colour.lstrip('#'))
+
+    def column_range(col, last_row):
+        letter = get_column_letter(col + 1)
+        return f"{letter}2:{letter}{last_row + 1}"
+
+    workbook = Workbook(write_only=True)
+    for sheet in sheets:
+        ws = workbook.create_sheet(sheet.name[:31])
+        last_row = len(sheet.frame)
+        for col, title in enumerate(sheet.header):
+            ws.column_dimensions[get_column_letter(col + 1)].width = min(max(len(title) + 2, 10), 40)
+        ws.freeze_panes = f"{get_column_letter(sheet.freeze_columns + 1)}2"
+        if sheet.header:
+            ws.auto_filter.ref = f"A1:{get_column_letter(len(sheet.header))}{last_row + 1}"
+
+        if last_row:
+            for col in sheet.score_columns:
+                for low, high, _, colour in bands:
+                    ws.conditional_formatting.add(column_range(col, last_row), CellIsRule(
+                        operator='between', formula=[str(low), str(high)], fill=fill(colour)))
+            for col in sheet.grade_columns:
+                for _, _, grade, colour in bands:
+                    ws.conditional_formatting.add(column_range(col, last_row), CellIsRule(
+                        operator='equal', formula=[f'"{grade}"'], fill=fill(colour)))
+
+        ws.append(sheet.header)
+        for values in _rows(sheet.frame):
+            ws.append(values)
+    workbook.save(path)
+
+
+# --- BULK EXPORTS (CSV / PARQUET) ---
+
+def iter_csv(df, chunk_rows=CSV_CHUNK_ROWS):
+    """The frame as CSV text, yielded in chunks of rows (for a streaming response)."""
+    yield df.head(0).to_csv(index=False)
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False)
+
+
+def parquet_bytes(df):
+    """The frame as Parquet (zstd). Mixed-type text columns are written as strings."""
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.select_dtypes(include=['object']).columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, engine='pyarrow', compression='zstd', index=False)
+    return buffer.getvalue()
@@ -0,0 +1,159 @@
+# backend/analytics/grading.py
+
+import json
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+NOT_GRADED = ("-", "Not Graded", 0)
+INVALID_SCORE = ("-", "", 0)
+INVALID_SCHEME = ("-", "Invalid Scheme", 0)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def _points_array(points):
+    """Keeps points numeric (int when possible) so the broadsheet can sum them."""
+    try:
+        arr = np.asarray(points, dtype=float)
+    except (TypeError, ValueError):
+        return np.asarray(points, dtype=object)
+    if np.all(np.mod(arr, 1) == 0):
+        return arr.astype(np.int64)
+    return arr
+
+
+class GradeResult(NamedTuple):
+    """Everything the broadsheet, the PDFs and the summary need, graded in one pass."""
+    overall_grade: pd.Series
+    overall_remark: pd.Series
+    overall_points: pd.Series
+    subject_grades: pd.DataFrame
+    subject_remarks: pd.DataFrame
+    subject_points: pd.DataFrame
+
+
+class GradingScheme:
+    """
+    A grading scheme compiled into sorted bin edges plus lookup arrays.
+
+    scheme = [{"min": 80, "max": 100, "grade": "EE", "remark": "...", "points": 4}, ...]
+
+    The number line is cut at every rule boundary into "segments" (each edge
+    point and each open gap between edges). At compile time every segment is
+    assigned the FIRST rule that covers it, which is exactly what the old
+    per-row loop in get_grade_details did. Grading is then one np.searchsorted
+    over the rounded scores plus three array lookups.
+    """
+
+    def __init__(self, scheme):
+        self.scheme = scheme
+        self.default = NOT_GRADED if isinstance(scheme, list) else INVALID_SCHEME
+
+        rules = []
+        for rule in scheme if isinstance(scheme, list) else []:
+            try:
+                low, high = rule['min'], rule['max']
+                result = (rule['grade'], rule['remark'], rule['points'])
+            except (KeyError, TypeError):
+                continue
+            if _is_number(low) and _is_number(high):
+                rules.append((float(low), float(high), result))
+
+        self.edges = np.array(sorted({b for low, high, _ in rules for b in (low, high)}), dtype=float)
+        # (min, max, grade) of every valid rule, for range-based styling (e.g. the broadsheet's colours)
+        self.bands = [(low, high, result[0]) for low, high, result in rules]
+
+        # One representative value per segment: gap below, edge, gap, edge, ..., gap above
+        reps = []
+        for i, edge in enumerate(self.edges):
+            below = self.edges[i - 1] if i else edge - 2
+            reps.extend([(below + edge) / 2, edge])
+        reps.append(self.edges[-1] + 1 if len(self.edges) else 0.0)
+
+        table = []
+        for value in reps:
+            match = next((res for low, high, res in rules if low <= value <= high), self.default)
+            table.append(match)
+        # Final slot is used for scores that cannot be graded at all (NaN, text, inf)
+        table.append(INVALID_SCORE)
+
+        grades, remarks, points = zip(*table)
+        self.grades = np.asarray(grades, dtype=object)
+        self.remarks = np.asarray(remarks, dtype=object)
+        self.points = _points_array(points)
+        self._invalid = len(table) - 1
+
+    def _segments(self, scores):
+        """Maps an array of raw scores to segment ids (same shape)."""
+        values = np.asarray(scores)
+        if values.dtype.kind not in 'iuf':
+            values = pd.to_numeric(pd.Series(values.ravel()), errors='coerce').to_numpy(dtype=float).reshape(values.shape)
+        values = np.round(values.astype(float))  # Same half-to-even rounding as round()
+
+        idx = np.searchsorted(self.edges, values, side='left')
+        on_edge = np.zeros(values.shape, dtype=bool)
+        inside = idx < len(self.edges)
+        on_edge[inside] = self.edges[idx[inside]] == values[inside]
+
+        segments = 2 * idx + on_edge
+        segments[~np.isfinite(values)] = self._invalid
+        return segments
+
+    def grade(self, scores):
+        """
+        Grades any array-like of scores.
+        Returns: (grades, remarks, points) arrays shaped like the input.
+        """
+        seg = self._segments(scores)
+        return self.grades[seg], self.remarks[seg], self.points[seg]
+
+    def grade_one(self, score):
+        """Scalar version, kept for callers that still grade a single value."""
+        grades, remarks, points = self.grade(np.array([score], dtype=object))
+        return grades[0], remarks[0], points[0].item() if hasattr(points[0], 'item') else points[0]
+
+    def grade_exam(self, averages, subject_scores):
+        """
+        Grades the overall averages and every subject score in a single pass.
+        averages: Series indexed like subject_scores.
+        subject_scores: DataFrame with one column per subject.
+        """
+        matrix = pd.concat([averages.rename('__overall__'), subject_scores], axis=1).to_numpy()
+        grades, remarks, points = self.grade(matrix)
+
+        def frame(values):
+            return pd.DataFrame(values[:, 1:], index=subject_scores.index, columns=subject_scores.columns)
+
+        def series(values):
+            return pd.Series(values[:, 0], index=averages.index)
+
+        return GradeResult(
+            overall_grade=series(grades),
+            overall_remark=series(remarks),
+            overall_points=series(points),
+            subject_grades=frame(grades),
+            subject_remarks=frame(remarks),
+            subject_points=frame(points),
+        )
+
+
+@lru_cache(maxsize=128)
+def _compile(key):
+    return GradingScheme(json.loads(key))
+
+
+def compile_grading_scheme(scheme):
+    """
+    Returns the compiled GradingScheme for a raw JSON scheme.
+    Compiled once per distinct scheme and shared by every caller in the process.
+    """
+    try:
+        key = json.dumps(scheme, sort_keys=True)
+    except (TypeError, ValueError):
+        return GradingScheme(scheme)
+    return _compile(key)
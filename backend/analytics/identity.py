@@ -0,0 +1,145 @@
+# backend/analytics/identity.py
+"""
+Student identity index.
+
+Student rows are a school's persistent index of learners, filled by every
+analysis (scores.store_scores): keyed on the normalized admission number,
+with the UPI and a search name stored next to it.
+
+Matching a sheet's rows to students, best evidence first:
+1. the admission number (4344.0, ' 4344 ' and '4344' are one student);
+2. no (known) admission number: the UPI, when the sheet has a UPI column;
+3. neither: the name, ignoring case, punctuation, spacing and word order
+   ("Kamau, John" is "JOHN  KAMAU"), provided exactly one student of the
+   school has it. Otherwise a name-only student ('name:<NAME>') is kept.
+A student first seen without an admission number is promoted to it the first
+time a sheet pairs their (unique) name with one, so their history follows.
+
+search_students() backs the typeahead: prefix matches on admission number,
+UPI and any word of the name. Every branch is an indexed prefix scan
+((owner, field) B-trees with pattern ops; name words are rows of
+StudentNameToken, written when the student is created), so it answers in
+milliseconds whatever the number of uploads.
+"""
+
+import re
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Student, StudentNameToken
+
+LOOKUP_CHUNK = 500
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX = 50
+
+_NON_WORD = re.compile(r'[^0-9A-Z]+')
+
+
+def search_name(name):
+    """'Kamau, John ' -> 'JOHN KAMAU': upper-cased words, punctuation dropped, sorted."""
+    return ' '.join(sorted(_NON_WORD.sub(' ', str(name).upper()).split()))
+
+
+def name_only_key(name):
+    """Key of a student known only by name ('' when there is no name either)."""
+    return f"name:{' '.join(name.upper().split())}" if name else ''
+
+
+def normalize_query(query):
+    return ' '.join(_NON_WORD.sub(' ', str(query).upper()).split())
+
+
+def _chunked_filter(queryset, field, values):
+    values = list(values)
+    for i in range(0, len(values), LOOKUP_CHUNK):
+        yield from queryset.filter(**{f'{field}__in': values[i:i + LOOKUP_CHUNK]})
+
+
+def index_names(owner_id, students):
+    """Writes the name tokens of new students: {student_id: search_name}."""
+    StudentNameToken.objects.bulk_create((
+        StudentNameToken(student_id=student_id, owner_id=owner_id, token=token[:100])
+        for student_id, name in students.items()
+        for token in set(name.split())
+    ), batch_size=LOOKUP_CHUNK * 10, ignore_conflicts=True)
+
+
+def resolve_student_keys(owner_id, rows):
+    """
+    rows: [(adm, name, upi)] of one sheet (cleaned strings, '' when missing).
+    Returns the Student key for each row (see the module docstring), after
+    promoting name-only students that the sheet gives an admission number and
+    recording the UPIs of known students that had none.
+    """
+    students = Student.objects.filter(owner_id=owner_id).only('id', 'key', 'upi', 'search_name')
+    known = {s.key: s for s in _chunked_filter(students, 'key', {adm for adm, name, upi in rows if adm})}
+
+    # Only rows without a known admission number need the other evidence; the
+    # names of rows with a new admission number only matter when there is a
+    # name-only student to promote
+    unmatched = [(adm, name, upi) for adm, name, upi in rows if adm not in known]
+    promotable = any(adm for adm, name, upi in unmatched) and students.filter(key__startswith='name:').exists()
+    names = {search_name(name) for adm, name, upi in unmatched if name and (promotable or not adm)}
+    wanted = [search_name(name) if name else '' for adm, name, upi in rows]
+
+    # Students of the school by search name (several when namesakes exist)
+    by_name = {}
+    for student in _chunked_filter(students, 'search_name', names):
+        by_name.setdefault(student.search_name, []).append(student)
+    by_upi = {s.upi: s.key for s in _chunked_filter(students, 'upi', {upi for adm, name, upi in unmatched if upi})}
+
+    keys, promoted, claimed, upi_updates = [], {}, set(), []
+    for (adm, name, upi), name_key in zip(rows, wanted):
+        matches = by_name.get(name_key, [])
+        unique = matches[0] if len(matches) == 1 else None
+        # A sheet whose only identifier column is the UPI reads it as the admission number
+        upi_key = by_upi.get(upi) if upi else None
+        if adm and (adm in known or upi_key is None):
+            keys.append(adm)
+            if adm in known and upi and not known[adm].upi:
+                known[adm].upi = upi
+                upi_updates.append(known[adm])
+            claimable = adm not in known and adm not in claimed
+            if claimable and unique is not None and unique.key.startswith('name:') and unique.key not in promoted:
+                promoted[unique.key] = (unique.pk, adm, upi)
+                claimed.add(adm)
+        elif upi_key is not None:
+            keys.append(upi_key)
+        elif unique is not None:
+            keys.append(unique.key)
+        else:
+            keys.append(name_only_key(name))
+
+    Student.objects.bulk_update(upi_updates, ['upi'], batch_size=LOOKUP_CHUNK)
+    # Earlier uploads only had these students' names: from now on they are their admission number
+    for old_key, (pk, adm, upi) in promoted.items():
+        Student.objects.filter(pk=pk).update(key=adm, adm_no=adm, **({'upi': upi} if upi else {}))
+    renamed = {old_key: adm for old_key, (pk, adm, upi) in promoted.items()}
+    return [renamed.get(key, key) for key in keys]
+
+
+def search_students(queryset, query, limit=TYPEAHEAD_LIMIT, owner_id=None):
+    """
+    Typeahead over a Student queryset: exact admission number/UPI first, then
+    admission number/UPI prefixes, then names with a word starting with each
+    word of the query, alphabetically. owner_id narrows the name token scans
+    to one school (the queryset's, when it is one school's students).
+    """
+    identifier = str(query).strip().upper()
+    words = normalize_query(query).split()
+    if not identifier:
+        return queryset.none()
+
+    tokens = StudentNameToken.objects.all() if owner_id is None else StudentNameToken.objects.filter(owner_id=owner_id)
+    by_name = Q()
+    for word in words:
+        by_name &= Q(pk__in=tokens.filter(token__startswith=word).values('student_id'))
+    by_identifier = Q(adm_no__startswith=identifier) | Q(upi__startswith=identifier)
+    rank = Case(
+        When(Q(adm_no=identifier) | Q(upi=identifier), then=Value(0)),
+        When(by_identifier, then=Value(1)),
+        default=Value(2),
+        output_field=IntegerField(),
+    )
+    matches = by_identifier | by_name if words else by_identifier
+    return queryset.filter(matches).annotate(match_rank=rank).order_by('match_rank', 'name', 'id')[:limit]
@@ -0,0 +1,290 @@
+# backend/analytics/ingest.py
+"""
+Fast ingest: parse an uploaded sheet with the quickest reader installed,
+shrink numeric columns to compact dtypes, and persist/load Parquet snapshots.
+
+Optional speed-ups (both in requirements.txt, both optional at runtime):
+- python-calamine: Rust xlsx/xls reader, several times faster than openpyxl
+- pyarrow: multithreaded CSV parser and Parquet snapshots
+
+CSV identity columns (admission, UPI, name, stream) are typed as text up front,
+so admission numbers keep their leading zeros as they do in workbooks; scores
+are left to the parser's numeric inference, since marks like "ABS" must reach
+the pipeline as text to be coerced there. Subjects are still picked in the
+detection stage: they depend on custom_ignore_columns, which a regrade changes
+without re-reading the file (and classification is cached by header).
+"""
+
+import logging
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from django.core.files.base import ContentFile
+
+from .columns import identity_columns
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import python_calamine  # noqa: F401
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+
+SHEET_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# A batch ZIP may not inflate past this (zip-bomb guard)
+MAX_BATCH_UNCOMPRESSED_BYTES = 200 * 1024 * 1024
+
+
+def csv_engine():
+    return 'pyarrow' if HAS_PYARROW else 'c'
+
+
+def read_csv(source):
+    """A CSV file or buffer with its identity columns read as text (see the module docstring)."""
+    headers = pd.read_csv(source, nrows=0).columns
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    text = identity_columns(headers)
+    if not HAS_PYARROW:
+        return pd.read_csv(source, dtype=dict.fromkeys(text, str))
+    # pandas' pyarrow engine casts its inferred types afterwards ("0012" -> 12 -> "12"),
+    # so the column types go to pyarrow's own reader
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    table = pa_csv.read_csv(
+        source,
+        # pandas' header names: duplicated headers come back as "Maths", "Maths.1"
+        read_options=pa_csv.ReadOptions(column_names=[str(c) for c in headers], skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(column_types={str(col): pa.string() for col in text}, strings_can_be_null=True),
+    )
+    return table.to_pandas()
+
+
+def excel_engine(file_path):
+    if HAS_CALAMINE:
+        return 'calamine'
+    return None if file_path.endswith('.xls') else 'openpyxl'  # openpyxl already runs read-only in pandas
+
+
+def read_exam_file(file_path, sheets_as_streams=False):
+    """
+    Parses the uploaded sheet into a DataFrame with clean headers and compact dtypes.
+    Returns (df, report) where report has the engine used and the parse time.
+
+    Batch uploads (a ZIP of stream sheets, or with sheets_as_streams a workbook
+    with one sheet per stream) come back as one concatenated frame with a
+    'Stream' column, and report['streams'] lists the streams found. Otherwise a
+    workbook is read from its first sheet.
+    """
+    started = time.perf_counter()
+    streams = None
+    if file_path.endswith('.zip'):
+        frames, engine = _read_zip(file_path)
+    elif file_path.endswith('.csv'):
+        engine = csv_engine()
+        frames = {None: read_csv(file_path)}
+    else:
+        engine = excel_engine(file_path)
+        if sheets_as_streams:
+            frames = _stream_sheets(pd.read_excel(file_path, engine=engine, sheet_name=None))
+        else:
+            frames = {None: pd.read_excel(file_path, engine=engine)}
+
+    if None in frames:
+        df = frames[None]
+        df.columns = df.columns.str.strip()
+    else:
+        df, streams = _concat_streams(frames)
+    parsed = time.perf_counter() - started
+
+    df = downcast_numeric(df)
+
+    report = {
+        "engine": engine or 'default',
+        "parse_seconds": round(parsed, 4),
+        "total_seconds": round(time.perf_counter() - started, 4),
+        "rows": len(df),
+        "columns": len(df.columns),
+        "file_bytes": os.path.getsize(file_path),
+        "memory_bytes": int(df.memory_usage(deep=True).sum()),
+    }
+    if streams:
+        report["streams"] = streams
+    logger.info("Parsed %s with %s in %.3fs (%s rows)", os.path.basename(file_path), report['engine'], parsed, len(df))
+    return df, report
+
+
+# --- BATCH (MULTI-STREAM) UPLOADS ---
+
+def _read_zip(file_path):
+    """Parses every sheet in the ZIP in parallel. Returns ({stream: df}, engine)."""
+    with zipfile.ZipFile(file_path) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith(SHEET_EXTENSIONS)
+            and not os.path.basename(info.filename).startswith(('.', '~$'))
+            and '__MACOSX' not in info.filename
+        ]
+        if not members:
+            raise ValueError("The ZIP contains no .csv, .xlsx or .xls files.")
+        if sum(info.file_size for info in members) > MAX_BATCH_UNCOMPRESSED_BYTES:
+            raise ValueError("The ZIP is too large once extracted.")
+        payloads = [(info.filename, archive.read(info)) for info in members]
+
+    # pyarrow and calamine parse outside the GIL, so threads are enough here
+    with ThreadPoolExecutor(max_workers=min(len(payloads), os.cpu_count() or 1, 8)) as pool:
+        parsed = list(pool.map(lambda item: _parse_member(*item), payloads))
+
+    frames = {}
+    for (name, _), df in zip(payloads, parsed):
+        stream = os.path.splitext(os.path.basename(name))[0].strip()
+        frames[_unique(stream, frames)] = df
+    engines = {csv_engine() if name.lower().endswith('.csv') else excel_engine(name.lower()) or 'default'
+               for name, _ in payloads}
+    return frames, '+'.join(sorted(engines))
+
+
+def _parse_member(name, payload):
+    if name.lower().endswith('.csv'):
+        return read_csv(BytesIO(payload))
+    return pd.read_excel(BytesIO(payload), engine=excel_engine(name.lower()))
+
+
+def _stream_sheets(sheets):
+    """
+    Picks the stream sheets of a workbook. A single data sheet is an ordinary
+    upload ({None: df}); extra sheets only count as streams when they share
+    most of the first sheet's headers, so notes or pivot sheets are ignored.
+    """
+    sheets = {name: df for name, df in sheets.items() if not df.dropna(how='all').empty}
+    if not sheets:
+        raise ValueError("The workbook has no data.")
+    first_name, first = next(iter(sheets.items()))
+    reference = {str(c).strip().lower() for c in first.columns}
+
+    streams = {}
+    for name, df in sheets.items():
+        headers = {str(c).strip().lower() for c in df.columns}
+        if len(headers & reference) >= len(reference) / 2:
+            streams[str(name).strip()] = df
+        else:
+            logger.info("Skipping sheet %r: its headers don't match %r", name, first_name)
+    if len(streams) == 1:
+        return {None: first}
+    return streams
+
+
+def _concat_streams(frames):
+    """One frame for the whole school, tagged with each row's stream."""
+    tagged = []
+    streams = []
+    for name, df in frames.items():
+        df.columns = df.columns.str.strip()
+        if 'Stream' in df.columns:
+            df['Stream'] = df['Stream'].fillna(name)
+        else:
+            df.insert(0, 'Stream', name)
+        df['Stream'] = df['Stream'].astype(str)
+        tagged.append(df)
+        streams.append({"name": name, "rows": len(df)})
+    return pd.concat(tagged, ignore_index=True, sort=False), streams
+
+
+def _unique(name, taken):
+    candidate, n = name, 2
+    while candidate in taken:
+        candidate = f"{name} ({n})"
+        n += 1
+    return candidate
+
+
+def downcast_numeric(df):
+    """
+    Shrinks numeric columns without changing a single value: whole-number
+    columns go to the smallest integer type (scores 0-100 -> uint8), fractional
+    columns to float32 only where float32 holds every value exactly.
+    """
+    for col in df.select_dtypes(include=[np.number]).columns:
+        series = df[col]
+        if series.dtype.kind in 'iu':
+            kind = 'unsigned' if (series >= 0).all() else 'integer'
+            df[col] = pd.to_numeric(series, downcast=kind)
+        elif series.dtype.kind == 'f':
+            values = series.to_numpy()
+            finite = values[~np.isnan(values)]
+            if not series.hasnans and len(finite) and np.array_equal(finite, np.round(finite)) \
+                    and finite.min() >= 0 and finite.max() <= 255:
+                df[col] = series.astype(np.uint8)  # e.g. "85.0" scores read as floats
+            elif np.array_equal(finite.astype(np.float32).astype(np.float64), finite):
+                df[col] = series.astype(np.float32)
+    return df
+
+
+# --- SNAPSHOTS ---
+
+def save_frame(field, df, name):
+    """Stores df in a FileField: Parquet when pyarrow can encode it, pickle otherwise."""
+    buffer = BytesIO()
+    stem = os.path.splitext(name)[0]
+    if HAS_PYARROW:
+        try:
+            df.to_parquet(buffer, engine='pyarrow', compression='zstd')
+            field.save(f"{stem}.parquet", _content(buffer), save=False)
+            return
+        except Exception as e:
+            # Mixed-type object columns or non-string headers can't be written as Parquet
+            logger.info("Parquet snapshot not possible (%s), falling back to pickle", e)
+            buffer = BytesIO()
+    df.to_pickle(buffer)
+    field.save(f"{stem}.pkl", _content(buffer), save=False)
+
+
+def load_frame(field):
+    """Loads a snapshot written by save_frame, or None if there is none (or it is unreadable)."""
+    if not field:
+        return None
+    try:
+        if field.name.endswith('.parquet'):
+            try:
+                # Local storage: Arrow memory-maps the file instead of copying it
+                df = pd.read_parquet(field.path, engine='pyarrow', memory_map=True)
+            except NotImplementedError:
+                with field.open('rb') as fh:
+                    df = pd.read_parquet(BytesIO(fh.read()), engine='pyarrow')
+            # Arrow hands back missing text as None; the pipeline expects NaN like read_csv gives
+            for col in df.select_dtypes(include=['object']).columns:
+                df[col] = df[col].fillna(np.nan)
+            return df
+        with field.open('rb') as fh:
+            return pd.read_pickle(BytesIO(fh.read()))
+    except Exception as e:
+        logger.warning("Snapshot %s unreadable: %s", field.name, e)
+        return None
+
+
+def file_fingerprint(file_field):
+    """Cheap identity for the uploaded file: a new upload always gets a new name."""
+    try:
+        return f"{file_field.name}:{file_field.size}"
+    except (OSError, ValueError):
+        return None
+
+
+def _content(buffer):
+    return ContentFile(buffer.getvalue())
@@ -0,0 +1,232 @@
+# backend/analytics/instrumentation.py
+"""
+Per-stage timing for the analysis pipeline: wall time, CPU time (including
+report-rendering child processes) and peak RSS, plus Prometheus text export.
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+
+from django.db.models import F, Max
+from django.utils import timezone
+
+try:
+    import resource
+except ImportError:  # Windows: no rusage, CPU time of this process only
+    resource = None
+
+RAN = 'ran'
+SKIPPED = 'skipped'
+DEFERRED = 'deferred'  # artifact left for the first download (see analytics/artifacts.py)
+FAILED = 'failed'
+
+# Pipeline order, used for display and metrics ('streams' only runs for batch uploads)
+STAGES = ('read', 'detection', 'calculations', 'grading', 'summary', 'scores', 'excel', 'charts', 'streams', 'reports', 'save')
+
+
+def _cpu_seconds():
+    """CPU used by this process plus its finished children (the PDF pool)."""
+    if resource is None:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _reset_peak_rss():
+    """Linux: restart the VmHWM high-water mark so each stage gets its own peak."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    # Fallback: lifetime peak (kilobytes on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PipelineTimer:
+    """
+    Collects one record per stage:
+
+        timer = PipelineTimer()
+        with timer.stage('read') as stage:
+            ...
+            stage['outcome'] = SKIPPED   # when the stage had nothing to do
+
+    on_stage(name) is called as each stage starts (progress reporting).
+    """
+
+    def __init__(self, on_stage=None):
+        self.records = []
+        self.on_stage = on_stage
+
+    @contextmanager
+    def stage(self, name):
+        if self.on_stage is not None:
+            self.on_stage(name)
+        record = {'stage': name, 'outcome': RAN}
+        _reset_peak_rss()
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield record
+        except BaseException:
+            record['outcome'] = FAILED
+            raise
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall, 6)
+            record['cpu_seconds'] = round(_cpu_seconds() - cpu, 6)
+            record['peak_rss_bytes'] = _peak_rss_bytes()
+            self.records.append(record)
+
+    @property
+    def outcomes(self):
+        return {r['stage']: r['outcome'] for r in self.records}
+
+    def save(self, exam):
+        """Replaces the exam's timings with this run's records and adds them to the StageTotal counters."""
+        from .models import StageTiming, StageTotal
+
+        StageTiming.objects.filter(exam=exam).delete()
+        StageTiming.objects.bulk_create([
+            StageTiming(exam=exam, order=STAGES.index(r['stage']) + 1 if r['stage'] in STAGES else 0, **r)
+            for r in self.records
+        ])
+
+        StageTotal.objects.bulk_create(
+            [StageTotal(stage=r['stage'], outcome=r['outcome']) for r in self.records], ignore_conflicts=True,
+        )
+        for r in self.records:
+            StageTotal.objects.filter(stage=r['stage'], outcome=r['outcome']).update(
+                runs=F('runs') + 1,
+                wall_seconds=F('wall_seconds') + r['wall_seconds'],
+                cpu_seconds=F('cpu_seconds') + r['cpu_seconds'],
+            )
+
+
+# --- LIVE PROGRESS (ExamUpload.progress) ---
+
+def progress_payload(stage, done, total, summary_ready=False, failed=False):
+    return {
+        'stage': stage,
+        'done': done,
+        'total': total,
+        'percent': 100 if stage == 'done' else int(done * 100 / total) if total else 0,
+        'summary_ready': summary_ready,
+        'failed': failed,
+    }
+
+
+def progress_snapshot(exam):
+    """What progress pollers get: status, stage progress and the summary once it is ready."""
+    progress = exam.progress or {}
+    if exam.status == 'COMPLETED' and progress.get('stage') != 'done':
+        progress = {**progress, 'percent': 100, 'summary_ready': True}
+    ready = progress.get('summary_ready') or exam.status == 'COMPLETED'
+    return {
+        'id': exam.id,
+        'status': exam.status,
+        'message': exam.message,
+        'progress': progress,
+        'analysis_summary': exam.analysis_summary if ready else None,
+    }
+
+
+def write_progress(exam, stage, done, total, summary=None):
+    """
+    Publishes the stage that just started. With `summary`, also publishes the
+    dashboard numbers so the frontend can show them before the artifacts exist.
+    A single-row UPDATE: the worker's in-memory exam is kept in sync, nothing else is saved.
+    """
+    from .events import publish
+    from .models import ExamUpload
+
+    ready = summary is not None or bool((exam.progress or {}).get('summary_ready'))
+    exam.progress = progress_payload(stage, done, total, summary_ready=ready)
+    fields = {'progress': exam.progress, 'updated_at': timezone.now()}
+    if summary is not None:
+        fields['analysis_summary'] = summary
+    ExamUpload.objects.filter(pk=exam.pk).update(**fields)
+    publish(exam.pk)
+
+
+# --- PROMETHEUS EXPORT ---
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_metrics():
+    """Text exposition format (version 0.0.4) for /api/analytics/metrics/."""
+    from .jobs import queue_metrics
+    from .models import StageTiming, StageTotal
+
+    # Counters come from the cumulative totals; peak RSS is a gauge over the exams' last runs
+    totals = list(StageTotal.objects.order_by('stage', 'outcome'))
+    ran = [t for t in totals if t.outcome == RAN]
+    peaks = dict(
+        StageTiming.objects.filter(outcome=RAN).values_list('stage').annotate(rss=Max('peak_rss_bytes')).order_by('stage')
+    )
+
+    lines = [
+        '# HELP exam_analysis_stage_wall_seconds Wall-clock time spent in each pipeline stage.',
+        '# TYPE exam_analysis_stage_wall_seconds summary',
+    ]
+    for row in ran:
+        label = f'stage="{_escape(row.stage)}"'
+        lines.append(f'exam_analysis_stage_wall_seconds_sum{{{label}}} {row.wall_seconds:.6f}')
+        lines.append(f'exam_analysis_stage_wall_seconds_count{{{label}}} {row.runs}')
+
+    lines += [
+        '# HELP exam_analysis_stage_cpu_seconds CPU time spent in each pipeline stage.',
+        '# TYPE exam_analysis_stage_cpu_seconds summary',
+    ]
+    for row in ran:
+        label = f'stage="{_escape(row.stage)}"'
+        lines.append(f'exam_analysis_stage_cpu_seconds_sum{{{label}}} {row.cpu_seconds:.6f}')
+        lines.append(f'exam_analysis_stage_cpu_seconds_count{{{label}}} {row.runs}')
+
+    lines += [
+        '# HELP exam_analysis_stage_peak_rss_bytes Highest peak RSS recorded for each stage.',
+        '# TYPE exam_analysis_stage_peak_rss_bytes gauge',
+    ]
+    for stage, rss in sorted(peaks.items()):
+        lines.append(f'exam_analysis_stage_peak_rss_bytes{{stage="{_escape(stage)}"}} {rss}')
+
+    lines += [
+        '# HELP exam_analysis_stage_runs_total Stage executions by outcome.',
+        '# TYPE exam_analysis_stage_runs_total counter',
+    ]
+    for row in totals:
+        lines.append(f'exam_analysis_stage_runs_total{{stage="{_escape(row.stage)}",outcome="{_escape(row.outcome)}"}} {row.runs}')
+
+    queue = queue_metrics()
+    lines += [
+        '# HELP exam_analysis_queue_depth Uploads waiting for a worker.',
+        '# TYPE exam_analysis_queue_depth gauge',
+        f'exam_analysis_queue_depth {queue["queue_depth"]}',
+        '# HELP exam_analysis_in_flight Uploads being processed right now.',
+        '# TYPE exam_analysis_in_flight gauge',
+        f'exam_analysis_in_flight {queue["in_flight"]}',
+        '# HELP exam_analysis_oldest_pending_seconds Age of the oldest queued upload.',
+        '# TYPE exam_analysis_oldest_pending_seconds gauge',
+        f'exam_analysis_oldest_pending_seconds {queue["oldest_pending_seconds"]}',
+        '# HELP exam_uploads Uploads by status.',
+        '# TYPE exam_uploads gauge',
+    ]
+    for status, n in sorted(queue['by_status'].items()):
+        lines.append(f'exam_uploads{{status="{_escape(status)}"}} {n}')
+    return '\n'.join(lines) + '\n'
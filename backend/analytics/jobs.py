@@ -0,0 +1,408 @@
+# backend/analytics/jobs.py
+"""
+DB-backed analysis queue.
+
+The ExamUpload row IS the job: PENDING rows are the queue, PROCESSING rows are
+in flight. Workers (see `manage.py run_analysis_workers`) claim rows atomically,
+send heartbeats while they work, and a reaper hands rows whose heartbeat went
+stale (crashed worker, redeploy) back to PENDING. Each job runs in a
+sandboxed child process (analytics/sandbox.py) with CPU, memory and
+wall-clock limits; a job that hits one is FAILED with a coded message, not
+retried.
+
+Work on a finished upload that must leave its status alone (a deferred
+artifact requested by a download) goes through ExamTask rows the same way:
+the workers claim them when no upload is waiting.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import ExamTask, ExamUpload
+from .sandbox import FailureCode, failure_message, run_analysis, sandbox_enabled
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def worker_name(index=0):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+# --- 1. PRODUCER SIDE ---
+
+def enqueue_analysis(exam, message="Queued for analysis."):
+    """Puts an upload (back) on the queue. Returns immediately."""
+    exam.status = ExamUpload.Status.PENDING
+    exam.message = message
+    exam.progress = {}
+    exam.queued_at = timezone.now()
+    exam.started_at = None
+    exam.heartbeat_at = None
+    exam.finished_at = None
+    exam.worker_id = ''
+    exam.incremental = False
+    exam.save()
+    return exam
+
+
+def requeue_analysis(exam, message, incremental=False, statuses=None, **changes):
+    """
+    enqueue_analysis for an upload that may be in use (retries, regrades): one
+    conditional UPDATE puts it back on the queue only while its status is in
+    `statuses` (default: COMPLETED or FAILED), so two re-runs, or a re-run and
+    a running job, can never both take it. `changes` are model fields saved in
+    the same UPDATE (e.g. a new grading_scheme). Returns False, changing
+    nothing, when the upload was not in one of those states.
+    """
+    from .events import publish
+
+    statuses = statuses or (ExamUpload.Status.COMPLETED, ExamUpload.Status.FAILED)
+    now = timezone.now()
+    fields = dict(
+        status=ExamUpload.Status.PENDING, message=message, progress={}, incremental=incremental,
+        queued_at=now, started_at=None, heartbeat_at=None, finished_at=None, worker_id='', updated_at=now,
+        **changes,
+    )
+    if not ExamUpload.objects.filter(pk=exam.pk, status__in=statuses).update(**fields):
+        return False
+    for name, value in fields.items():
+        setattr(exam, name, value)
+    # The run rewrites the score tables itself
+    ExamTask.objects.filter(exam=exam, kind=SCORES_TASK, status=ExamUpload.Status.PENDING).delete()
+    publish(exam.pk)
+    return True
+
+
+# ExamTask kind that fills the score tables of a cache hit (cache.restore_scores);
+# the other kinds are artifact names (analytics/artifacts.py)
+SCORES_TASK = 'scores'
+
+
+def enqueue_task(exam, kind):
+    """
+    Queues `kind` for a finished upload unless it is already queued or running.
+    Returns the ExamTask; a finished one is put back on the queue.
+    """
+    now = timezone.now()
+    task, created = ExamTask.objects.get_or_create(exam=exam, kind=kind, defaults={'queued_at': now})
+    if created or task.status in (ExamUpload.Status.PENDING, ExamUpload.Status.PROCESSING):
+        return task
+    ExamTask.objects.filter(pk=task.pk, status=task.status).update(
+        status=ExamUpload.Status.PENDING, message='', queued_at=now, started_at=None,
+        heartbeat_at=None, finished_at=None, worker_id='', attempts=0,
+    )
+    task.refresh_from_db()
+    return task
+
+
+# --- 2. CONSUMER SIDE ---
+
+def _busy_users():
+    """Users already at their concurrency limit (a subquery)."""
+    limit = _setting('ANALYSIS_PER_USER_LIMIT', 2)
+    return (
+        ExamUpload.objects.filter(status=ExamUpload.Status.PROCESSING, uploaded_by__isnull=False)
+        .values('uploaded_by')
+        .annotate(running=Count('id'))
+        .filter(running__gte=limit)
+        .values('uploaded_by')
+    )
+
+
+def _claimable():
+    """PENDING jobs, oldest first, skipping users already at their concurrency limit."""
+    return (
+        ExamUpload.objects.filter(status=ExamUpload.Status.PENDING)
+        .exclude(uploaded_by__in=_busy_users())
+        .order_by(F('queued_at').asc(nulls_last=True), 'uploaded_at')
+    )
+
+
+def claim_next_job(worker_id, batch=10):
+    """
+    Atomically moves the next eligible PENDING job to PROCESSING and returns it
+    (or None when the queue is empty).
+
+    Postgres: SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers never wait
+    on each other's candidates. SQLite ignores row locks, so the conditional
+    UPDATE (status must still be PENDING) is what guarantees a single winner.
+    The per-user limit is checked again in that UPDATE, under a lock on the
+    uploader's row: two workers claiming the same user's jobs take turns, and
+    the second one sees the first one's claim.
+    """
+    with transaction.atomic():
+        candidates = list(_claimable().select_for_update(skip_locked=True).values_list('pk', 'uploaded_by')[:batch])
+        # Always locked in pk order, so two workers never wait on each other's users in a cycle
+        owners = {owner for _, owner in candidates if owner is not None}
+        list(get_user_model().objects.select_for_update().filter(pk__in=owners).order_by('pk').values_list('pk'))
+        for pk, _ in candidates:
+            now = timezone.now()
+            won = ExamUpload.objects.filter(pk=pk, status=ExamUpload.Status.PENDING).exclude(
+                uploaded_by__in=_busy_users()
+            ).update(
+                status=ExamUpload.Status.PROCESSING,
+                message="Processing...",
+                started_at=now,
+                updated_at=now,
+                heartbeat_at=now,
+                worker_id=worker_id,
+                attempts=F('attempts') + 1,
+            )
+            if won:
+                return ExamUpload.objects.get(pk=pk)
+    return None
+
+
+def claim_next_task(worker_id, batch=10):
+    """claim_next_job for ExamTask rows: the next PENDING task moved to PROCESSING, or None."""
+    with transaction.atomic():
+        queue = ExamTask.objects.filter(status=ExamUpload.Status.PENDING).order_by('queued_at')
+        candidates = list(queue.select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch])
+        for pk in candidates:
+            now = timezone.now()
+            won = ExamTask.objects.filter(pk=pk, status=ExamUpload.Status.PENDING).update(
+                status=ExamUpload.Status.PROCESSING,
+                started_at=now,
+                heartbeat_at=now,
+                worker_id=worker_id,
+                attempts=F('attempts') + 1,
+            )
+            if won:
+                return ExamTask.objects.select_related('exam').get(pk=pk)
+    return None
+
+
+class Heartbeat(threading.Thread):
+    """Touches heartbeat_at every few seconds while the (blocking) analysis runs."""
+
+    def __init__(self, job_id, interval, model=ExamUpload):
+        super().__init__(daemon=True)
+        self.job_id = job_id
+        self.interval = interval
+        self.model = model
+        self._stop_event = threading.Event()
+        self._last = time.monotonic()
+
+    def touch(self):
+        self.model.objects.filter(pk=self.job_id, status=ExamUpload.Status.PROCESSING).update(
+            heartbeat_at=timezone.now()
+        )
+
+    def touch_if_due(self):
+        """For callers that poll anyway (the sandbox watchdog) instead of running the thread."""
+        if time.monotonic() - self._last >= self.interval:
+            self._last = time.monotonic()
+            self.touch()
+
+    def run(self):
+        try:
+            while not self._stop_event.wait(self.interval):
+                self.touch()
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_job(exam):
+    """
+    Runs the analysis for a claimed job while heartbeating, then stamps finished_at.
+    A retry of an upload whose result is cached completes from the cache instead
+    (regrades always run: they change the settings). With the sandbox (analytics/sandbox.py) the analysis runs in a child process
+    under the ANALYSIS_* limits and this process's watchdog loop heartbeats; no
+    thread is started, so nothing is running here when the child is forked.
+    """
+    from .analysis import process_exam_file
+    from .cache import restore_cached_result
+
+    interval = _setting('ANALYSIS_HEARTBEAT_INTERVAL', 30)
+    try:
+        try:
+            # The upload request already counted its miss; only count hits here
+            if not exam.incremental and restore_cached_result(exam, count_miss=False):
+                return
+        except Exception:
+            logger.exception("Result cache error for exam %s", exam.pk)
+        if sandbox_enabled():
+            run_analysis(exam, on_tick=Heartbeat(exam.pk, interval).touch_if_due, incremental=exam.incremental)
+        else:
+            heartbeat = Heartbeat(exam.pk, interval)
+            heartbeat.start()
+            try:
+                process_exam_file(exam, incremental=exam.incremental)
+            finally:
+                heartbeat.stop()
+    finally:
+        ExamUpload.objects.filter(pk=exam.pk).update(finished_at=timezone.now())
+
+
+def run_task(task):
+    """
+    Runs a claimed ExamTask (a deferred artifact, see analytics/artifacts.py
+    build_deferred_artifact, or a cache hit's scores, cache.restore_scores) and
+    records how it ended. The upload itself is never marked FAILED.
+    """
+    from .artifacts import ArtifactUnavailable, build_deferred_artifact
+    from .cache import restore_scores
+
+    heartbeat = Heartbeat(task.pk, _setting('ANALYSIS_HEARTBEAT_INTERVAL', 30), model=ExamTask)
+    status, message = ExamUpload.Status.COMPLETED, ''
+    try:
+        if task.kind == SCORES_TASK:
+            restore_scores(task.exam)
+        else:
+            build_deferred_artifact(task.exam, task.kind, on_tick=heartbeat.touch_if_due)
+    except ArtifactUnavailable as e:
+        status, message = ExamUpload.Status.FAILED, str(e)
+    except Exception as e:
+        logger.exception("Task %s (%s) failed for exam %s", task.pk, task.kind, task.exam_id)
+        status, message = ExamUpload.Status.FAILED, failure_message(FailureCode.ERROR, str(e) or type(e).__name__)
+    ExamTask.objects.filter(pk=task.pk).update(status=status, message=message, finished_at=timezone.now())
+
+
+def requeue_stale_jobs():
+    """
+    Visibility timeout: PROCESSING jobs without a heartbeat for
+    ANALYSIS_VISIBILITY_TIMEOUT seconds go back to PENDING, or to FAILED once
+    they have used up ANALYSIS_MAX_ATTEMPTS.
+    Returns (requeued, failed) counts.
+    """
+    cutoff = timezone.now() - timedelta(seconds=_setting('ANALYSIS_VISIBILITY_TIMEOUT', 600))
+    max_attempts = _setting('ANALYSIS_MAX_ATTEMPTS', 3)
+
+    # Rows from before the queue existed have no heartbeat; fall back to updated_at
+    stale = ExamUpload.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, updated_at__lt=cutoff),
+        status=ExamUpload.Status.PROCESSING,
+    )
+
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status=ExamUpload.Status.FAILED,
+        message=failure_message(FailureCode.WORKER_LOST, f"analysis worker stopped responding ({max_attempts} attempts)."),
+        finished_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status=ExamUpload.Status.PENDING,
+        message="Requeued after the previous worker stopped responding.",
+        worker_id='',
+        updated_at=timezone.now(),
+    )
+
+    stale_tasks = ExamTask.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=ExamUpload.Status.PROCESSING,
+    )
+    failed += stale_tasks.filter(attempts__gte=max_attempts).update(
+        status=ExamUpload.Status.FAILED,
+        message=failure_message(FailureCode.WORKER_LOST, f"worker stopped responding ({max_attempts} attempts)."),
+        finished_at=timezone.now(),
+    )
+    requeued += stale_tasks.filter(attempts__lt=max_attempts).update(status=ExamUpload.Status.PENDING, worker_id='')
+    return requeued, failed
+
+
+def run_worker(worker_id, stop_event=None, max_jobs=None, poll_interval=None):
+    """
+    Worker loop: claim -> process -> repeat. Uploads go first, then tasks
+    (deferred artifacts). Sleeps when both queues are empty.
+    Exits when stop_event is set (after finishing the current job) or after
+    max_jobs jobs, so the parent can recycle the process and its memory.
+    """
+    stop_event = stop_event or threading.Event()
+    poll_interval = poll_interval if poll_interval is not None else _setting('ANALYSIS_POLL_INTERVAL', 2)
+    done = 0
+
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            job = claim_next_job(worker_id)
+        except DatabaseError:
+            # Busy/locked database or a dropped connection: back off and try again
+            logger.exception("Worker %s could not claim a job", worker_id)
+            connection.close()
+            job = None
+        if job is None:
+            task = _claim_task(worker_id)
+            if task is None:
+                stop_event.wait(poll_interval)
+                continue
+            run_task(task)
+        else:
+            run_job(job)
+        done += 1
+        if max_jobs and done >= max_jobs:
+            break
+    connection.close()
+    return done
+
+
+def _claim_task(worker_id):
+    try:
+        return claim_next_task(worker_id)
+    except DatabaseError:
+        logger.exception("Worker %s could not claim a task", worker_id)
+        connection.close()
+        return None
+
+
+# --- 3. METRICS ---
+
+def queue_metrics(window_minutes=60):
+    """Queue depth, in-flight work and wait/run latency over the recent window."""
+    now = timezone.now()
+    by_status = dict(ExamUpload.objects.values_list('status').annotate(n=Count('id')).order_by())
+
+    oldest = (
+        ExamUpload.objects.filter(status=ExamUpload.Status.PENDING, queued_at__isnull=False)
+        .order_by('queued_at').values_list('queued_at', flat=True).first()
+    )
+
+    recent = ExamUpload.objects.filter(
+        finished_at__gte=now - timedelta(minutes=window_minutes),
+        queued_at__isnull=False, started_at__isnull=False,
+    ).values_list('queued_at', 'started_at', 'finished_at')[:1000]
+
+    waits, runs = [], []
+    for queued, started, finished in recent:
+        waits.append((started - queued).total_seconds())
+        runs.append((finished - started).total_seconds())
+
+    def stats(values):
+        if not values:
+            return {"count": 0, "avg": None, "p95": None, "max": None}
+        ordered = sorted(values)
+        return {
+            "count": len(ordered),
+            "avg": round(sum(ordered) / len(ordered), 2),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            "max": round(ordered[-1], 2),
+        }
+
+    return {
+        "queue_depth": by_status.get(ExamUpload.Status.PENDING, 0),
+        "tasks_pending": ExamTask.objects.filter(status=ExamUpload.Status.PENDING).count(),
+        "in_flight": by_status.get(ExamUpload.Status.PROCESSING, 0),
+        "by_status": by_status,
+        "oldest_pending_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+        "window_minutes": window_minutes,
+        "wait_seconds": stats(waits),
+        "run_seconds": stats(runs),
+    }
+
@@ -0,0 +1,86 @@
+# backend/analytics/management/commands/benchmark_charts.py
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from analytics import benchmarks
+from analytics.benchmarks import graded_frame
+from analytics.visualizer import GRADE_ORDER, ChartEngine
+
+
+class Command(BaseCommand):
+    help = "Charts per second: the old pyplot functions vs ChartEngine (cold, cached and multi-threaded)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--charts', type=int, default=60, help="Distinct datasets per chart type.")
+        parser.add_argument('--subjects', type=int, default=12)
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=4, help="Threads sharing one engine in the last run.")
+
+    def handle(self, *args, **options):
+        warnings.filterwarnings('ignore', category=FutureWarning)  # seaborn palette warning in the pyplot reference
+        datasets = self._datasets(options['charts'], options['subjects'], options['students'])
+        n_charts = len(datasets) * 3
+
+        pyplot = (
+            benchmarks.pyplot_subject_performance_chart,
+            benchmarks.pyplot_pass_rate_chart,
+            benchmarks.pyplot_grade_distribution_chart,
+        )
+        cold = ChartEngine(cache_size=0)
+        cached = ChartEngine()
+        shared = ChartEngine(cache_size=0)
+
+        self.stdout.write(f"{n_charts} charts ({len(datasets)} datasets x 3 chart types)")
+        self.stdout.write(f"{'renderer':<28} {'seconds':>8} {'charts/s':>9} {'speedup':>8}")
+
+        baseline = self._report("pyplot (current functions)", self._run(pyplot, datasets), n_charts)
+        self._report("ChartEngine, no cache", self._run(self._charts(cold), datasets), n_charts, baseline)
+
+        self._run(self._charts(cached), datasets)  # warm the cache
+        self._report("ChartEngine, cached", self._run(self._charts(cached), datasets), n_charts, baseline)
+
+        threads = options['threads']
+        chunks = [datasets[i::threads] for i in range(threads)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(lambda chunk: self._run(self._charts(shared), chunk), chunks))
+        self._report(f"ChartEngine, {threads} threads", time.perf_counter() - start, n_charts, baseline)
+
+    def _datasets(self, count, subjects, students):
+        rng = np.random.default_rng(7)
+        df = graded_frame(students, subjects)
+        names = list(df.columns[3:3 + subjects])
+        datasets = []
+        for _ in range(count):
+            # Shift the scores so every dataset plots something different
+            shifted = df.copy()
+            shifted['Average'] = np.clip(df['Average'] + rng.normal(0, 8), 0, 100)
+            means = pd.DataFrame({'Subject': names, 'Mean Score': rng.uniform(30, 85, size=subjects).round(2)})
+            shifted['Overall Grade'] = rng.choice(GRADE_ORDER, size=len(df))
+            datasets.append((means, shifted))
+        return datasets
+
+    @staticmethod
+    def _charts(engine):
+        return engine.subject_performance_chart, engine.pass_rate_chart, engine.grade_distribution_chart
+
+    @staticmethod
+    def _run(charts, datasets):
+        subject_chart, pass_chart, grade_chart = charts
+        start = time.perf_counter()
+        for means, df in datasets:
+            subject_chart(means).read()
+            pass_chart(df).read()
+            grade_chart(df).read()
+        return time.perf_counter() - start
+
+    def _report(self, label, seconds, n_charts, baseline=None):
+        speedup = f"{baseline / seconds:>7.1f}x" if baseline else f"{'1.0x':>8}"
+        self.stdout.write(f"{label:<28} {seconds:>8.2f} {n_charts / seconds:>9.1f} {speedup}")
+        return seconds
+
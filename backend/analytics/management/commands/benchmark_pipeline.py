@@ -0,0 +1,153 @@
+# backend/analytics/management/commands/benchmark_pipeline.py
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+from django.utils import timezone
+
+from analytics.analysis import process_exam_file
+from analytics.benchmarks import compare_results, messy_scores, sheet_bytes, synthetic_scores
+from analytics.instrumentation import STAGES
+from analytics.models import ExamUpload
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the full analysis pipeline on synthetic sheets and reports every stage's time and peak memory. "
+        "Runs offline against a throwaway test database and a temporary MEDIA_ROOT, so the dev database "
+        "and media folder are never touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', default='50,500,2000',
+                            help="Comma-separated class sizes (the generators handle up to 100000).")
+        parser.add_argument('--subjects', type=int, default=12)
+        parser.add_argument('--formats', default='csv,xlsx', help="Comma-separated: csv, xlsx.")
+        parser.add_argument('--clean', action='store_true', help="Tidy sheets instead of messy headers/missing values.")
+        parser.add_argument('--repeat', type=int, default=1, help="Runs per scenario (the fastest is kept per stage).")
+        parser.add_argument('--prefetch', default='all',
+                            help="ARTIFACT_PREFETCH for the runs (default: render every artifact, like an eager pipeline).")
+        parser.add_argument('--report-workers', type=int, default=None, help="Override REPORT_WORKERS.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--save-baseline', metavar='PATH', help="Write the results as the new baseline.")
+        parser.add_argument('--baseline', metavar='PATH', help="Compare against this baseline and fail on regressions.")
+        parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown per stage (0.25 = 25%%).")
+        parser.add_argument('--min-seconds', type=float, default=0.05,
+                            help="Ignore slowdowns smaller than this many seconds (timer noise).")
+
+    def handle(self, *args, **options):
+        sizes = [int(x) for x in options['students'].split(',')]
+        formats = [x.strip() for x in options['formats'].split(',')]
+        if set(formats) - {'csv', 'xlsx'}:
+            raise CommandError("--formats accepts csv and xlsx")
+
+        results = {
+            'meta': {
+                'recorded_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpu_count': os.cpu_count(),
+                'subjects': options['subjects'],
+                'messy': not options['clean'],
+                'prefetch': options['prefetch'],
+            },
+            'scenarios': {},
+        }
+
+        media_root = tempfile.mkdtemp(prefix='exam-bench-')
+        overrides = {
+            'MEDIA_ROOT': media_root, 'RESULT_CACHE_ENABLED': False, 'ANALYSIS_PROFILE_ALL': False,
+            'ARTIFACT_PREFETCH': options['prefetch'],
+        }
+        if options['report_workers'] is not None:
+            overrides['REPORT_WORKERS'] = options['report_workers']
+        old_databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**overrides):
+                for students in sizes:
+                    for fmt in formats:
+                        name = f"{fmt}-{students}x{options['subjects']}"
+                        self.stdout.write(f"Running {name}...")
+                        results['scenarios'][name] = self._run_scenario(students, fmt, options)
+        finally:
+            teardown_databases(old_databases, verbosity=0)
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self._print_table(results)
+
+        for path in (options['output'], options['save_baseline']):
+            if path:
+                with open(path, 'w') as fh:
+                    json.dump(results, fh, indent=2)
+                self.stdout.write(f"Wrote {path}")
+
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                baseline = json.load(fh)
+            regressions = compare_results(baseline, results, options['threshold'], options['min_seconds'])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(f"REGRESSION {line}")
+                raise CommandError(f"{len(regressions)} stage(s) regressed past {options['threshold']:.0%}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _run_scenario(self, students, fmt, options):
+        generate = synthetic_scores if options['clean'] else messy_scores
+        payload = sheet_bytes(generate(students, options['subjects']), fmt)
+
+        best = {}
+        total = None
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            timings = self._run_once(payload, fmt)
+            elapsed = time.perf_counter() - started
+            total = elapsed if total is None else min(total, elapsed)
+            for t in timings:
+                kept = best.get(t['stage'])
+                if kept is None or t['wall_seconds'] < kept['wall_seconds']:
+                    best[t['stage']] = t
+
+        stages = {stage: best[stage] for stage in STAGES if stage in best}
+        return {
+            'students': students,
+            'format': fmt,
+            'file_bytes': len(payload),
+            'total_seconds': round(total, 4),
+            'peak_rss_bytes': max(t['peak_rss_bytes'] for t in stages.values()),
+            'stages': stages,
+        }
+
+    def _run_once(self, payload, fmt):
+        """One pipeline run on a fresh upload; returns its StageTiming rows."""
+        user, _ = User.objects.get_or_create(username='benchmark')
+        exam = ExamUpload(title="Benchmark Exam", uploaded_by=user)
+        exam.file.save(f"bench.{fmt}", ContentFile(payload), save=False)
+        exam.save()
+
+        process_exam_file(exam)
+        if exam.status != ExamUpload.Status.COMPLETED:
+            raise CommandError(f"Pipeline failed: {exam.message}")
+        timings = list(exam.stage_timings.values('stage', 'outcome', 'wall_seconds', 'cpu_seconds', 'peak_rss_bytes'))
+        exam.delete()  # django_cleanup removes the artifacts
+        return timings
+
+    def _print_table(self, results):
+        stages = list(STAGES)
+        self.stdout.write("")
+        self.stdout.write(f"{'scenario':<18}" + "".join(f"{s:>13}" for s in stages) + f"{'total':>9}{'peak MB':>9}")
+        for name, result in results['scenarios'].items():
+            cells = "".join(
+                f"{result['stages'][s]['wall_seconds']:>12.3f}s" if s in result['stages'] else f"{'-':>13}"
+                for s in stages
+            )
+            self.stdout.write(
+                f"{name:<18}{cells}{result['total_seconds']:>8.2f}s{result['peak_rss_bytes'] / 1e6:>9.0f}"
+            )
@@ -0,0 +1,58 @@
+# backend/analytics/management/commands/benchmark_report_inputs.py
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from analytics.benchmarks import fake_exam, graded_frame, iterrows_payloads
+from analytics.grading import compile_grading_scheme
+from analytics.utils import report_card_inputs
+
+
+class Command(BaseCommand):
+    help = "Per-student cost of building report card payloads: df.iterrows + row.get vs columnar records."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--subjects', type=int, default=12)
+        parser.add_argument('--repeat', type=int, default=3, help="Runs per method (best time is reported).")
+
+    def handle(self, *args, **options):
+        df = graded_frame(options['students'], options['subjects'])
+        exam = fake_exam()
+        grading = compile_grading_scheme(exam.grading_scheme)
+        subject_cols = list(df.columns[3:3 + options['subjects']])
+        adm_col = 'Adm No'
+
+        def iterrows():
+            # Everything the old report_card_inputs did per exam, then its row loop
+            score_matrix = df[subject_cols].apply(pd.to_numeric, errors='coerce').fillna(0.0).to_numpy(dtype=float)
+            grades, remarks, _ = grading.grade(score_matrix)
+            return list(iterrows_payloads(df, adm_col, score_matrix, grades, remarks))
+
+        def columnar():
+            _, _, student_payloads = report_card_inputs(df, exam, grading=grading)
+            return list(student_payloads())
+
+        if iterrows() != columnar():
+            self.stderr.write("Payloads differ between the two methods!")
+
+        self.stdout.write(f"{len(df)} students x {options['subjects']} subjects")
+        self.stdout.write(f"{'method':<24} {'seconds':>8} {'us/student':>11} {'speedup':>8}")
+        baseline = self._report("iterrows + row.get", self._best(iterrows, options['repeat']), len(df))
+        self._report("columnar records", self._best(columnar, options['repeat']), len(df), baseline)
+
+    @staticmethod
+    def _best(build, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            build()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _report(self, label, seconds, students, baseline=None):
+        speedup = f"{baseline / seconds:>7.1f}x" if baseline else f"{'1.0x':>8}"
+        self.stdout.write(f"{label:<24} {seconds:>8.3f} {seconds / students * 1e6:>11.1f} {speedup}")
+        return seconds
@@ -0,0 +1,88 @@
+# backend/analytics/management/commands/benchmark_reports.py
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.benchmarks import canvas_report_card, fake_exam, graded_frame
+from analytics.report_template import ReportTemplate
+from analytics.utils import generate_student_reports, report_card_inputs
+
+
+class Command(BaseCommand):
+    help = (
+        "Times report-card generation for a synthetic class at several worker counts, "
+        "after comparing per-page cost: full canvas drawing vs the report template."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=2000)
+        parser.add_argument('--subjects', type=int, default=12)
+        parser.add_argument('--workers', default=None,
+                            help="Comma-separated worker counts (default: 1,2,4,... up to the CPU count).")
+        parser.add_argument('--repeat', type=int, default=1, help="Runs per worker count (best time is reported).")
+        parser.add_argument('--pages', type=int, default=300, help="Cards rendered serially for the per-page comparison.")
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        if options['workers']:
+            counts = [int(x) for x in options['workers'].split(',')]
+        else:
+            counts = [1]
+            while counts[-1] * 2 <= cores:
+                counts.append(counts[-1] * 2)
+            if counts[-1] != cores:
+                counts.append(cores)
+
+        df = graded_frame(options['students'], options['subjects'])
+        exam = fake_exam()
+        self.stdout.write(f"{options['students']} students x {options['subjects']} subjects, {cores} CPU core(s)")
+        self._compare_renderers(df, exam, options['pages'])
+
+        self.stdout.write(f"{'workers':>8} {'seconds':>9} {'pdf/s':>8} {'speedup':>8} {'zip MB':>7}")
+
+        baseline = None
+        for workers in counts:
+            best = None
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                with generate_student_reports(df, exam, workers=workers) as zip_file:
+                    elapsed = time.perf_counter() - start
+                    size_mb = zip_file.seek(0, 2) / 1e6
+                best = elapsed if best is None else min(best, elapsed)
+            baseline = baseline or best
+            self.stdout.write(
+                f"{workers:>8} {best:>9.2f} {len(df) / best:>8.0f} {baseline / best:>7.2f}x {size_mb:>7.2f}"
+            )
+
+    def _compare_renderers(self, df, exam, pages):
+        header, _, student_payloads = report_card_inputs(df.head(pages), exam)
+        students = list(student_payloads())
+        n_pages = len(students)
+
+        def per_card(render):
+            start = time.perf_counter()
+            size = sum(len(render(header, student)[1]) for student in students)
+            return time.perf_counter() - start, size
+
+        def template_cards(header, student):
+            return template.render(student)
+
+        start = time.perf_counter()
+        template = ReportTemplate(header)
+        build = time.perf_counter() - start
+
+        self.stdout.write(f"\n{n_pages} cards, serial (template built once in {build * 1000:.1f}ms)")
+        self.stdout.write(f"{'renderer':<28} {'ms/page':>8} {'KB/page':>8} {'speedup':>8}")
+        baseline, _ = self._row("canvas, one PDF per card", *per_card(canvas_report_card), n_pages)
+        self._row("template, one PDF per card", *per_card(template_cards), n_pages, baseline)
+
+        start = time.perf_counter()
+        size = len(template.render_class(students))
+        self._row("template, class PDF", time.perf_counter() - start, size, n_pages, baseline)
+        self.stdout.write("")
+
+    def _row(self, label, seconds, size, n_pages, baseline=None):
+        speedup = f"{baseline / seconds:>7.2f}x" if baseline else f"{'1.00x':>8}"
+        self.stdout.write(f"{label:<28} {seconds / n_pages * 1000:>8.2f} {size / n_pages / 1024:>8.2f} {speedup}")
+        return seconds, size
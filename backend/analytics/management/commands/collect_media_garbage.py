@@ -0,0 +1,22 @@
+# backend/analytics/management/commands/collect_media_garbage.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from analytics.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes content-addressed artifact blobs that no upload or cache entry references "
+        "(run_analysis_workers also does this every MEDIA_GC_INTERVAL seconds)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=getattr(settings, 'MEDIA_GC_GRACE', 24 * 3600),
+                            help="Keep blobs younger than this many seconds (default: MEDIA_GC_GRACE).")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        removed, freed = collect_garbage(grace_seconds=options['grace'], dry_run=options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} blob(s), {freed / 1024 ** 2:.1f} MB."))
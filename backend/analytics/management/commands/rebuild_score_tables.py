@@ -0,0 +1,34 @@
+# backend/analytics/management/commands/rebuild_score_tables.py
+from django.core.management.base import BaseCommand
+
+from analytics.ingest import load_frame
+from analytics.models import ExamUpload
+from analytics.scores import store_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the score tables and trend rollups from each completed exam's graded snapshot "
+        "(for exams analyzed before the tables existed). Never re-reads the uploaded sheets."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild every completed exam, not just those without rows.")
+
+    def handle(self, *args, **options):
+        exams = ExamUpload.objects.filter(status=ExamUpload.Status.COMPLETED).exclude(analysis_data='')
+        if not options['all']:
+            exams = exams.filter(subject_rollups__isnull=True)
+
+        stored = skipped = 0
+        for exam in exams.distinct().iterator():
+            df = load_frame(exam.analysis_data)
+            subjects = (exam.pipeline_state or {}).get('subjects')
+            if df is None or not subjects:
+                skipped += 1
+                continue
+            rows = store_scores(exam, df, subjects)
+            stored += 1
+            self.stdout.write(f"{exam.title}: {rows} scores")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {stored} exam(s), skipped {skipped} without a snapshot."))
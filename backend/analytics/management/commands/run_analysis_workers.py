@@ -0,0 +1,102 @@
+# backend/analytics/management/commands/run_analysis_workers.py
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from analytics.jobs import queue_metrics, requeue_stale_jobs, run_worker, worker_name
+from analytics.storage import collect_garbage
+
+logger = logging.getLogger(__name__)
+
+
+def _worker_main(index, max_jobs, poll_interval):
+    """Entry point of one pool process. SIGTERM finishes the current job, then exits."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    run_worker(worker_name(index), stop_event=stop, max_jobs=max_jobs, poll_interval=poll_interval)
+
+
+class Command(BaseCommand):
+    help = "Runs a bounded pool of analysis worker processes that drain the ExamUpload queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'ANALYSIS_WORKERS', 2),
+                            help="Number of worker processes (default: ANALYSIS_WORKERS).")
+        parser.add_argument('--max-jobs-per-worker', type=int, default=50,
+                            help="Recycle a worker process after this many jobs (frees pandas/matplotlib memory). 0 = never.")
+        parser.add_argument('--poll-interval', type=float, default=getattr(settings, 'ANALYSIS_POLL_INTERVAL', 2))
+        parser.add_argument('--reap-interval', type=float, default=30,
+                            help="Seconds between visibility-timeout sweeps.")
+        parser.add_argument('--metrics', action='store_true', help="Print queue metrics as JSON and exit.")
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.stdout.write(json.dumps(queue_metrics(), indent=2, default=str))
+            return
+
+        workers = max(1, options['workers'])
+        max_jobs = options['max_jobs_per_worker'] or None
+        poll = options['poll_interval']
+
+        # Pool processes are forked from this already-configured Django process.
+        # Without fork (Windows) fall back to a single in-process worker.
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            self.stdout.write("fork() unavailable, running a single in-process worker.")
+            requeue_stale_jobs()
+            run_worker(worker_name(), poll_interval=poll)
+            return
+        ctx = multiprocessing.get_context('fork')
+
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+        def spawn(index):
+            connections.close_all()  # Never share a DB socket with a child
+            proc = ctx.Process(target=_worker_main, args=(index, max_jobs, poll), name=f"analysis-worker-{index}")
+            proc.start()
+            return proc
+
+        pool = {i: spawn(i) for i in range(workers)}
+        self.stdout.write(self.style.SUCCESS(f"Started {workers} analysis worker(s)."))
+
+        last_reap = 0
+        gc_interval = getattr(settings, 'MEDIA_GC_INTERVAL', 6 * 3600)
+        last_gc = time.monotonic()  # First sweep one interval after start, not during a deploy
+        while not stopping.is_set():
+            if time.monotonic() - last_reap >= options['reap_interval']:
+                requeued, failed = requeue_stale_jobs()
+                if requeued or failed:
+                    self.stdout.write(f"Visibility timeout: requeued {requeued}, failed {failed}.")
+                last_reap = time.monotonic()
+
+            # Artifact blobs nothing references any more (see analytics/storage.py)
+            if gc_interval and time.monotonic() - last_gc >= gc_interval:
+                try:
+                    removed, freed = collect_garbage()
+                    if removed:
+                        self.stdout.write(f"Media GC: removed {removed} blob(s), {freed / 1024 ** 2:.1f} MB.")
+                except Exception:
+                    logger.exception("Media GC error")
+                last_gc = time.monotonic()
+
+            # Replace workers that exited (recycled after max jobs, or crashed)
+            for i, proc in list(pool.items()):
+                if not proc.is_alive():
+                    proc.join()
+                    pool[i] = spawn(i)
+            stopping.wait(1)
+
+        self.stdout.write("Shutting down, waiting for running jobs to finish...")
+        for proc in pool.values():
+            proc.terminate()  # SIGTERM: the worker finishes its current job first
+        for proc in pool.values():
+            proc.join()
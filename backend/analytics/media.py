@@ -0,0 +1,221 @@
+# backend/analytics/media.py
+"""
+Media delivery.
+
+Uploads and artifacts are private to their uploader. The API hands out signed
+/media/ links (signed_media_url), so <img> tags and plain downloads work
+without an Authorization header; the /media/ view checks the signature (or a
+staff session) and serves the file with:
+
+- conditional GETs: ETag from size + mtime, Last-Modified (304s);
+- single byte ranges (206, 416, If-Range) so interrupted downloads resume;
+- Cache-Control: private. Content-addressed blobs (analytics/storage.py) and
+  links carrying the file's current version (?v=) never change content, so
+  they are cached for a year as immutable;
+- precompressed .gz variants for gzip clients (whole-file requests only);
+- optional offload (MEDIA_OFFLOAD): 'nginx' answers with X-Accel-Redirect to
+  MEDIA_ACCEL_PREFIX, 'sendfile' with X-Sendfile. The web server then streams
+  the bytes (and ranges) and the Python worker is free straight away.
+"""
+
+import mimetypes
+import os
+import re
+import time
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .storage import gzip_variant, is_content_addressed
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = 'private, max-age=31536000, immutable'
+REVALIDATE = 'private, no-cache'
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_signer = signing.Signer(salt='analytics.media')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def file_version(st):
+    """Changes whenever the file is rewritten (size + mtime): the ETag and the ?v= of links."""
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def stored_version(fieldfile):
+    try:
+        return file_version(os.stat(fieldfile.path))
+    except (OSError, ValueError, NotImplementedError):
+        return ''
+
+
+# --- 1. SIGNED LINKS ---
+
+def _expiry():
+    """TTL from now, rounded up to the day so a file's link is stable (and cacheable) for the day."""
+    ttl = _setting('MEDIA_URL_TTL', 7 * 24 * 3600)
+    return (int(time.time()) + ttl) // 86400 * 86400 + 86400
+
+
+def _signature(name, version, expires):
+    return _signer.signature(f"{name}|{version}|{expires}")
+
+
+def signed_media_url(fieldfile):
+    """MEDIA_URL link to a stored file that the /media/ view accepts without a login."""
+    version = stored_version(fieldfile)
+    expires = _expiry()
+    query = urlencode({'v': version, 'exp': expires, 'sig': _signature(fieldfile.name, version, expires)})
+    return f"{fieldfile.url}?{query}"
+
+
+def _signature_valid(name, params):
+    try:
+        expires = int(params.get('exp', ''))
+    except ValueError:
+        return False
+    if expires < time.time():
+        return False
+    return constant_time_compare(params.get('sig', ''), _signature(name, params.get('v', ''), expires))
+
+
+# --- 2. SERVING ---
+
+def _byte_range(header, size):
+    """
+    (start, end) inclusive for one satisfiable range, None to send the whole file
+    (no header, or several ranges), False when the range can't be satisfied.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # suffix: the last N bytes
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else False
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _if_range_matches(request, etag, mtime):
+    """No If-Range, or one naming the current version: the Range header applies."""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == mtime
+
+
+def _offloaded(path, content_type, disposition):
+    mode = _setting('MEDIA_OFFLOAD', '')
+    if mode == 'nginx':
+        rel = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        header, value = 'X-Accel-Redirect', _setting('MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(rel)
+    elif mode == 'sendfile':
+        header, value = 'X-Sendfile', path
+    else:
+        return None
+    response = HttpResponse(content_type=content_type)
+    response[header] = value
+    if disposition:
+        response['Content-Disposition'] = disposition
+    return response
+
+
+def serve_file(request, path, filename=None, as_attachment=False):
+    """
+    Response for one file on disk (conditional GET, Range, caching, offload).
+    Authorization is the caller's job.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise Http404("File not found.")
+    version = file_version(st)
+    etag = quote_etag(version)
+    mtime = int(st.st_mtime)
+    filename = filename or os.path.basename(path)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(as_attachment, filename)
+
+    # The .gz variant is a different representation: its own ETag, and no byte ranges
+    # (offloading web servers pick .gz siblings themselves, e.g. nginx gzip_static)
+    serve_gz = not _setting('MEDIA_OFFLOAD', '') and _accepts_gzip(request) and not request.META.get('HTTP_RANGE')
+    gz_path = gzip_variant(path) if serve_gz else None
+    if gz_path:
+        etag = quote_etag(f"{version}-gz")
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        response = _offloaded(path, content_type, disposition)
+    if response is None:
+        span = _byte_range(request.META.get('HTTP_RANGE'), st.st_size) if _if_range_matches(request, etag, mtime) else None
+        if gz_path:
+            response = FileResponse(open(gz_path, 'rb'), as_attachment=as_attachment, filename=filename)
+            response['Content-Type'] = content_type
+            response['Content-Encoding'] = 'gzip'
+        elif span is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{st.st_size}"
+        elif span is not None:
+            start, end = span
+            response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f"bytes {start}-{end}/{st.st_size}"
+            response['Content-Disposition'] = disposition
+        else:
+            response = FileResponse(open(path, 'rb'), as_attachment=as_attachment, filename=filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+    immutable = request.GET.get('v') == version or is_content_addressed(os.path.relpath(path, settings.MEDIA_ROOT))
+    response['Cache-Control'] = IMMUTABLE if immutable else REVALIDATE
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _accepts_gzip(request):
+    return 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '').lower()
+
+
+def protected_media(request, path):
+    """
+    /media/<path>: signed links from the API, or any file for a staff session
+    (the admin's file links).
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    user = getattr(request, 'user', None)
+    if not (_signature_valid(path, request.GET) or (user is not None and user.is_staff)):
+        return HttpResponseForbidden("This link is invalid or has expired.")
+    return serve_file(request, full_path)
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_userprofile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life from the worker running this job.', null=True),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='queued_at',
+            field=models.DateTimeField(blank=True, help_text='When the upload entered the analysis queue.', null=True),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='worker_id',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='examupload',
+            index=models.Index(fields=['status', 'queued_at'], name='exam_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_exam_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('analysis_summary', models.JSONField(blank=True, default=dict)),
+                ('processed_file', models.FileField(blank=True, null=True, upload_to='cache/%Y/%m/')),
+                ('subject_chart', models.ImageField(blank=True, null=True, upload_to='cache/%Y/%m/')),
+                ('passrate_chart', models.ImageField(blank=True, null=True, upload_to='cache/%Y/%m/')),
+                ('reports_zip', models.FileField(blank=True, null=True, upload_to='cache/%Y/%m/')),
+                ('size_bytes', models.BigIntegerField(default=0, help_text='Total size of the cached artifacts.')),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Result Cache Entry',
+                'verbose_name_plural': 'Result Cache Entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResultCacheStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('misses', models.PositiveBigIntegerField(default=0)),
+                ('evictions', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Result Cache Stats',
+                'verbose_name_plural': 'Result Cache Stats',
+            },
+        ),
+    ]
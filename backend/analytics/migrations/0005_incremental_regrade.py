@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0004_result_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='analysis_data',
+            field=models.FileField(blank=True, help_text='Totals, ranks and grades from the last run.', null=True, upload_to='intermediate/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='parsed_data',
+            field=models.FileField(blank=True, help_text='Parsed sheet snapshot, so re-grades skip reading the file.', null=True, upload_to='intermediate/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='pipeline_state',
+            field=models.JSONField(blank=True, default=dict, help_text="Detected subjects, stage input fingerprints and the last run's stage report."),
+        ),
+    ]
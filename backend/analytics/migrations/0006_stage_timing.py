@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0005_incremental_regrade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='profile_enabled',
+            field=models.BooleanField(default=False, help_text='Capture a cProfile of the next analysis run.'),
+        ),
+        migrations.AddField(
+            model_name='examupload',
+            name='profile_file',
+            field=models.FileField(blank=True, help_text='cProfile stats of the last profiled run (open with pstats or snakeviz).', null=True, upload_to='profiles/%Y/%m/'),
+        ),
+        migrations.CreateModel(
+            name='StageTiming',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=30)),
+                ('order', models.PositiveSmallIntegerField(default=0)),
+                ('outcome', models.CharField(default='ran', help_text='ran, skipped (reused from the previous run) or failed.', max_length=10)),
+                ('wall_seconds', models.FloatField(default=0)),
+                ('cpu_seconds', models.FloatField(default=0, help_text='Includes the report-rendering worker processes.')),
+                ('peak_rss_bytes', models.BigIntegerField(default=0)),
+                ('recorded_at', models.DateTimeField(auto_now_add=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_timings', to='analytics.examupload')),
+            ],
+            options={
+                'verbose_name': 'Stage Timing',
+                'verbose_name_plural': 'Stage Timings',
+                'ordering': ['exam', 'order'],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-17 21:55
+
+import analytics.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_stage_timing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='stream_artifacts',
+            field=models.FileField(blank=True, help_text='Batch uploads: per-stream broadsheets and charts.', null=True, upload_to='reports/%Y/%m/%d/'),
+        ),
+        migrations.AddField(
+            model_name='resultcacheentry',
+            name='stream_artifacts',
+            field=models.FileField(blank=True, null=True, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='examupload',
+            name='file',
+            field=models.FileField(help_text='Upload your exam data file here (Excel or CSV), or a ZIP / multi-sheet workbook with one sheet per stream', upload_to=analytics.models.exam_upload_path, validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['xlsx', 'xls', 'csv', 'zip'])]),
+        ),
+    ]
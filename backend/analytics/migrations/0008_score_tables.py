@@ -0,0 +1,118 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_batch_uploads'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultcacheentry',
+            name='analysis_data',
+            field=models.FileField(blank=True, null=True, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AddField(
+            model_name='resultcacheentry',
+            name='subjects',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text="Normalized admission number, or 'name:<NAME>'.", max_length=150)),
+                ('adm_no', models.CharField(blank=True, default='', max_length=50)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='students', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Student',
+                'verbose_name_plural': 'Students',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExamResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stream', models.CharField(blank=True, default='', max_length=100)),
+                ('total', models.FloatField(default=0)),
+                ('average', models.FloatField(default=0)),
+                ('rank', models.PositiveIntegerField(default=0)),
+                ('grade', models.CharField(blank=True, default='', max_length=10)),
+                ('points', models.FloatField(default=0)),
+                ('exam', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='analytics.examupload')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='results', to='analytics.student')),
+            ],
+            options={
+                'verbose_name': 'Exam Result',
+                'verbose_name_plural': 'Exam Results',
+                'ordering': ['exam', 'rank'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Subject',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Lower-cased, trimmed column header.', max_length=100)),
+                ('name', models.CharField(max_length=100)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Subject',
+                'verbose_name_plural': 'Subjects',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Score',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('grade', models.CharField(blank=True, default='', max_length=10)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='analytics.examupload')),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='analytics.student')),
+                ('subject', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='scores', to='analytics.subject')),
+            ],
+            options={
+                'verbose_name': 'Score',
+                'verbose_name_plural': 'Scores',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['owner', 'name'], name='student_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='student',
+            constraint=models.UniqueConstraint(fields=('owner', 'key'), name='unique_student_per_school'),
+        ),
+        migrations.AddIndex(
+            model_name='examresult',
+            index=models.Index(fields=['student', 'exam'], name='result_student_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='examresult',
+            constraint=models.UniqueConstraint(fields=('exam', 'student'), name='unique_result_per_exam'),
+        ),
+        migrations.AddConstraint(
+            model_name='subject',
+            constraint=models.UniqueConstraint(fields=('owner', 'key'), name='unique_subject_per_school'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['student', 'subject'], name='score_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='score',
+            index=models.Index(fields=['subject', 'exam'], name='score_subject_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_score_tables'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examresult',
+            name='class_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='examresult',
+            name='percentile',
+            field=models.FloatField(default=0, help_text='Share of the class ranked at or below this student (100 = top).'),
+        ),
+        migrations.AddField(
+            model_name='examresult',
+            name='z_score',
+            field=models.FloatField(default=0, help_text='(average - class mean) / class standard deviation.'),
+        ),
+        migrations.CreateModel(
+            name='SubjectRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('students', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0)),
+                ('std', models.FloatField(default=0)),
+                ('highest', models.FloatField(default=0)),
+                ('lowest', models.FloatField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0, help_text='Students scoring 50 or more.')),
+                ('exam', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='subject_rollups', to='analytics.examupload')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='analytics.subject')),
+            ],
+            options={
+                'verbose_name': 'Subject Rollup',
+                'verbose_name_plural': 'Subject Rollups',
+                'constraints': [models.UniqueConstraint(fields=('exam', 'subject'), name='unique_rollup_per_exam')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0009_trend_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='progress',
+            field=models.JSONField(blank=True, default=dict, help_text='Live pipeline progress: current stage, stages done/total, percent and whether the summary is ready.'),
+        ),
+    ]
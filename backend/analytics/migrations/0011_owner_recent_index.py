@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0010_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='examupload',
+            index=models.Index(fields=['uploaded_by', '-uploaded_at'], name='exam_owner_recent_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:41
+
+import analytics.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0011_owner_recent_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='examupload',
+            name='passrate_chart',
+            field=models.ImageField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='charts/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='examupload',
+            name='processed_file',
+            field=models.FileField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='results/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='examupload',
+            name='reports_zip',
+            field=models.FileField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='reports/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='examupload',
+            name='stream_artifacts',
+            field=models.FileField(blank=True, help_text='Batch uploads: per-stream broadsheets and charts.', null=True, storage=analytics.storage.artifact_storage, upload_to='reports/%Y/%m/%d/'),
+        ),
+        migrations.AlterField(
+            model_name='examupload',
+            name='subject_chart',
+            field=models.ImageField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='charts/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='resultcacheentry',
+            name='passrate_chart',
+            field=models.ImageField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='resultcacheentry',
+            name='processed_file',
+            field=models.FileField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='resultcacheentry',
+            name='reports_zip',
+            field=models.FileField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='resultcacheentry',
+            name='stream_artifacts',
+            field=models.FileField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='cache/%Y/%m/'),
+        ),
+        migrations.AlterField(
+            model_name='resultcacheentry',
+            name='subject_chart',
+            field=models.ImageField(blank=True, null=True, storage=analytics.storage.artifact_storage, upload_to='cache/%Y/%m/'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:04
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+NON_WORD = re.compile(r'[^0-9A-Z]+')
+
+
+def backfill_search_names(apps, schema_editor):
+    """Same normalization as analytics.identity.search_name (migrations don't import app code)."""
+    Student = apps.get_model('analytics', 'Student')
+    batch = []
+    for student in Student.objects.only('id', 'name').iterator(chunk_size=2000):
+        student.search_name = ' '.join(sorted(NON_WORD.sub(' ', student.name.upper()).split()))
+        batch.append(student)
+        if len(batch) >= 2000:
+            Student.objects.bulk_update(batch, ['search_name'])
+            batch = []
+    Student.objects.bulk_update(batch, ['search_name'])
+
+
+def add_trigram_index(apps, schema_editor):
+    """Postgres only: a pg_trgm GIN index for substring matches on names."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS student_search_trgm_idx '
+        'ON analytics_student USING gin (search_name gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS student_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0012_artifact_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_name',
+            field=models.CharField(blank=True, default='', help_text='Upper-cased name words in alphabetical order (analytics.identity.search_name).', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='upi',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.RunPython(backfill_search_names, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['owner', 'adm_no'], name='student_adm_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['owner', 'upi'], name='student_upi_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['owner', 'search_name'], name='student_search_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+        ),
+        migrations.RunPython(add_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_student_identity_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='incremental',
+            field=models.BooleanField(default=False, help_text='Regrade job: reuse the parsed sheet and skip unchanged stages.'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:19
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def seed_totals(apps, schema_editor):
+    """Start the counters from the timings already recorded (each exam's last run)."""
+    StageTiming = apps.get_model('analytics', 'StageTiming')
+    StageTotal = apps.get_model('analytics', 'StageTotal')
+    rows = StageTiming.objects.values('stage', 'outcome').annotate(
+        runs=Count('id'), wall=Sum('wall_seconds'), cpu=Sum('cpu_seconds'),
+    ).order_by()
+    StageTotal.objects.bulk_create([
+        StageTotal(stage=r['stage'], outcome=r['outcome'], runs=r['runs'],
+                   wall_seconds=r['wall'] or 0, cpu_seconds=r['cpu'] or 0)
+        for r in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0014_exam_incremental_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StageTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stage', models.CharField(max_length=30)),
+                ('outcome', models.CharField(max_length=10)),
+                ('runs', models.PositiveBigIntegerField(default=0)),
+                ('wall_seconds', models.FloatField(default=0)),
+                ('cpu_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Stage Total',
+                'verbose_name_plural': 'Stage Totals',
+                'ordering': ['stage', 'outcome'],
+                'constraints': [models.UniqueConstraint(fields=('stage', 'outcome'), name='unique_stage_total')],
+            },
+        ),
+        migrations.RunPython(seed_totals, migrations.RunPython.noop),
+    ]
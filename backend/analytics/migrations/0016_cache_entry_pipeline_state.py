@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0015_stage_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resultcacheentry',
+            name='pipeline_state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
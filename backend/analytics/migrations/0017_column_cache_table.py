@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:40
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    """Tables of the database caches in CACHES (the shared 'columns' cache); a no-op for Redis."""
+    call_command('createcachetable', database=schema_editor.connection.alias, verbosity=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0016_cache_entry_pipeline_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_tokens(apps, schema_editor):
+    """One token per word of every existing student's search_name."""
+    Student = apps.get_model('analytics', 'Student')
+    StudentNameToken = apps.get_model('analytics', 'StudentNameToken')
+    batch = []
+    for student in Student.objects.only('id', 'owner_id', 'search_name').iterator(chunk_size=2000):
+        batch.extend(
+            StudentNameToken(student_id=student.id, owner_id=student.owner_id, token=token[:100])
+            for token in set(student.search_name.split())
+        )
+        if len(batch) >= 5000:
+            StudentNameToken.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    StudentNameToken.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def drop_trigram_index(apps, schema_editor):
+    """The tokens serve the word matches now (see 0013_student_identity_index)."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS student_search_trgm_idx')
+
+
+def add_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS student_search_trgm_idx '
+        'ON analytics_student USING gin (search_name gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0017_column_cache_table'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentNameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('owner', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('student', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to='analytics.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'token'], name='student_token_prefix_idx', opclasses=['', 'varchar_pattern_ops'])],
+                'constraints': [models.UniqueConstraint(fields=('student', 'token'), name='unique_student_name_token')],
+            },
+        ),
+        migrations.RunPython(backfill_tokens, migrations.RunPython.noop),
+        migrations.RunPython(drop_trigram_index, add_trigram_index),
+    ]
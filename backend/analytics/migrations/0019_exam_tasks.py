@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0018_student_name_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text='The artifact to build (excel, charts, streams, reports).', max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('PROCESSING', 'Processing'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('message', models.TextField(blank=True, default='')),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('worker_id', models.CharField(blank=True, default='', max_length=100)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tasks', to='analytics.examupload')),
+            ],
+            options={
+                'verbose_name': 'Exam Task',
+                'verbose_name_plural': 'Exam Tasks',
+                'indexes': [models.Index(fields=['status', 'queued_at'], name='exam_task_queue_idx')],
+                'constraints': [models.UniqueConstraint(fields=('exam', 'kind'), name='unique_exam_task')],
+            },
+        ),
+    ]
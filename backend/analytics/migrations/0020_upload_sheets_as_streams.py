@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0019_exam_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examupload',
+            name='sheets_as_streams',
+            field=models.BooleanField(default=False, help_text="Read every sheet of the workbook as one stream (sheets must share the first sheet's headers)."),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-17 23:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0020_upload_sheets_as_streams'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='examtask',
+            name='kind',
+            field=models.CharField(help_text="The artifact to build (excel, charts, streams, reports), or 'scores' to fill a cached result's score tables.", max_length=20),
+        ),
+    ]
@@ -4,11 +4,15 @@ from django.db import models
 from django.conf import settings
 from django.core.validators import FileExtensionValidator
 from django.utils.translation import gettext_lazy as _
+from django.utils import timezone
 from django.utils.text import slugify
 
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .storage import artifact_storage
+
+
 def exam_upload_path(instance, filename):
     """
     Generates a unique path for uploaded files to prevent filename collisions.
@@ -67,8 +71,8 @@ class ExamUpload(models.Model):
     # 4. The File
     file = models.FileField(
         upload_to=exam_upload_path, 
-        validators=[FileExtensionValidator(allowed_extensions=['xlsx', 'xls', 'csv'])],
-        help_text=_("Upload your exam data file here (Excel or CSV only)")
+        validators=[FileExtensionValidator(allowed_extensions=['xlsx', 'xls', 'csv', 'zip'])],
+        help_text=_("Upload your exam data file here (Excel or CSV), or a ZIP / multi-sheet workbook with one sheet per stream")
     )
 
     # 5. CONFIGURATION (The "Brain" of the extraction)
@@ -87,6 +91,12 @@ class ExamUpload(models.Model):
         help_text=_("Comma-separated list of columns to exclude from grading (e.g., 'UPI, Nemis No, Stream').")
     )
 
+    # C. Batch workbooks: off by default, a workbook is read from its first sheet only
+    sheets_as_streams = models.BooleanField(
+        default=False,
+        help_text=_("Read every sheet of the workbook as one stream (sheets must share the first sheet's headers).")
+    )
+
     # 6. Status & Results
     uploaded_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -110,14 +120,43 @@ class ExamUpload(models.Model):
         help_text=_("JSON summary of results (avg, pass_rate, etc.)")
     )
 
-    # 7. Outputs
-    processed_file = models.FileField(upload_to='results/%Y/%m/%d/', null=True, blank=True)
-    subject_chart = models.ImageField(upload_to='charts/%Y/%m/', null=True, blank=True)
-    passrate_chart = models.ImageField(upload_to='charts/%Y/%m/', null=True, blank=True)
-    reports_zip = models.FileField(upload_to='reports/%Y/%m/%d/', null=True, blank=True)
+    progress = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text=_("Live pipeline progress: current stage, stages done/total, percent and whether the summary is ready.")
+    )
+
+    # C. Job queue bookkeeping (see analytics/jobs.py)
+    queued_at = models.DateTimeField(null=True, blank=True, help_text=_("When the upload entered the analysis queue."))
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text=_("Last sign of life from the worker running this job."))
+    finished_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    incremental = models.BooleanField(default=False, help_text=_("Regrade job: reuse the parsed sheet and skip unchanged stages."))
+
+    # 7. Outputs (content-addressed: identical artifacts share one blob, see analytics/storage.py)
+    processed_file = models.FileField(upload_to='results/%Y/%m/%d/', storage=artifact_storage, null=True, blank=True)
+    subject_chart = models.ImageField(upload_to='charts/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    passrate_chart = models.ImageField(upload_to='charts/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    reports_zip = models.FileField(upload_to='reports/%Y/%m/%d/', storage=artifact_storage, null=True, blank=True)
+    stream_artifacts = models.FileField(upload_to='reports/%Y/%m/%d/', storage=artifact_storage, null=True, blank=True, help_text=_("Batch uploads: per-stream broadsheets and charts."))
+
+    # 8. Intermediates for incremental re-grades (see analysis.process_exam_file)
+    parsed_data = models.FileField(upload_to='intermediate/%Y/%m/', null=True, blank=True, help_text=_("Parsed sheet snapshot, so re-grades skip reading the file."))
+    analysis_data = models.FileField(upload_to='intermediate/%Y/%m/', null=True, blank=True, help_text=_("Totals, ranks and grades from the last run."))
+    pipeline_state = models.JSONField(default=dict, blank=True, help_text=_("Detected subjects, stage input fingerprints and the last run's stage report."))
+
+    # 9. Profiling (opt-in, staff only; per-stage timings are in StageTiming)
+    profile_enabled = models.BooleanField(default=False, help_text=_("Capture a cProfile of the next analysis run."))
+    profile_file = models.FileField(upload_to='profiles/%Y/%m/', null=True, blank=True, help_text=_("cProfile stats of the last profiled run (open with pstats or snakeviz)."))
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['status', 'queued_at'], name='exam_queue_idx'),
+            models.Index(fields=['uploaded_by', '-uploaded_at'], name='exam_owner_recent_idx'),
+        ]
         verbose_name = _("Exam File Upload")
         verbose_name_plural = _("Exam File Uploads")
         permissions = [
@@ -154,6 +193,277 @@ class UserProfile(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.school_name}"
 
+
+class ResultCacheEntry(models.Model):
+    """
+    Finished analysis artifacts, keyed by a hash of everything that determines them
+    (file bytes, grading scheme, ignored columns, school name, title). See analytics/cache.py.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    analysis_summary = models.JSONField(default=dict, blank=True)
+
+    processed_file = models.FileField(upload_to='cache/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    subject_chart = models.ImageField(upload_to='cache/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    passrate_chart = models.ImageField(upload_to='cache/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    reports_zip = models.FileField(upload_to='cache/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    stream_artifacts = models.FileField(upload_to='cache/%Y/%m/', storage=artifact_storage, null=True, blank=True)
+    # Graded frame and detected subjects, so a cache hit can still fill the score tables
+    analysis_data = models.FileField(upload_to='cache/%Y/%m/', null=True, blank=True)
+    subjects = models.JSONField(default=list, blank=True)
+    # Ingest report and stage fingerprints of that run: a cache hit builds its missing artifacts from the snapshot
+    pipeline_state = models.JSONField(default=dict, blank=True)
+
+    size_bytes = models.BigIntegerField(default=0, help_text=_("Total size of the cached artifacts."))
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _("Result Cache Entry")
+        verbose_name_plural = _("Result Cache Entries")
+
+    def __str__(self):
+        return f"{self.key[:12]} ({self.hits} hits)"
+
+
+class ResultCacheStats(models.Model):
+    """Single row of storage-wide cache hit/miss counters."""
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    evictions = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _("Result Cache Stats")
+        verbose_name_plural = _("Result Cache Stats")
+
+    def __str__(self):
+        return f"{self.hits} hits / {self.misses} misses"
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return round(self.hits / total * 100, 1) if total else 0.0
+
+
+class ExamTask(models.Model):
+    """
+    Background work on a finished upload that must not touch its status: a
+    deferred artifact built on first download (see analytics/artifacts.py), or
+    the score tables of a result restored from the cache (analytics/cache.py).
+    Claimed by the analysis workers like the uploads themselves (analytics/jobs.py).
+    """
+    exam = models.ForeignKey(ExamUpload, on_delete=models.CASCADE, related_name='tasks')
+    kind = models.CharField(max_length=20, help_text=_("The artifact to build (excel, charts, streams, reports), or 'scores' to fill a cached result's score tables."))
+    status = models.CharField(max_length=20, choices=ExamUpload.Status.choices, default=ExamUpload.Status.PENDING)
+    message = models.TextField(blank=True, default='')
+    queued_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exam', 'kind'], name='unique_exam_task'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'queued_at'], name='exam_task_queue_idx'),
+        ]
+        verbose_name = _("Exam Task")
+        verbose_name_plural = _("Exam Tasks")
+
+    def __str__(self):
+        return f"{self.kind} ({self.status})"
+
+
+class StageTiming(models.Model):
+    """Wall time, CPU time and peak RSS of one pipeline stage in an exam's last run."""
+    exam = models.ForeignKey(ExamUpload, on_delete=models.CASCADE, related_name='stage_timings')
+    stage = models.CharField(max_length=30)
+    order = models.PositiveSmallIntegerField(default=0)
+    outcome = models.CharField(max_length=10, default='ran', help_text=_("ran, skipped (reused from the previous run) or failed."))
+    wall_seconds = models.FloatField(default=0)
+    cpu_seconds = models.FloatField(default=0, help_text=_("Includes the report-rendering worker processes."))
+    peak_rss_bytes = models.BigIntegerField(default=0)
+    recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['exam', 'order']
+        verbose_name = _("Stage Timing")
+        verbose_name_plural = _("Stage Timings")
+
+    def __str__(self):
+        return f"{self.stage}: {self.wall_seconds:.3f}s"
+
+
+class StageTotal(models.Model):
+    """
+    Cumulative runs, wall and CPU time per stage and outcome, over every run ever
+    recorded. Only ever incremented, so the Prometheus counters built from it
+    never go down (StageTiming keeps just each exam's last run).
+    """
+    stage = models.CharField(max_length=30)
+    outcome = models.CharField(max_length=10)
+    runs = models.PositiveBigIntegerField(default=0)
+    wall_seconds = models.FloatField(default=0)
+    cpu_seconds = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['stage', 'outcome']
+        constraints = [
+            models.UniqueConstraint(fields=['stage', 'outcome'], name='unique_stage_total'),
+        ]
+        verbose_name = _("Stage Total")
+        verbose_name_plural = _("Stage Totals")
+
+    def __str__(self):
+        return f"{self.stage} {self.outcome}: {self.runs}"
+
+
+# --- NORMALIZED RESULTS (see analytics/scores.py) ---
+
+class Student(models.Model):
+    """A learner of one school (uploader), matched across uploads by admission number, or by name when a sheet has none."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='students')
+    key = models.CharField(max_length=150, help_text=_("Normalized admission number, or 'name:<NAME>'."))
+    adm_no = models.CharField(max_length=50, blank=True, default='')
+    name = models.CharField(max_length=255, blank=True, default='')
+    upi = models.CharField(max_length=50, blank=True, default='')
+    search_name = models.CharField(
+        max_length=255, blank=True, default='',
+        help_text=_("Upper-cased name words in alphabetical order (analytics.identity.search_name)."),
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='unique_student_per_school'),
+        ]
+        # Pattern ops let Postgres serve LIKE 'prefix%' lookups from the B-trees
+        # (name words are matched through StudentNameToken)
+        indexes = [
+            models.Index(fields=['owner', 'name'], name='student_name_idx'),
+            models.Index(fields=['owner', 'adm_no'], name='student_adm_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+            models.Index(fields=['owner', 'upi'], name='student_upi_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+            models.Index(fields=['owner', 'search_name'], name='student_search_prefix_idx',
+                         opclasses=['', 'varchar_pattern_ops']),
+        ]
+        verbose_name = _("Student")
+        verbose_name_plural = _("Students")
+
+    def __str__(self):
+        return f"{self.name} ({self.adm_no or '-'})"
+
+
+class StudentNameToken(models.Model):
+    """One word of a student's search_name: the typeahead matches name words with an indexed prefix scan."""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='name_tokens', db_index=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+', db_index=False)
+    token = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'token'], name='unique_student_name_token'),
+        ]
+        indexes = [
+            models.Index(fields=['owner', 'token'], name='student_token_prefix_idx', opclasses=['', 'varchar_pattern_ops']),
+        ]
+
+
+class Subject(models.Model):
+    """A subject column as one school names it (matched case-insensitively across uploads)."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='subjects')
+    key = models.CharField(max_length=100, help_text=_("Lower-cased, trimmed column header."))
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='unique_subject_per_school'),
+        ]
+        verbose_name = _("Subject")
+        verbose_name_plural = _("Subjects")
+
+    def __str__(self):
+        return self.name
+
+
+class ExamResult(models.Model):
+    """One student's totals, rank and overall grade in one exam."""
+    # Both foreign keys are covered by the composite indexes below
+    exam = models.ForeignKey(ExamUpload, on_delete=models.CASCADE, related_name='results', db_index=False)
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='results', db_index=False)
+    stream = models.CharField(max_length=100, blank=True, default='')
+    total = models.FloatField(default=0)
+    average = models.FloatField(default=0)
+    rank = models.PositiveIntegerField(default=0)
+    grade = models.CharField(max_length=10, blank=True, default='')
+    points = models.FloatField(default=0)
+    # Rollups for cross-exam trends: comparable across classes of different size and difficulty
+    class_size = models.PositiveIntegerField(default=0)
+    percentile = models.FloatField(default=0, help_text=_("Share of the class ranked at or below this student (100 = top)."))
+    z_score = models.FloatField(default=0, help_text=_("(average - class mean) / class standard deviation."))
+
+    class Meta:
+        ordering = ['exam', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['exam', 'student'], name='unique_result_per_exam'),
+        ]
+        indexes = [
+            models.Index(fields=['student', 'exam'], name='result_student_idx'),
+        ]
+        verbose_name = _("Exam Result")
+        verbose_name_plural = _("Exam Results")
+
+    def __str__(self):
+        return f"{self.student_id} in {self.exam_id}: {self.rank}"
+
+
+class SubjectRollup(models.Model):
+    """One subject's aggregates in one exam, written with the exam's scores so trends never re-aggregate Score rows."""
+    exam = models.ForeignKey(ExamUpload, on_delete=models.CASCADE, related_name='subject_rollups', db_index=False)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='rollups')
+    students = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0)
+    std = models.FloatField(default=0)
+    highest = models.FloatField(default=0)
+    lowest = models.FloatField(default=0)
+    passed = models.PositiveIntegerField(default=0, help_text=_("Students scoring 50 or more."))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['exam', 'subject'], name='unique_rollup_per_exam'),
+        ]
+        verbose_name = _("Subject Rollup")
+        verbose_name_plural = _("Subject Rollups")
+
+    def __str__(self):
+        return f"{self.subject_id} in {self.exam_id}: {self.mean:.2f}"
+
+
+class Score(models.Model):
+    """One subject score. The bulk of the data, so kept narrow: ids, the score and its grade."""
+    exam = models.ForeignKey(ExamUpload, on_delete=models.CASCADE, related_name='scores')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='scores', db_index=False)
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='scores', db_index=False)
+    score = models.FloatField()
+    grade = models.CharField(max_length=10, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # per-student history, per-subject trends
+            models.Index(fields=['student', 'subject'], name='score_student_idx'),
+            models.Index(fields=['subject', 'exam'], name='score_subject_idx'),
+        ]
+        verbose_name = _("Score")
+        verbose_name_plural = _("Scores")
+
+    def __str__(self):
+        return f"{self.subject_id}: {self.score}"
+
+
 # Signal: Automatically create a Profile when a User is created
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -163,3 +473,10 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+# Signal: Push status changes (queued, completed, failed...) to open progress streams
+@receiver(post_save, sender=ExamUpload)
+def publish_exam_progress(sender, instance, **kwargs):
+    from .events import publish
+    publish(instance.pk)
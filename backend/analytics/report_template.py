@@ -0,0 +1,177 @@
+# backend/analytics/report_template.py
+"""
+Report card template.
+
+Every card of an exam shares its static layer: school name, titles, rules,
+the table header band, the subject names and row lines, the summary box and
+the footer. ReportTemplate draws that layer once per exam and keeps its PDF
+operators; each card then only draws the student's own fields (name, position,
+scores, grades, remarks, totals) on top.
+
+- Single-student PDFs (render) paste the prebuilt operators into the page, so
+  no drawing calls are repeated per student.
+- The class PDF (render_class) stores the layer once as a form XObject that
+  every page references, and all pages share one set of font resources.
+
+The operators name fonts by their per-document ids (/F1, /F2...), so every
+canvas registers FONTS in the same order before anything is drawn.
+"""
+
+import io
+from functools import lru_cache
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+FONTS = ('Helvetica', 'Helvetica-Bold', 'Helvetica-Oblique')
+WIDTH, HEIGHT = A4
+
+TABLE_TOP = HEIGHT - 200
+ROW_HEIGHT = 20
+
+# Labels of the variable fields: static text, the value is drawn right after it
+DETAILS = (
+    ('NAME: ', 50, HEIGHT - 140),
+    ('ADM NO: ', 50, HEIGHT - 160),
+    ('POSITION: ', 350, HEIGHT - 140),
+    ('PERFORMANCE: ', 350, HEIGHT - 160),
+)
+SUMMARY = (('TOTAL: ', 60), ('AVERAGE: ', 200), ('LEVEL: ', 400))
+
+
+def _new_canvas(buffer):
+    p = canvas.Canvas(buffer, pagesize=A4)
+    for font in FONTS:
+        p.setFont(font, 10)  # fixes the /F ids the static operators refer to
+    return p
+
+
+def _value_x(label, x, size):
+    return x + stringWidth(label, 'Helvetica-Bold', size)
+
+
+class ReportTemplate:
+    """The report card layout of one exam (header = report_card_inputs' header)."""
+
+    def __init__(self, header):
+        self.school_name, self.exam_title, self.subjects, self.class_size = header
+        self.rows_y = [TABLE_TOP - 25 - ROW_HEIGHT * i for i in range(len(self.subjects))]
+        # Top of the summary box: 30pt below the last row
+        self.summary_y = TABLE_TOP - 25 - ROW_HEIGHT * len(self.subjects) - 30
+        self.static_ops = self._record_static_layer()
+
+    # --- STATIC LAYER (once per exam) ---
+
+    def draw_static(self, p):
+        # --- HEADER ---
+        p.setFont("Helvetica-Bold", 18)
+        p.drawCentredString(WIDTH / 2, HEIGHT - 50, self.school_name)
+
+        p.setFont("Helvetica-Bold", 12)
+        p.drawCentredString(WIDTH / 2, HEIGHT - 75, "COMPETENCY BASED ASSESSMENT")
+        p.drawCentredString(WIDTH / 2, HEIGHT - 95, self.exam_title)
+
+        p.setLineWidth(2)
+        p.line(30, HEIGHT - 105, WIDTH - 30, HEIGHT - 105)
+
+        # --- STUDENT DETAIL LABELS ---
+        p.setFont("Helvetica-Bold", 11)
+        for label, x, y in DETAILS:
+            p.drawString(x, y, label)
+
+        # --- RESULTS TABLE: header band, subject names, row lines ---
+        y = TABLE_TOP
+        p.setFillColor(colors.lightgrey)
+        p.rect(50, y - 5, 500, 20, fill=True, stroke=False)
+        p.setFillColor(colors.black)
+        p.setFont("Helvetica-Bold", 10)
+        p.drawString(60, y, "SUBJECT")
+        p.drawString(250, y, "SCORE")
+        p.drawString(330, y, "LEVEL")
+        p.drawString(400, y, "REMARK")
+
+        p.setFont("Helvetica", 10)
+        p.setLineWidth(0.5)
+        p.setStrokeColor(colors.lightgrey)
+        for subject, y in zip(self.subjects, self.rows_y):
+            p.drawString(60, y, subject.title())
+            p.line(50, y - 5, 550, y - 5)
+
+        # --- FOOTER SUMMARY BOX ---
+        y = self.summary_y
+        p.setStrokeColor(colors.black)
+        p.setLineWidth(1)
+        p.rect(50, y - 40, 500, 40)
+        p.setFont("Helvetica-Bold", 12)
+        for label, x in SUMMARY:
+            p.drawString(x, y - 25, label)
+
+        p.setFont("Helvetica-Oblique", 8)
+        p.drawCentredString(WIDTH / 2, 30, "Generated by School Analytics System")
+
+    def _record_static_layer(self):
+        """The static layer as PDF operators, wrapped in q/Q so the page's state is untouched."""
+        p = _new_canvas(io.BytesIO())
+        start = len(p._code)
+        self.draw_static(p)
+        return '\n'.join(['q', *p._code[start:], 'Q'])
+
+    # --- VARIABLE LAYER (per student) ---
+
+    def draw_student(self, p, student):
+        (student_name, adm, rank, total_score, avg_score, overall_grade,
+         scores, subject_grades, subject_remarks) = student
+
+        p.setFont("Helvetica-Bold", 11)
+        values = (student_name, adm, f"{rank} / {self.class_size}", overall_grade)
+        for (label, x, y), value in zip(DETAILS, values):
+            p.drawString(_value_x(label, x, 11), y, str(value))
+
+        p.setFont("Helvetica", 10)
+        for y, score, grade, remark in zip(self.rows_y, scores, subject_grades, subject_remarks):
+            p.drawString(250, y, f"{score:.0f}")
+            p.drawString(330, y, grade)
+            p.drawString(400, y, remark)
+
+        p.setFont("Helvetica-Bold", 12)
+        values = (f"{total_score:.0f}", f"{avg_score:.2f}", str(overall_grade))
+        for (label, x), value in zip(SUMMARY, values):
+            p.drawString(_value_x(label, x, 12), self.summary_y - 25, value)
+
+    @staticmethod
+    def filename(student):
+        student_name, rank = student[0], student[2]
+        clean_name = "".join([c for c in student_name if c.isalnum() or c == ' ']).strip()
+        return f"{rank}_{clean_name}.pdf"
+
+    def render(self, student):
+        """One student's report card. Returns (filename, pdf_bytes)."""
+        pdf_buffer = io.BytesIO()
+        p = _new_canvas(pdf_buffer)
+        p.addLiteral(self.static_ops)
+        self.draw_student(p, student)
+        p.showPage()
+        p.save()
+        return self.filename(student), pdf_buffer.getvalue()
+
+    def render_class(self, students):
+        """Every student's card as pages of one PDF, the static layer stored once. Returns bytes."""
+        pdf_buffer = io.BytesIO()
+        p = _new_canvas(pdf_buffer)
+        p.beginForm('static')
+        p.addLiteral(self.static_ops)
+        p.endForm()
+        for student in students:
+            p.doForm('static')
+            self.draw_student(p, student)
+            p.showPage()
+        p.save()
+        return pdf_buffer.getvalue()
+
+
+@lru_cache(maxsize=4)
+def report_template(header):
+    """The exam's template, built once per process (renderer pool workers included)."""
+    return ReportTemplate(header)
@@ -0,0 +1,270 @@
+# backend/analytics/sandbox.py
+"""
+Sandboxed analysis runs.
+
+A malformed or huge workbook must not pin a CPU or exhaust the memory of the
+process that claimed it (a queue worker running an upload or building a
+deferred artifact). run_analysis() therefore forks a child for every run and
+watches it (artifacts.build_deferred_artifact uses run_sandboxed() the same way):
+
+- the child gets rlimits: CPU seconds (RLIMIT_CPU, SIGXCPU past the limit) and,
+  optionally, address space (RLIMIT_AS, allocations fail with MemoryError);
+- the parent is the watchdog: it kills the child's whole process group (the
+  report renderer pool included) when its resident memory passes
+  ANALYSIS_MEMORY_LIMIT_MB or the run passes ANALYSIS_TIMEOUT seconds;
+- whatever happened, the upload ends with a structured failure code in its
+  message, "Error [<code>]: <detail>", and in progress['failure'].
+
+The child is forked from an already configured Django process, so it shares
+no DB connection with the parent (they are closed before the fork) and opens
+its own. Without fork, or on an in-memory SQLite database (tests), the
+analysis runs in-process as before.
+"""
+
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection, connections
+from django.utils import timezone
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows: the watchdog still enforces the wall clock
+    HAS_RESOURCE = False
+
+logger = logging.getLogger(__name__)
+
+# Seconds between watchdog checks (memory, wall clock, heartbeat)
+WATCHDOG_INTERVAL = 0.25
+# The hard CPU limit (SIGKILL) sits this far past the soft one (SIGXCPU)
+CPU_GRACE_SECONDS = 5
+
+
+class FailureCode:
+    """The <code> of "Error [<code>]: ..." messages."""
+    TIMEOUT = 'timeout'          # wall clock (ANALYSIS_TIMEOUT)
+    CPU_LIMIT = 'cpu_limit'      # CPU time (ANALYSIS_CPU_LIMIT)
+    OOM = 'oom'                  # memory (ANALYSIS_MEMORY_LIMIT_MB / ANALYSIS_ADDRESS_SPACE_LIMIT_MB, or the kernel)
+    PARSE_ERROR = 'parse_error'  # the sheet could not be read
+    CRASHED = 'crashed'          # the child died without reporting
+    WORKER_LOST = 'worker_lost'  # no heartbeat (see jobs.requeue_stale_jobs)
+    ERROR = 'error'              # anything else raised by the pipeline
+
+
+def failure_message(code, detail):
+    return f"Error [{code}]: {detail}"
+
+
+def classify_exception(exc, stage=None):
+    """Failure code of an exception raised by the pipeline during `stage`."""
+    if isinstance(exc, MemoryError):
+        return FailureCode.OOM
+    if stage == 'read':
+        return FailureCode.PARSE_ERROR
+    return FailureCode.ERROR
+
+
+class Limits(NamedTuple):
+    timeout: float           # wall-clock seconds (0 = none)
+    cpu_seconds: int         # RLIMIT_CPU (0 = none)
+    memory_mb: int           # resident memory of the process tree, pages shared with the parent included (0 = none)
+    address_space_mb: int    # RLIMIT_AS (0 = none)
+
+
+def job_limits():
+    return Limits(
+        timeout=getattr(settings, 'ANALYSIS_TIMEOUT', 900),
+        cpu_seconds=getattr(settings, 'ANALYSIS_CPU_LIMIT', 600),
+        memory_mb=getattr(settings, 'ANALYSIS_MEMORY_LIMIT_MB', 2048),
+        address_space_mb=getattr(settings, 'ANALYSIS_ADDRESS_SPACE_LIMIT_MB', 0),
+    )
+
+
+class SandboxResult(NamedTuple):
+    value: object
+    code: str = None         # None when the target returned
+    detail: str = ''
+
+
+def sandbox_enabled():
+    """Fork available, enabled, and a database the child can reach (not in-memory SQLite)."""
+    if not getattr(settings, 'ANALYSIS_SANDBOX', True) or 'fork' not in multiprocessing.get_all_start_methods():
+        return False
+    return not (connection.vendor == 'sqlite' and connection.is_in_memory_db())
+
+
+# --- 1. CHILD SIDE ---
+
+def _set_limit(kind, soft, hard):
+    _, current_hard = resource.getrlimit(kind)
+    if current_hard != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current_hard), min(hard, current_hard)
+    resource.setrlimit(kind, (soft, hard))
+
+
+def _apply_limits(limits):
+    if not HAS_RESOURCE:
+        return
+    if limits.cpu_seconds:
+        _set_limit(resource.RLIMIT_CPU, limits.cpu_seconds, limits.cpu_seconds + CPU_GRACE_SECONDS)
+    if limits.address_space_mb:
+        size = limits.address_space_mb * 1024 ** 2
+        _set_limit(resource.RLIMIT_AS, size, size)
+
+
+def _child_main(conn, limits, target, args, kwargs):
+    # Own process group: the watchdog kills the renderer pool along with the child
+    os.setpgid(0, 0)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+    _apply_limits(limits)
+    try:
+        conn.send(SandboxResult(target(*args, **kwargs)))
+    except BaseException as e:
+        conn.send(SandboxResult(None, classify_exception(e), str(e) or type(e).__name__))
+    finally:
+        connections.close_all()
+        conn.close()
+
+
+# --- 2. PARENT SIDE (watchdog) ---
+
+def _children(pid):
+    try:
+        tasks = os.listdir(f'/proc/{pid}/task')
+    except OSError:
+        return []
+    found = []
+    for tid in tasks:
+        try:
+            with open(f'/proc/{pid}/task/{tid}/children') as fh:
+                found.extend(int(child) for child in fh.read().split())
+        except OSError:
+            continue
+    return found
+
+
+def tree_rss_bytes(pid):
+    """Resident memory of a process and its descendants (Linux /proc; 0 elsewhere)."""
+    total, pending = 0, [pid]
+    page = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/statm') as fh:
+                total += int(fh.read().split()[1]) * page
+        except (OSError, IndexError, ValueError):
+            continue
+        pending.extend(_children(current))
+    return total
+
+
+def _kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        proc.kill()
+
+
+def _exit_failure(exitcode, limits):
+    if exitcode == -signal.SIGXCPU:
+        return FailureCode.CPU_LIMIT, f"analysis used more than {limits.cpu_seconds} s of CPU time."
+    if exitcode == -signal.SIGKILL:
+        # Not the watchdog: the kernel (OOM killer) or the hard CPU limit
+        return FailureCode.OOM, "analysis process was killed by the system (out of memory)."
+    return FailureCode.CRASHED, f"analysis process exited unexpectedly (code {exitcode})."
+
+
+def run_sandboxed(target, args=(), kwargs=None, limits=None, on_tick=None):
+    """
+    Runs target(*args, **kwargs) in a forked child under `limits` (default:
+    job_limits()) and returns a SandboxResult. on_tick() is called on every
+    watchdog check (heartbeats).
+    """
+    limits = limits or job_limits()
+    ctx = multiprocessing.get_context('fork')
+    receiver, sender = ctx.Pipe(duplex=False)
+    connections.close_all()  # Never share a DB socket with the child
+    proc = ctx.Process(target=_child_main, args=(sender, limits, target, args, kwargs or {}), name='analysis-sandbox')
+    proc.start()
+    sender.close()
+
+    result, killed = None, None
+    deadline = time.monotonic() + limits.timeout if limits.timeout else None
+    try:
+        while result is None and proc.is_alive():
+            ready = wait([receiver, proc.sentinel], timeout=WATCHDOG_INTERVAL)
+            if receiver in ready:
+                try:
+                    result = receiver.recv()
+                except EOFError:
+                    pass
+                continue
+            if on_tick is not None:
+                on_tick()
+            if deadline is not None and time.monotonic() > deadline:
+                killed = (FailureCode.TIMEOUT, f"analysis took longer than {limits.timeout:g} s.")
+            elif limits.memory_mb and tree_rss_bytes(proc.pid) > limits.memory_mb * 1024 ** 2:
+                killed = (FailureCode.OOM, f"analysis used more than {limits.memory_mb} MB of memory.")
+            if killed:
+                _kill_group(proc)
+                break
+        if result is None and not killed and receiver.poll():
+            try:
+                result = receiver.recv()
+            except EOFError:
+                pass
+    finally:
+        proc.join()
+        receiver.close()
+
+    if killed:
+        return SandboxResult(None, *killed)
+    if result is None:
+        return SandboxResult(None, *_exit_failure(proc.exitcode, limits))
+    return result
+
+
+# --- 3. ANALYSIS RUNS ---
+
+def record_failure(exam_id, code, detail):
+    """Marks the upload FAILED with a structured message (the child could not do it itself)."""
+    from .events import publish
+    from .models import ExamUpload
+
+    exam = ExamUpload.objects.filter(pk=exam_id).only('progress').first()
+    if exam is None:
+        return
+    ExamUpload.objects.filter(pk=exam_id).update(
+        status=ExamUpload.Status.FAILED,
+        message=failure_message(code, detail),
+        progress={**(exam.progress or {}), 'failed': True, 'failure': code},
+        updated_at=timezone.now(),
+    )
+    publish(exam_id)
+
+
+def run_analysis(exam, on_tick=None, **kwargs):
+    """
+    process_exam_file(exam, **kwargs) in a sandboxed child (in-process when the
+    sandbox is unavailable). Returns the stage outcomes ({} when the child was
+    killed); `exam` is reloaded with the run's results.
+    """
+    from .analysis import process_exam_file
+
+    if not sandbox_enabled():
+        return process_exam_file(exam, **kwargs)
+
+    result = run_sandboxed(process_exam_file, (exam,), kwargs, on_tick=on_tick)
+    if result.code is not None:
+        logger.warning("Analysis sandbox: exam %s failed [%s] %s", exam.pk, result.code, result.detail)
+        record_failure(exam.pk, result.code, result.detail)
+    exam.refresh_from_db()
+    return result.value or {}
@@ -1,8 +1,15 @@
 # backend/analytics/serializers.py
 from rest_framework import serializers
-from .models import ExamUpload, UserProfile
+from rest_framework.reverse import reverse
+from django.db import models
+from .models import ExamUpload, Student, Subject
+from .artifacts import FIELD_ARTIFACTS, artifact_ready
+from .media import signed_media_url, stored_version
 from django.contrib.auth.models import User
 
+# analysis_summary keys shown in the history list
+LIST_SUMMARY_KEYS = ('student_count', 'class_mean', 'pass_rate', 'top_student')
+
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -34,13 +41,33 @@ class RegisterSerializer(serializers.ModelSerializer):
         # Return the user instance
         return user
 
+class SignedFileField(serializers.FileField):
+    """Outputs a signed /media/ link (the media view rejects unsigned requests)."""
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = signed_media_url(value)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
 class ExamUploadSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: SignedFileField,
+        models.ImageField: SignedFileField,
+    }
+
     # 1. User Info: Show the username of the uploader (Read-only)
     uploaded_by_username = serializers.CharField(source='uploaded_by.username', read_only=True)
 
     # 2. File URL: Explicitly ensure the frontend gets a full URL
     file_url = serializers.SerializerMethodField()
-    
+
+    # 2b. Downloads: every artifact with its download link (built on first request if deferred)
+    artifacts = serializers.SerializerMethodField()
+
     class Meta:
         model = ExamUpload
         # 3. Explicit Fields: Include ALL new fields we added to the model
@@ -56,12 +83,16 @@ class ExamUploadSerializer(serializers.ModelSerializer):
             'status', 
             'message', 
             'analysis_summary',   # New: The JSON stats
+            'progress',           # New: live stage progress
             'processed_file', 
             'subject_chart', 
             'passrate_chart', 
             'reports_zip',
+            'stream_artifacts',   # New: batch uploads, per-stream broadsheets/charts
+            'artifacts',          # New: {field: {ready, url}}, built on demand
             'grading_scheme',    # New: Custom grading scheme
-            'custom_ignore_columns'  # New: Safety valve for ignoring columns
+            'custom_ignore_columns',  # New: Safety valve for ignoring columns
+            'sheets_as_streams',  # New: opt-in batch workbooks, one stream per sheet
         ]
         
         # 4. Protection: Ensure users cannot modify these fields via API
@@ -74,10 +105,12 @@ class ExamUploadSerializer(serializers.ModelSerializer):
             'status', 
             'message', 
             'analysis_summary', 
+            'progress',
             'processed_file', 
             'subject_chart', 
             'passrate_chart', 
-            'reports_zip'
+            'reports_zip',
+            'stream_artifacts'
         ]
 
     # 5. Custom Validation: Limit file size (e.g., 10MB)
@@ -95,6 +128,50 @@ class ExamUploadSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if obj.file and hasattr(obj.file, 'url'):
             if request:
-                return request.build_absolute_uri(obj.file.url)
-            return obj.file.url
-        return None
\ No newline at end of file
+                return request.build_absolute_uri(signed_media_url(obj.file))
+            return signed_media_url(obj.file)
+        return None
+
+    def get_artifacts(self, obj):
+        batch = bool((obj.pipeline_state or {}).get('ingest', {}).get('streams')) or bool(obj.stream_artifacts)
+        request = self.context.get('request')
+        artifacts = {}
+        for field, name in FIELD_ARTIFACTS.items():
+            if name == 'streams' and not batch:
+                continue
+            ready = bool(getattr(obj, field)) and artifact_ready(obj, name)
+            url = reverse('exam-upload-download', kwargs={'id': obj.id, 'field': field}, request=request)
+            # Built files get a versioned link, which browsers may cache for good
+            artifacts[field] = {"ready": ready, "url": f"{url}?v={stored_version(getattr(obj, field))}" if ready else url}
+        return artifacts
+
+class ExamUploadListSerializer(serializers.ModelSerializer):
+    """
+    History list row: no file URLs, grading scheme or full summary. The summary
+    numbers come from JSON key annotations (see ExamUploadViewSet.get_queryset),
+    so the analysis_summary blob is never loaded for a list.
+    """
+    uploaded_by_username = serializers.CharField(source='uploaded_by.username', read_only=True)
+    summary = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExamUpload
+        fields = ['id', 'title', 'slug', 'status', 'message', 'uploaded_by_username', 'uploaded_at', 'updated_at', 'summary']
+        read_only_fields = fields
+
+    def get_summary(self, obj):
+        return {key: getattr(obj, f'summary_{key}', None) for key in LIST_SUMMARY_KEYS}
+
+
+class StudentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Student
+        fields = ['id', 'adm_no', 'upi', 'name']
+        read_only_fields = fields
+
+
+class SubjectSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Subject
+        fields = ['id', 'name']
+        read_only_fields = fields
@@ -0,0 +1,201 @@
+# backend/analytics/storage.py
+"""
+Content-addressed artifact storage.
+
+Workbooks, charts and ZIPs are written to cas/<aa>/<sha256>.<ext>: the name
+is the content, so identical artifacts (re-uploads, cache copies, charts of
+unchanged data) share one blob and a name never changes meaning, which lets
+the media view cache them as immutable.
+
+Blobs are shared, so delete() leaves them alone (django_cleanup calls it when
+a field changes or an exam is deleted); collect_garbage() removes the blobs no
+row references any more. Text-like blobs also get a .gz sibling when gzip
+saves at least MIN_GZIP_SAVING; already-compressed formats (xlsx, png, zip)
+are stored as they are.
+"""
+
+import glob
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+PREFIX = 'cas'
+CHUNK_SIZE = 1024 * 1024
+
+# Containers that are already deflate/PNG compressed: gzip can't shrink them
+COMPRESSED_EXTENSIONS = {'.xlsx', '.xls', '.zip', '.png', '.jpg', '.jpeg', '.gz', '.parquet'}
+MIN_GZIP_SAVING = 0.1
+
+
+def is_content_addressed(name):
+    return name.replace(os.sep, '/').startswith(f'{PREFIX}/')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage under MEDIA_ROOT whose saved names are the sha256 of the content."""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is decided by the content in _save; identical content is the same file
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(os.path.join(PREFIX, 'tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha = digest.hexdigest()
+            final = os.path.join(PREFIX, sha[:2], f"{sha}{ext}")
+            final_path = self.path(final)
+            try:
+                # Dedup hit: keep the blob, and refresh its mtime so a running GC sweep spares it
+                os.utime(final_path)
+            except FileNotFoundError:
+                # New content (or a blob the GC just took): store this copy
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, final_path)
+                tmp_path = None
+                if ext not in COMPRESSED_EXTENSIONS:
+                    _write_gzip_variant(final_path)
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return final.replace(os.sep, '/')
+
+    def delete(self, name):
+        if is_content_addressed(name):
+            return  # Shared blob: collect_garbage() removes it once nothing references it
+        super().delete(name)
+
+
+def artifact_storage():
+    return ContentAddressedStorage()
+
+
+def _write_gzip_variant(path):
+    """Keeps path.gz when it is MIN_GZIP_SAVING smaller than the original (served to gzip clients)."""
+    gz_path = f"{path}.gz"
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as out:
+            shutil.copyfileobj(src, out, CHUNK_SIZE)
+        if os.path.getsize(tmp_path) <= os.path.getsize(path) * (1 - MIN_GZIP_SAVING):
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, gz_path)
+            tmp_path = None
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def gzip_variant(path):
+    gz_path = f"{path}.gz"
+    return gz_path if os.path.exists(gz_path) else None
+
+
+# --- GARBAGE COLLECTION ---
+
+def referenced_blobs():
+    """Every cas/ name stored in a FileField of any model (uploads, cache entries, ...)."""
+    from django.apps import apps
+    from django.db import models
+
+    names = set()
+    for model in apps.get_models():
+        fields = [f.name for f in model._meta.get_fields()
+                  if isinstance(f, models.FileField) and isinstance(f.storage, ContentAddressedStorage)]
+        for field in fields:
+            names.update(
+                model._default_manager.filter(**{f'{field}__startswith': f'{PREFIX}/'})
+                .values_list(field, flat=True).distinct().iterator()
+            )
+    return names
+
+
+def collect_garbage(grace_seconds=None, dry_run=False):
+    """
+    Deletes blobs (and their .gz variants) that no row references and that are
+    older than grace_seconds, so files saved by a job that hasn't committed yet
+    survive. Also clears the per-artifact lock files (MEDIA_ROOT/locks/*.lock)
+    that download-time builds used to leave behind. Returns (blobs removed,
+    bytes freed).
+    """
+    if grace_seconds is None:
+        grace_seconds = getattr(settings, 'MEDIA_GC_GRACE', 24 * 3600)
+    # Read the references first: a blob saved after this point is younger than the grace period
+    cutoff = time.time() - grace_seconds
+    _sweep_lock_files(cutoff, dry_run)
+
+    storage = artifact_storage()
+    root = storage.path(PREFIX)
+    if not os.path.isdir(root):
+        return 0, 0
+
+    referenced = referenced_blobs()
+    removed = freed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in referenced or (name.endswith('.gz') and name[:-3] in referenced):
+                continue
+            try:
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                if name.endswith('.gz') and _is_fresh(path[:-3], cutoff):
+                    continue  # the blob it belongs to was just reused
+                if not dry_run and not _remove_if_stale(path, cutoff):
+                    continue
+            except FileNotFoundError:
+                continue
+            removed += not name.endswith('.gz')
+            freed += st.st_size
+    return removed, freed
+
+
+def _remove_if_stale(path, cutoff):
+    """
+    Removes a blob unless a dedup hit touched it after the sweep's stat. The
+    blob is renamed to a tombstone first: a writer that comes later finds it
+    gone and stores a fresh copy, and one that touched it before the rename
+    shows in the tombstone's mtime, so it is put back. Returns True if removed.
+    """
+    tomb = f"{path}.{os.getpid()}.tomb"
+    os.rename(path, tomb)
+    if os.stat(tomb).st_mtime > cutoff:
+        os.replace(tomb, path)
+        return False
+    os.remove(tomb)
+    return True
+
+
+def _is_fresh(path, cutoff):
+    try:
+        return os.stat(path).st_mtime > cutoff
+    except FileNotFoundError:
+        return False
+
+
+def _sweep_lock_files(cutoff, dry_run):
+    for path in glob.glob(os.path.join(settings.MEDIA_ROOT, 'locks', '*.lock')):
+        try:
+            if os.stat(path).st_mtime <= cutoff and not dry_run:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
@@ -1,3 +1,1533 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import pstats
+import re
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zipfile
+import zlib
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .analysis import calculate_totals, detect_subject_columns, process_exam_file
+from .benchmarks import compare_results, fake_exam, graded_frame, iterrows_payloads, messy_scores, sheet_bytes, synthetic_scores
+from .cache import cache_stats, evict_cache, restore_cached_result
+from .columns import classify_columns
+from .grading import compile_grading_scheme
+from .ingest import downcast_numeric, load_frame
+from .instrumentation import STAGES
+from .jobs import claim_next_job, claim_next_task, enqueue_analysis, queue_metrics, requeue_stale_jobs, run_job, run_task
+from .models import (
+    ExamResult, ExamTask, ExamUpload, ResultCacheEntry, Score, Student, StudentNameToken, Subject, SubjectRollup,
+    default_grading_scheme,
+)
+from .utils import CLASS_PDF_NAME, generate_student_reports, get_grade_details, report_card_inputs, render_report_cards, write_reports_zip
+from .sandbox import Limits, run_sandboxed
+from .scores import exam_series_trends, store_scores
+from .visualizer import ChartEngine
+
+
+def reference_grade(score, scheme):
+    """The original per-row loop, kept here as the source of truth for grading semantics."""
+    try:
+        s = round(float(score))
+    except (ValueError, TypeError):
+        return "-", "", 0
+    if not isinstance(scheme, list):
+        return "-", "Invalid Scheme", 0
+    for rule in scheme:
+        try:
+            if rule['min'] <= s <= rule['max']:
+                return rule['grade'], rule['remark'], rule['points']
+        except KeyError:
+            continue
+    return "-", "Not Graded", 0
+
+
+class GradingSchemeTests(SimpleTestCase):
+    schemes = [
+        default_grading_scheme(),
+        # Gaps, overlaps (first rule wins), fractional bounds and a broken rule
+        [
+            {"min": 70, "max": 100, "grade": "A", "remark": "Top", "points": 12},
+            {"min": 60, "max": 75, "grade": "B", "remark": "Good", "points": 9},
+            {"min": 30.5, "max": 49.5, "grade": "D", "remark": "Weak", "points": 3},
+            {"grade": "X"},
+        ],
+        [],
+        "not a list",
+    ]
+    scores = [
+        -5, 0, 0.5, 1.5, 30, 30.4, 30.6, 39.5, 40.5, 49, 49.5, 50, 55,
+        59.5, 60, 75, 79.4, 79.5, 80, 100, 100.4, 101, np.nan, None, "85", "abc",
+    ]
+
+    def test_matches_reference_loop(self):
+        for scheme in self.schemes:
+            grading = compile_grading_scheme(scheme)
+            grades, remarks, points = grading.grade(np.array(self.scores, dtype=object))
+            for i, score in enumerate(self.scores):
+                expected = reference_grade(score, scheme)
+                self.assertEqual((grades[i], remarks[i], points[i]), expected, (scheme, score))
+                self.assertEqual(get_grade_details(score, scheme), expected)
+
+    def test_grade_exam_single_pass(self):
+        scores = pd.DataFrame({'Math': [85, 45, 10], 'English': [50, 79.6, 39.5]})
+        result = compile_grading_scheme(default_grading_scheme()).grade_exam(scores.mean(axis=1), scores)
+
+        self.assertEqual(list(result.overall_grade), ['ME', 'ME', 'BE'])
+        self.assertEqual(list(result.overall_points), [3, 3, 1])
+        self.assertEqual(list(result.subject_grades['Math']), ['EE', 'AE', 'BE'])
+        self.assertEqual(list(result.subject_grades['English']), ['ME', 'EE', 'AE'])  # 39.5 rounds to 40
+        self.assertEqual(result.subject_remarks.loc[1, 'English'], 'Exceeding Expectations')
+
+    def test_compiled_once_per_scheme(self):
+        self.assertIs(
+            compile_grading_scheme(default_grading_scheme()),
+            compile_grading_scheme(default_grading_scheme()),
+        )
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+
+    def make_exam(self, user, title):
+        return enqueue_analysis(ExamUpload.objects.create(title=title, uploaded_by=user, file='uploads/x.csv'))
+
+    def test_claims_oldest_first_and_only_once(self):
+        first = self.make_exam(self.alice, 'First')
+        second = self.make_exam(self.bob, 'Second')
+
+        job = claim_next_job('w1')
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, ExamUpload.Status.PROCESSING)
+        self.assertEqual((job.worker_id, job.attempts), ('w1', 1))
+        self.assertEqual(claim_next_job('w2').pk, second.pk)
+        self.assertIsNone(claim_next_job('w3'))
+
+    @override_settings(ANALYSIS_PER_USER_LIMIT=1)
+    def test_per_user_concurrency_limit(self):
+        self.make_exam(self.alice, 'A1')
+        self.make_exam(self.alice, 'A2')
+        bob_exam = self.make_exam(self.bob, 'B1')
+
+        self.assertEqual(claim_next_job('w1').uploaded_by, self.alice)
+        # Alice is at her limit, so Bob's newer upload jumps ahead of A2
+        self.assertEqual(claim_next_job('w2').pk, bob_exam.pk)
+        self.assertIsNone(claim_next_job('w3'))
+
+    @override_settings(ANALYSIS_PER_USER_LIMIT=1)
+    def test_claim_rechecks_the_limit(self):
+        from unittest import mock
+
+        self.make_exam(self.alice, 'A1')
+        self.make_exam(self.alice, 'A2')
+        self.assertIsNotNone(claim_next_job('w1'))
+        # A worker whose candidate list was read before that claim committed
+        stale = ExamUpload.objects.filter(status=ExamUpload.Status.PENDING).order_by('queued_at')
+        with mock.patch('analytics.jobs._claimable', return_value=stale):
+            self.assertIsNone(claim_next_job('w2'))
+        self.assertEqual(ExamUpload.objects.filter(status=ExamUpload.Status.PROCESSING).count(), 1)
+
+    @override_settings(ANALYSIS_VISIBILITY_TIMEOUT=60, ANALYSIS_MAX_ATTEMPTS=2)
+    def test_stale_jobs_are_requeued_then_failed(self):
+        exam = self.make_exam(self.alice, 'Stale')
+        claim_next_job('w1')
+        stale = timezone.now() - timedelta(seconds=120)
+        ExamUpload.objects.filter(pk=exam.pk).update(heartbeat_at=stale)
+
+        self.assertEqual(requeue_stale_jobs(), (1, 0))
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.PENDING)
+
+        claim_next_job('w2')
+        ExamUpload.objects.filter(pk=exam.pk).update(heartbeat_at=stale)
+        self.assertEqual(requeue_stale_jobs(), (0, 1))
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.FAILED)
+        self.assertTrue(exam.message.startswith('Error [worker_lost]:'), exam.message)
+
+    def test_metrics(self):
+        self.make_exam(self.alice, 'Waiting')
+        metrics = queue_metrics()
+        self.assertEqual(metrics['queue_depth'], 1)
+        self.assertEqual(metrics['in_flight'], 0)
+
+
+def hold_memory(mb):
+    block = bytearray(mb * 1024 ** 2)
+    time.sleep(10)
+    return len(block)
+
+
+def spin():
+    while True:
+        pass
+
+
+class SandboxTests(SimpleTestCase):
+    limits = Limits(timeout=5, cpu_seconds=0, memory_mb=0, address_space_mb=0)
+
+    def test_returns_the_child_result(self):
+        result = run_sandboxed(os.getpid, limits=self.limits)
+        self.assertIsNone(result.code)
+        self.assertNotEqual(result.value, os.getpid())
+
+        result = run_sandboxed(int, ('twelve',), limits=self.limits)
+        self.assertEqual((result.code, result.value), ('error', None))
+        self.assertIn('twelve', result.detail)
+
+    def test_watchdog_enforces_wall_clock_and_memory(self):
+        started = time.monotonic()
+        result = run_sandboxed(time.sleep, (30,), limits=self.limits._replace(timeout=0.5))
+        self.assertEqual(result.code, 'timeout')
+        self.assertLess(time.monotonic() - started, 5)
+
+        result = run_sandboxed(hold_memory, (400,), limits=self.limits._replace(memory_mb=200))
+        self.assertEqual(result.code, 'oom')
+
+    def test_rlimits(self):
+        result = run_sandboxed(spin, limits=self.limits._replace(cpu_seconds=1))
+        self.assertEqual(result.code, 'cpu_limit')
+
+        result = run_sandboxed(hold_memory, (2048,), limits=self.limits._replace(address_space_mb=1024))
+        self.assertEqual(result.code, 'oom')
+
+
+class ReportRenderingTests(TestCase):
+    def test_parallel_rendering_matches_serial_order(self):
+        df = graded_frame(students=60, subjects=4)
+        serial = zipfile.ZipFile(generate_student_reports(df, fake_exam(), workers=1))
+        parallel = zipfile.ZipFile(generate_student_reports(df, fake_exam(), workers=2))
+
+        self.assertEqual(len(serial.namelist()), 60)
+        self.assertEqual(serial.namelist(), parallel.namelist())
+        self.assertTrue(parallel.read(parallel.namelist()[0]).startswith(b'%PDF'))
+
+    def test_streaming_zip_memory_does_not_grow_with_archive(self):
+        header = ('SCHOOL', 'Exam', tuple(f'Subject {i}' for i in range(12)), 0)
+
+        def students(n):
+            for i in range(n):
+                yield (f'STUDENT {i}', str(1000 + i), i + 1, 700.0, 58.3, 'ME',
+                       (58.0,) * 12, ('ME',) * 12, ('Meeting Expectations',) * 12)
+
+        def measure(n):
+            target = SpooledTemporaryFile(max_size=64 * 1024)
+            tracemalloc.start()
+            write_reports_zip(render_report_cards(header, students(n), n, workers=1), target)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak, target.seek(0, 2)
+
+        measure(2)  # Warm reportlab's font caches outside the measurement
+        small_peak, small_size = measure(50)
+        big_peak, big_size = measure(250)
+
+        # Each extra student may only cost a ZIP index entry, never its PDF bytes
+        self.assertLess(big_peak - small_peak, (big_size - small_size) / 2)
+
+    def test_cards_draw_the_template_and_class_pdf_shares_it(self):
+        df = graded_frame(students=12, subjects=4)
+        with override_settings(REPORT_CLASS_PDF=True):
+            archive = zipfile.ZipFile(generate_student_reports(df, fake_exam('Term 2'), workers=1))
+        names = archive.namelist()
+        self.assertEqual(names[-1], CLASS_PDF_NAME)
+
+        card = _pdf_content(archive.read(names[0]))
+        for text in (b'COMPETENCY BASED ASSESSMENT', b'Term 2', b'SUBJECT', b'NAME: ', names[0].split('_', 1)[1][:-4].encode()):
+            self.assertIn(text, card)
+
+        class_pdf = archive.read(CLASS_PDF_NAME)
+        self.assertEqual(len(re.findall(rb'/Type /Page\b(?!s)', class_pdf)), 12)
+        self.assertEqual(class_pdf.count(b'/Subtype /Form'), 1)  # the static layer, stored once
+        self.assertLess(len(class_pdf), sum(archive.getinfo(n).file_size for n in names[:-1]) / 2)
+
+    def test_columnar_payloads_match_row_by_row(self):
+        df = graded_frame(students=40, subjects=5)
+        df['Adm No'] = df['Adm No'].astype(float)  # 1000.0 must print as 1000
+        grading = compile_grading_scheme(fake_exam().grading_scheme)
+        _, adm_col, student_payloads = report_card_inputs(df, fake_exam(), grading=grading)
+
+        scores = df[list(df.columns[3:8])].to_numpy(dtype=float)
+        grades, remarks, _ = grading.grade(scores)
+        expected = list(iterrows_payloads(df, adm_col, scores, grades, remarks))
+        self.assertEqual(list(student_payloads()), expected)
+        self.assertEqual(list(student_payloads([3, 1])), [expected[3], expected[1]])
+        self.assertEqual(expected[0][1], str(int(df['Adm No'].iloc[0])))
+
+
+def _pdf_content(pdf):
+    """Decoded page and form streams of a reportlab PDF (ASCII85 + Flate)."""
+    content = b''
+    for stream in re.findall(rb'stream\r?\n(.*?)endstream', pdf, re.S):
+        content += zlib.decompress(base64.a85decode(stream.strip()[:-2]))
+    return content
+
+
+class MediaTestCase(TestCase):
+    """Runs against a throwaway MEDIA_ROOT so real files can be written."""
+
+    # Render every artifact up front unless a test opts into lazy builds
+    prefetch = 'all'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.media = override_settings(MEDIA_ROOT=self.media_root, REPORT_WORKERS=1, ARTIFACT_PREFETCH=self.prefetch)
+        self.media.enable()
+        cache.clear()  # API throttle counters
+        self.user = User.objects.create_user('teacher', password='x')
+
+    def tearDown(self):
+        self.media.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def make_upload(self, title='Midterm', students=20, subjects=4, seed=42, **fields):
+        csv = synthetic_scores(students, subjects, seed=seed).to_csv(index=False).encode()
+        exam = ExamUpload(title=title, uploaded_by=self.user, **fields)
+        exam.file.save('exam.csv', ContentFile(csv), save=False)
+        exam.save()
+        return exam
+
+
+class ResultCacheTests(MediaTestCase):
+    def test_identical_reupload_is_served_from_cache(self):
+        first = self.make_upload()
+        process_exam_file(first)
+        self.assertEqual(ResultCacheEntry.objects.count(), 1)
+
+        second = self.make_upload()
+        self.assertTrue(restore_cached_result(second))
+        second.refresh_from_db()
+        self.assertEqual(second.status, ExamUpload.Status.COMPLETED)
+        self.assertEqual(second.analysis_summary, first.analysis_summary)
+        self.assertEqual(second.reports_zip.open('rb').read(), first.reports_zip.open('rb').read())
+        # Identical artifacts share one content-addressed blob
+        self.assertEqual(second.reports_zip.name, first.reports_zip.name)
+
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 0))
+
+    def test_retry_of_a_cached_exam_skips_the_pipeline(self):
+        from unittest import mock
+        from rest_framework.test import APIClient
+
+        process_exam_file(self.make_upload())
+        exam = self.make_upload()
+        enqueue_analysis(exam)
+        ExamUpload.objects.filter(pk=exam.pk).update(status=ExamUpload.Status.FAILED)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.post(f'/api/analytics/exam-uploads/{exam.id}/retry_processing/').status_code, 200)
+        with mock.patch('analytics.analysis.process_exam_file') as pipeline:
+            run_job(claim_next_job('w1'))
+        pipeline.assert_not_called()
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.COMPLETED)
+        self.assertIn('cached result', exam.message)
+        self.assertTrue(exam.finished_at)
+        self.assertEqual(cache_stats()['hits'], 1)
+
+    def test_pickle_snapshot_restores_scores(self):
+        from unittest import mock
+
+        # No pyarrow: save_frame falls back to pickle and the entry must keep the .pkl suffix
+        with mock.patch('analytics.ingest.HAS_PYARROW', False):
+            first = self.make_upload()
+            process_exam_file(first)
+        self.assertTrue(ResultCacheEntry.objects.get().analysis_data.name.endswith('.pkl'))
+
+        second = self.make_upload()
+        self.assertTrue(restore_cached_result(second))
+        self.assertGreater(Score.objects.filter(exam=second).count(), 0)
+        self.assertEqual(
+            Score.objects.filter(exam=second).count(),
+            Score.objects.filter(exam=first).count(),
+        )
+        self.assertTrue(second.analysis_data.name.endswith('.pkl'))
+
+    def test_changed_settings_miss(self):
+        process_exam_file(self.make_upload())
+        scheme = default_grading_scheme()
+        scheme[0]['min'] = 75
+        self.assertFalse(restore_cached_result(self.make_upload(grading_scheme=scheme)))
+        self.assertFalse(restore_cached_result(self.make_upload(custom_ignore_columns='Stream')))
+        self.assertTrue(restore_cached_result(self.make_upload(custom_ignore_columns='')))
+        self.assertEqual(cache_stats()['misses'], 2)
+
+    def test_lru_eviction(self):
+        process_exam_file(self.make_upload(title='Old'))
+        process_exam_file(self.make_upload(title='New'))
+        newest = ResultCacheEntry.objects.order_by('-last_used_at').first()
+
+        self.assertEqual(evict_cache(max_bytes=newest.size_bytes), 1)
+        self.assertEqual(list(ResultCacheEntry.objects.all()), [newest])
+
+
+class IngestTests(MediaTestCase):
+    def test_downcast_is_lossless(self):
+        df = pd.DataFrame({
+            'Math': [85, 40, 100],
+            'English': [85.0, 40.0, 99.0],
+            'Half': [45.5, 60.25, 70.0],
+            'Odd': [45.3, 60.1, 70.7],
+            'Adm': [104455, 104456, 104457],
+            'Gaps': [50.0, np.nan, 70.0],
+        })
+        small = downcast_numeric(df.copy())
+
+        self.assertEqual(small['Math'].dtype, np.uint8)
+        self.assertEqual(small['English'].dtype, np.uint8)
+        self.assertEqual(small['Half'].dtype, np.float32)
+        self.assertEqual(small['Odd'].dtype, np.float64)  # 45.3 has no exact float32
+        self.assertEqual(small['Adm'].dtype, np.uint32)
+        for col in df.columns:
+            self.assertTrue(np.array_equal(small[col].astype(float), df[col].astype(float), equal_nan=True), col)
+
+    def test_csv_identity_columns_are_read_as_text(self):
+        from .ingest import read_exam_file
+
+        path = os.path.join(self.media_root, 'padded.csv')
+        with open(path, 'w') as fh:
+            fh.write("Adm No,Name,Stream,Maths,English\n0012,Ann,East,50,ABS\n0013,Bob,West,60,70\n")
+        df, _ = read_exam_file(path)
+        self.assertEqual(df['Adm No'].tolist(), ['0012', '0013'])
+        self.assertEqual(df['Maths'].dtype, np.uint8)
+        self.assertEqual(df['English'].tolist(), ['ABS', '70'])  # coerced later, in the pipeline
+
+    def test_retry_reuses_parquet_snapshot(self):
+        exam = self.make_upload()
+        process_exam_file(exam)
+        self.assertTrue(exam.parsed_data.name.endswith('.parquet'))
+        self.assertIn('parse_seconds', exam.pipeline_state['ingest'])
+        self.assertEqual(len(load_frame(exam.parsed_data)), 20)
+
+        stages = process_exam_file(exam)
+        self.assertEqual(stages['read'], 'skipped')
+        self.assertEqual(stages['reports'], 'ran')
+
+    def test_unreadable_sheet_is_a_parse_error(self):
+        exam = ExamUpload(title='Broken', uploaded_by=self.user)
+        exam.file.save('exam.xlsx', ContentFile(b'not a workbook'), save=False)
+        exam.save()
+        process_exam_file(exam)
+        self.assertEqual(exam.status, ExamUpload.Status.FAILED)
+        self.assertTrue(exam.message.startswith('Error [parse_error]:'), exam.message)
+        self.assertEqual(exam.progress['failure'], 'parse_error')
+
+
+class IncrementalRegradeTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.exam = self.make_upload()
+        self.full_run = process_exam_file(self.exam)
+        self.exam.refresh_from_db()
+
+    def test_first_run_executes_every_stage(self):
+        self.assertEqual(set(self.full_run.values()), {'ran'})
+        self.assertTrue(self.exam.parsed_data)
+        self.assertEqual(len(self.exam.pipeline_state['subjects']), 4)
+
+    def test_scheme_change_only_regrades(self):
+        charts_before = self.exam.subject_chart.name
+        self.exam.grading_scheme = [{"min": 0, "max": 100, "grade": "P", "remark": "Pass", "points": 1}]
+        stages = process_exam_file(self.exam, incremental=True)
+
+        self.assertEqual(stages, {
+            'read': 'skipped', 'detection': 'skipped', 'calculations': 'skipped', 'grading': 'ran',
+            'summary': 'ran', 'scores': 'ran', 'excel': 'ran', 'charts': 'skipped', 'reports': 'ran', 'save': 'ran',
+        })
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.analysis_summary['grade_distribution'], {'P': 20})
+        self.assertEqual(self.exam.subject_chart.name, charts_before)
+
+    def test_subject_change_recomputes_totals(self):
+        first_subject = self.exam.pipeline_state['subjects'][0]
+        self.exam.custom_ignore_columns = first_subject
+        stages = process_exam_file(self.exam, incremental=True)
+
+        self.assertEqual(stages['read'], 'skipped')
+        self.assertEqual(stages['calculations'], 'ran')
+        self.assertEqual(stages['charts'], 'ran')
+        self.assertNotIn(first_subject, self.exam.pipeline_state['subjects'])
+
+    def test_regrade_endpoint_without_changes_skips_artifacts(self):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f'/api/analytics/exam-uploads/{self.exam.id}/regrade/', {}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['exam']['status'], 'PENDING')
+
+        # Queued: a second regrade (or a retry) can't run it concurrently
+        response = client.post(f'/api/analytics/exam-uploads/{self.exam.id}/regrade/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        run_job(claim_next_job('w1'))
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.status, 'COMPLETED')
+        skipped = {name for name, outcome in self.exam.progress['stages'].items() if outcome == 'skipped'}
+        self.assertEqual(skipped, {'read', 'detection', 'calculations', 'grading', 'scores', 'excel', 'charts', 'reports'})
+        self.assertEqual(self.exam.pipeline_state['stages'], self.exam.progress['stages'])
+
+    def test_regrade_saves_settings_with_the_claim(self):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ExamUpload.objects.filter(pk=self.exam.pk).update(status=ExamUpload.Status.PROCESSING)
+        scheme = [{"min": 0, "max": 100, "grade": "P", "remark": "Pass", "points": 1}]
+        response = client.post(f'/api/analytics/exam-uploads/{self.exam.id}/regrade/', {'grading_scheme': scheme}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.exam.refresh_from_db()
+        self.assertNotEqual(self.exam.grading_scheme, scheme)
+
+        ExamUpload.objects.filter(pk=self.exam.pk).update(status=ExamUpload.Status.COMPLETED)
+        response = client.post(f'/api/analytics/exam-uploads/{self.exam.id}/regrade/', {'grading_scheme': scheme}, format='json')
+        self.assertEqual(response.status_code, 202)
+        run_job(claim_next_job('w1'))
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.analysis_summary['grade_distribution'], {'P': 20})
+        self.assertEqual(self.exam.progress['stages']['read'], 'skipped')
+
+
+class LazyArtifactTests(MediaTestCase):
+    prefetch = 'charts'
+
+    def setUp(self):
+        super().setUp()
+        self.exam = self.make_upload()
+        self.stages = process_exam_file(self.exam)
+        self.exam.refresh_from_db()
+
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/analytics/exam-uploads/{self.exam.id}'
+
+    def download(self, url):
+        """First download: queued (202), built by a worker, then asked again."""
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '2')
+        run_task(claim_next_task('w1'))
+        return self.client.get(url)
+
+    def test_only_prefetched_artifacts_are_rendered(self):
+        self.assertEqual((self.stages['charts'], self.stages['excel'], self.stages['reports']), ('ran', 'deferred', 'deferred'))
+        self.assertTrue(self.exam.subject_chart)
+        self.assertFalse(self.exam.reports_zip)
+
+        artifacts = self.client.get(f'{self.url}/').data['artifacts']
+        self.assertTrue(artifacts['subject_chart']['ready'])
+        self.assertFalse(artifacts['reports_zip']['ready'])
+        self.assertTrue(artifacts['reports_zip']['url'].endswith(f'{self.url}/download/reports_zip/'))
+
+    def test_first_download_queues_the_build_then_serves_from_storage(self):
+        from unittest import mock
+
+        with mock.patch('analytics.artifacts.build_artifact') as build:
+            self.assertEqual(self.client.get(f'{self.url}/download/reports_zip/').status_code, 202)
+            # A second request while it is queued doesn't queue it again
+            self.assertEqual(self.client.get(f'{self.url}/download/reports_zip/').status_code, 202)
+        build.assert_not_called()
+        self.assertEqual(ExamTask.objects.filter(exam=self.exam, kind='reports').count(), 1)
+
+        run_task(claim_next_task('w1'))
+        self.assertIsNone(claim_next_task('w1'))
+        self.assertEqual(ExamTask.objects.get().status, ExamUpload.Status.COMPLETED)
+        response = self.client.get(f'{self.url}/download/reports_zip/')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 20)
+
+        self.exam.refresh_from_db()
+        built = self.exam.reports_zip.name
+        self.assertEqual(self.exam.pipeline_state['built']['reports'], self.exam.pipeline_state['fingerprints']['reports'])
+
+        self.assertEqual(self.client.get(f'{self.url}/download/reports_zip/').status_code, 200)
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.reports_zip.name, built)
+
+    def test_regrade_drops_stale_lazy_artifacts(self):
+        self.download(f'{self.url}/download/reports_zip/')
+        self.exam.refresh_from_db()
+        self.exam.grading_scheme = [{"min": 0, "max": 100, "grade": "P", "remark": "Pass", "points": 1}]
+        stages = process_exam_file(self.exam, incremental=True)
+
+        self.assertEqual(stages['reports'], 'deferred')
+        self.assertFalse(self.exam.reports_zip)
+        self.assertEqual(self.download(f'{self.url}/download/reports_zip/').status_code, 200)
+
+    def test_current_artifact_downloads_during_a_regrade(self):
+        enqueue_analysis(self.exam)
+        self.assertEqual(self.client.get(f'{self.url}/download/subject_chart/').status_code, 200)
+        self.assertEqual(self.client.get(f'{self.url}/download/reports_zip/').status_code, 409)
+        self.assertFalse(ExamTask.objects.exists())
+
+    def test_single_report_card(self):
+        response = self.client.get(f'{self.url}/report-card/1005/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        self.assertIn('_STUDENT 00005.pdf', response['Content-Disposition'])
+
+        self.assertEqual(self.client.get(f'{self.url}/report-card/99999/').status_code, 404)
+
+    def test_cached_result_builds_missing_artifact_from_the_snapshot(self):
+        from unittest import mock
+        from .artifacts import artifact_ready
+
+        copy = self.make_upload()
+        self.assertTrue(restore_cached_result(copy))
+        self.assertFalse(copy.processed_file)
+        self.assertTrue(copy.analysis_data)
+        self.assertEqual(copy.pipeline_state['built'], {'charts': self.exam.pipeline_state['fingerprints']['charts']})
+
+        with mock.patch('analytics.artifacts.process_exam_file') as full_run:
+            response = self.download(f'/api/analytics/exam-uploads/{copy.id}/download/processed_file/')
+        self.assertEqual(response.status_code, 200)
+        full_run.assert_not_called()
+        copy.refresh_from_db()
+        self.assertTrue(copy.subject_chart)
+        self.assertTrue(artifact_ready(copy, 'excel'))
+        # The cache entry now holds the workbook too
+        self.assertTrue(ResultCacheEntry.objects.get().processed_file)
+
+    def test_failed_build_leaves_the_exam_completed(self):
+        from unittest import mock
+
+        message = self.exam.message
+        with mock.patch('analytics.artifacts.build_artifact', side_effect=RuntimeError('renderer died')):
+            response = self.download(f'{self.url}/download/reports_zip/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['detail'], 'Error [error]: renderer died')
+        self.exam.refresh_from_db()
+        self.assertEqual((self.exam.status, self.exam.message), (ExamUpload.Status.COMPLETED, message))
+        self.assertFalse(self.exam.reports_zip)
+        # The failure is reported once; the next download queues a new attempt
+        self.assertEqual(self.download(f'{self.url}/download/reports_zip/').status_code, 200)
+
+    def test_exam_without_snapshot_is_rebuilt_without_touching_its_status(self):
+        from unittest import mock
+        from .artifacts import artifact_ready
+
+        self.exam.analysis_data.delete(save=False)
+        self.exam.save()
+        message, progress = self.exam.message, self.exam.progress
+
+        # A failing rebuild run is reported to the downloader only
+        with mock.patch('analytics.analysis.build_artifact', side_effect=MemoryError()):
+            response = self.download(f'{self.url}/download/processed_file/')
+        self.assertEqual((response.status_code, response.data['detail']), (409, 'Error [oom]: MemoryError'))
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.status, ExamUpload.Status.COMPLETED)
+
+        self.assertEqual(self.download(f'{self.url}/download/processed_file/').status_code, 200)
+        self.exam.refresh_from_db()
+        self.assertEqual((self.exam.status, self.exam.message, self.exam.progress), (ExamUpload.Status.COMPLETED, message, progress))
+        self.assertTrue(self.exam.analysis_data)
+        self.assertTrue(artifact_ready(self.exam, 'excel'))
+
+    def test_unfinished_exam_is_a_conflict(self):
+        enqueue_analysis(self.exam)
+        self.assertEqual(self.client.get(f'{self.url}/download/processed_file/').status_code, 409)
+        self.assertEqual(self.client.get(f'{self.url}/download/nonsense/').status_code, 404)
+
+
+class ScoreTableTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pipeline_loads_normalized_rows(self):
+        exam = self.make_upload()
+        process_exam_file(exam)
+
+        self.assertEqual(ExamResult.objects.filter(exam=exam).count(), 20)
+        self.assertEqual(Score.objects.filter(exam=exam).count(), 80)
+        self.assertEqual(Subject.objects.filter(owner=self.user).count(), 4)
+        top = ExamResult.objects.filter(exam=exam).order_by('rank').first()
+        self.assertEqual(top.student.name.title(), exam.analysis_summary['top_student'])
+
+        # A re-run replaces the exam's rows instead of adding to them
+        process_exam_file(exam)
+        self.assertEqual(Score.objects.filter(exam=exam).count(), 80)
+        self.assertEqual(Student.objects.filter(owner=self.user).count(), 20)
+
+    def test_bulk_load_is_batched(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        exam = self.make_upload()
+        df = synthetic_scores(2000, 10)
+        df['Total'] = df.iloc[:, 3:].sum(axis=1)
+        df['Average'] = df['Total'] / 10
+        df['Rank'] = df['Total'].rank(ascending=False, method='min')
+        classify_columns(df)  # The sheet's template was seen before: one column cache read
+        with CaptureQueriesContext(connection) as queries:
+            stored = store_scores(exam, df, list(df.columns[3:13]))
+        self.assertEqual(stored, 20000)
+        self.assertEqual(Score.objects.filter(exam=exam).count(), 20000)
+        # Scores go in 5000-row executemany batches; the 2000 students, their name
+        # tokens and results are batched too (SQLite's parameter limit caps those
+        # batches at a few hundred rows), and so are the identity index lookups
+        self.assertLess(len(queries), 85)
+
+    def test_duplicate_admission_numbers_rank_within_the_stored_rows(self):
+        from unittest import mock
+
+        exam = self.make_upload()
+        df = synthetic_scores(10, 4)
+        df['Total'] = df.iloc[:, 3:].sum(axis=1)
+        df['Average'] = df['Total'] / 4
+        df['Rank'] = df['Total'].rank(ascending=False, method='min')
+        df = df.sort_values('Rank', ignore_index=True)
+        df.loc[9, 'Adm No'] = df.loc[0, 'Adm No']  # the last row repeats the top student
+
+        # A failed load leaves no students behind either
+        with mock.patch('analytics.scores._insert_scores', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                store_scores(exam, df, list(df.columns[3:7]))
+        self.assertFalse(Student.objects.filter(owner=self.user).exists())
+
+        store_scores(exam, df, list(df.columns[3:7]))
+        results = ExamResult.objects.filter(exam=exam).order_by('rank')
+        self.assertEqual(len(results), 9)
+        self.assertEqual({r.class_size for r in results}, {9})
+        expected = df.drop(index=9)['Total'].rank(ascending=False, method='min').astype(int).tolist()
+        self.assertEqual([r.rank for r in results], sorted(expected))
+        self.assertEqual(results.first().percentile, 100)
+        self.assertTrue(all(0 < r.percentile <= 100 for r in results))
+
+    def test_student_history_and_subject_trend(self):
+        first = self.make_upload(title='CAT 1')
+        process_exam_file(first)
+        second = self.make_upload(title='Midterm', grading_scheme=[{"min": 0, "max": 100, "grade": "P", "remark": "Pass", "points": 1}])
+        process_exam_file(second)
+
+        student = Student.objects.get(owner=self.user, adm_no='1003')
+        response = self.client.get(f'/api/analytics/students/{student.id}/history/')
+        self.assertEqual(response.status_code, 200)
+        exams = response.data['exams']
+        self.assertEqual([e['title'] for e in exams], ['CAT 1', 'Midterm'])
+        self.assertEqual(exams[1]['class_size'], 20)
+        self.assertEqual({s['grade'] for s in exams[1]['scores'].values()}, {'P'})
+
+        subject = Subject.objects.get(owner=self.user, key='mathematics')
+        response = self.client.get(f'/api/analytics/subjects/{subject.id}/trend/')
+        means = [e['mean'] for e in response.data['exams']]
+        expected = round(float(synthetic_scores(20, 4)['Mathematics'].mean()), 2)
+        self.assertEqual(means, [expected, expected])
+
+        self.assertEqual(self.client.get('/api/analytics/students/', {'search': '100'}).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/analytics/subjects/{subject.id}/trend/', {'from': 'soon'}).status_code, 400)
+
+    def test_other_schools_cannot_read_history(self):
+        process_exam_file(self.make_upload())
+        student = Student.objects.filter(owner=self.user).first()
+        other = User.objects.create_user('rival', password='x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/analytics/students/{student.id}/history/').status_code, 404)
+
+    def test_cache_hit_fills_score_tables(self):
+        process_exam_file(self.make_upload())
+        copy = self.make_upload()
+        self.assertTrue(restore_cached_result(copy))
+        self.assertEqual(Score.objects.filter(exam=copy).count(), 80)
+
+    def test_cached_upload_leaves_its_scores_to_a_worker(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from rest_framework.test import APIClient
+
+        first = self.make_upload()
+        process_exam_file(first)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with first.file.open('rb') as fh:
+            upload = SimpleUploadedFile('exam.csv', fh.read(), content_type='text/csv')
+        response = client.post('/api/analytics/exam-uploads/', {'title': 'Midterm', 'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        copy = ExamUpload.objects.get(pk=response.data['id'])
+        self.assertEqual(copy.status, ExamUpload.Status.COMPLETED)
+        self.assertFalse(Score.objects.filter(exam=copy).exists())
+        run_task(claim_next_task('w1'))
+        self.assertEqual(ExamTask.objects.get(exam=copy).status, ExamUpload.Status.COMPLETED)
+        self.assertEqual(Score.objects.filter(exam=copy).count(), 80)
+
+
+class IdentityIndexTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def store(self, title, **columns):
+        df = pd.DataFrame(columns)
+        df['Mathematics'] = [60 + i for i in range(len(df))]
+        df['Total'] = df['Average'] = df['Mathematics']
+        df['Rank'] = range(1, len(df) + 1)
+        exam = ExamUpload.objects.create(title=title, uploaded_by=self.user)
+        store_scores(exam, df, ['Mathematics'])
+        return exam
+
+    def test_students_are_matched_across_sheets(self):
+        self.store('CAT 1', Name=['John Kamau', 'Mary Wanjiru'])
+        # Word order, case and punctuation don't matter; the admission number is adopted
+        self.store('CAT 2', **{'Adm No': ['4344.0', '4345'], 'Name': ['KAMAU, john', 'Mary  Wanjiru'], 'UPI': ['A1B2', '']})
+        # A sheet without admission numbers still finds them by UPI and by name
+        self.store('CAT 3', **{'Name': ['J. Kamau', 'Wanjiru Mary'], 'UPI Number': ['a1b2', '']})
+
+        students = Student.objects.filter(owner=self.user).order_by('key')
+        self.assertEqual([(s.key, s.upi, s.search_name) for s in students],
+                         [('4344', 'A1B2', 'JOHN KAMAU'), ('4345', '', 'MARY WANJIRU')])
+        self.assertEqual(ExamResult.objects.filter(student=students[0]).count(), 3)
+        self.assertEqual(ExamResult.objects.filter(student=students[1]).count(), 3)
+
+    def test_namesakes_stay_apart(self):
+        self.store('CAT 1', **{'Adm No': [1, 2], 'Name': ['Ann Achieng', 'Achieng Ann']})
+        self.store('CAT 2', Name=['Ann Achieng'])
+        self.assertEqual(Student.objects.filter(owner=self.user).count(), 3)
+
+    def test_typeahead(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        self.store('CAT 1', **{'Adm No': ['120', '12', '1200'], 'Name': ['Brian Otieno', 'Otieno Faith', 'Grace Njeri']})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/analytics/students/search/', {'q': '12'})
+        self.assertEqual([s['adm_no'] for s in response.data], ['12', '120', '1200'])
+        self.assertEqual(len(queries), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            names = self.client.get('/api/analytics/students/search/', {'q': 'otieno b'}).data
+        self.assertEqual([s['name'] for s in names], ['Brian Otieno'])
+        # Name words are token prefix scans, never a leading-wildcard LIKE
+        self.assertNotIn("'%", queries[-1]['sql'])
+        self.assertEqual(
+            sorted(StudentNameToken.objects.filter(student__name='Brian Otieno').values_list('token', flat=True)),
+            ['BRIAN', 'OTIENO'],
+        )
+        names = self.client.get('/api/analytics/students/', {'search': 'oti'}).data
+        self.assertEqual([s['name'] for s in names], ['Brian Otieno', 'Otieno Faith'])
+        self.assertEqual(self.client.get('/api/analytics/students/search/', {'q': ' '}).data, [])
+
+        other = User.objects.create_user('rival', password='x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/analytics/students/search/', {'q': '12'}).data, [])
+
+class TrendRollupTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cat = self.make_upload(title='CAT 1', seed=1)
+        self.midterm = self.make_upload(title='Midterm', seed=2)
+        process_exam_file(self.cat)
+        process_exam_file(self.midterm)
+
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_rollups_are_written_with_the_scores(self):
+        results = ExamResult.objects.filter(exam=self.cat)
+        self.assertEqual({r.class_size for r in results}, {20})
+        self.assertAlmostEqual(sum(r.z_score for r in results), 0, places=2)
+        self.assertEqual(results.get(rank=1).percentile, 100)
+
+        maths = SubjectRollup.objects.get(exam=self.cat, subject__key='mathematics')
+        sheet = synthetic_scores(20, 4, seed=1)['Mathematics']
+        self.assertAlmostEqual(maths.mean, sheet.mean(), places=3)
+        self.assertEqual((maths.highest, maths.passed), (sheet.max(), int((sheet >= 50).sum())))
+
+    def test_series_trends(self):
+        response = self.client.get('/api/analytics/exam-uploads/trends/', {'exams': f'{self.cat.id},{self.midterm.id}'})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+
+        self.assertEqual([e['title'] for e in data['exams']], ['CAT 1', 'Midterm'])
+        maths = next(s for s in data['subjects'] if s['subject'] == 'Mathematics')
+        before, after = (round(synthetic_scores(20, 4, seed=seed)['Mathematics'].mean(), 2) for seed in (1, 2))
+        self.assertEqual(maths['means'], [before, after])
+        self.assertAlmostEqual(maths['delta'], after - before, places=2)
+
+        self.assertEqual(len(data['students']), 20)
+        added = [s['value_added'] for s in data['students']]
+        self.assertEqual(added, sorted(added, reverse=True))
+        student = data['students'][0]
+        ranks = [ExamResult.objects.get(exam=e, student_id=student['id']).rank for e in (self.cat, self.midterm)]
+        self.assertEqual(student['rank_change'], ranks[0] - ranks[1])
+
+    def test_series_trends_only_read_rollups(self):
+        exams = [self.cat, self.midterm]
+        # subject rollups, students, then one indexed lookup per exam
+        with self.assertNumQueries(2 + len(exams)):
+            exam_series_trends(exams)
+
+    def test_series_validation(self):
+        url = '/api/analytics/exam-uploads/trends/'
+        self.assertEqual(self.client.get(url, {'exams': str(self.cat.id)}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'exams': f'{self.cat.id},nope'}).status_code, 400)
+
+        other = User.objects.create_user('rival', password='x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url, {'exams': f'{self.cat.id},{self.midterm.id}'}).status_code, 404)
+
+    def test_rebuild_command_backfills_rollups(self):
+        from django.core.management import call_command
+
+        SubjectRollup.objects.all().delete()
+        call_command('rebuild_score_tables', stdout=io.StringIO())
+        self.assertEqual(SubjectRollup.objects.filter(exam=self.cat).count(), 4)
+
+
+class InstrumentationTests(MediaTestCase):
+    def test_every_stage_is_timed(self):
+        exam = self.make_upload()
+        process_exam_file(exam)
+
+        timings = list(exam.stage_timings.all())
+        self.assertEqual([t.stage for t in timings], [s for s in STAGES if s != 'streams'])
+        for t in timings:
+            self.assertGreaterEqual(t.wall_seconds, 0)
+            self.assertGreater(t.peak_rss_bytes, 0)
+        self.assertFalse(exam.profile_file)
+
+        # A second run replaces the rows instead of piling them up
+        process_exam_file(exam)
+        self.assertEqual(exam.stage_timings.count(), len(STAGES) - 1)
+        self.assertEqual(exam.stage_timings.get(stage='read').outcome, 'skipped')
+
+    def test_opt_in_profile_is_downloadable_by_staff(self):
+        from rest_framework.test import APIClient
+
+        exam = self.make_upload(profile_enabled=True)
+        process_exam_file(exam)
+        self.assertTrue(exam.profile_file.name.endswith('.prof'))
+        stats = pstats.Stats(exam.profile_file.path)
+        self.assertTrue(any(func[2] == 'calculate_totals' for func in stats.stats))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(f'/api/analytics/exam-uploads/{exam.id}/profile/').status_code, 403)
+
+        staff = User.objects.create_user('ops', password='x', is_staff=True)
+        client.force_authenticate(staff)
+        response = client.get(f'/api/analytics/exam-uploads/{exam.id}/profile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), exam.profile_file.open('rb').read())
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_prometheus_metrics(self):
+        exam = self.make_upload()
+        process_exam_file(exam)
+
+        self.assertEqual(self.client.get('/api/analytics/metrics/').status_code, 401)
+        response = self.client.get('/api/analytics/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('exam_analysis_stage_wall_seconds_count{stage="reports"} 1', body)
+        self.assertIn('exam_analysis_stage_runs_total{stage="read",outcome="ran"} 1', body)
+        self.assertIn('exam_uploads{status="COMPLETED"} 1', body)
+
+        # Re-runs replace the exam's StageTiming rows, but the counters only go up
+        process_exam_file(exam)
+        body = self.client.get('/api/analytics/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn('exam_analysis_stage_wall_seconds_count{stage="reports"} 2', body)
+        self.assertIn('exam_analysis_stage_runs_total{stage="read",outcome="ran"} 1', body)
+        self.assertIn('exam_analysis_stage_runs_total{stage="read",outcome="skipped"} 1', body)
+
+
+class ProgressTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_summary_is_published_before_artifacts(self):
+        from unittest import mock
+        from . import analysis
+
+        exam = self.make_upload()
+        seen = {}
+        real_build = analysis.build_artifact
+
+        def build(exam_instance, name, context):
+            stored = ExamUpload.objects.get(pk=exam_instance.pk)
+            seen[name] = (stored.status, stored.progress['stage'], stored.progress['summary_ready'], stored.analysis_summary)
+            return real_build(exam_instance, name, context)
+
+        with mock.patch.object(analysis, 'build_artifact', side_effect=build):
+            process_exam_file(exam)
+
+        status, stage, ready, summary = seen['excel']
+        self.assertEqual((stage, ready), ('excel', True))
+        self.assertNotEqual(status, 'COMPLETED')
+        self.assertEqual(summary['student_count'], 20)
+
+        exam.refresh_from_db()
+        self.assertEqual(exam.progress['stage'], 'done')
+        self.assertEqual(exam.progress['percent'], 100)
+        self.assertFalse(exam.progress['failed'])
+
+    def test_progress_endpoint(self):
+        exam = self.make_upload()
+        url = f'/api/analytics/exam-uploads/{exam.id}/progress/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'PENDING')
+        self.assertIsNone(response.data['analysis_summary'])
+
+        process_exam_file(exam)
+        response = self.client.get(url)
+        self.assertEqual(set(response.data), {'id', 'status', 'message', 'progress', 'analysis_summary'})
+        self.assertEqual(response.data['progress']['percent'], 100)
+        self.assertEqual(response.data['analysis_summary']['student_count'], 20)
+
+        other = User.objects.create_user('other', password='x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(PROGRESS_POLL_INTERVAL=0.05)
+class ProgressStreamTests(MediaTestCase):
+    def stream_token(self, exam, user=None):
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user or self.user)
+        response = client.post(f'/api/analytics/exam-uploads/{exam.id}/stream-token/')
+        return response.data['token'] if response.status_code == 200 else response.status_code
+
+    @staticmethod
+    async def next_event(stream):
+        import json
+        while True:
+            chunk = await asyncio.wait_for(anext(stream), timeout=5)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            for line in chunk.splitlines():
+                if line.startswith('data: '):
+                    return json.loads(line[6:])
+
+    async def test_stream_pushes_progress_until_completed(self):
+        from asgiref.sync import sync_to_async
+        from .instrumentation import write_progress
+
+        exam = await sync_to_async(self.make_upload)()
+        token = await sync_to_async(self.stream_token)(exam)
+        response = await self.async_client.get(f'/api/analytics/exam-uploads/{exam.id}/events/', {'token': token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual((await self.next_event(stream))['status'], 'PENDING')
+
+        await sync_to_async(write_progress)(exam, 'grading', 3, 10)
+        event = await self.next_event(stream)
+        self.assertEqual((event['progress']['stage'], event['progress']['percent']), ('grading', 30))
+        self.assertIsNone(event['analysis_summary'])
+
+        await sync_to_async(process_exam_file)(exam)
+        event = await self.next_event(stream)
+        while event['status'] != 'COMPLETED':  # stage events the hub caught mid-run
+            event = await self.next_event(stream)
+        self.assertEqual(event['analysis_summary']['student_count'], 20)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    async def test_stream_requires_a_token_for_this_exam(self):
+        from asgiref.sync import sync_to_async
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        exam, other_exam = await sync_to_async(self.make_upload)(), await sync_to_async(self.make_upload)()
+        url = f'/api/analytics/exam-uploads/{exam.id}/events/'
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, {'token': 'garbage'})).status_code, 401)
+        # A JWT is no longer accepted, in the query string or the header
+        jwt = str(AccessToken.for_user(self.user))
+        self.assertEqual((await self.async_client.get(url, {'token': jwt})).status_code, 401)
+        self.assertEqual((await self.async_client.get(url, headers={'Authorization': f'Bearer {jwt}'})).status_code, 401)
+        # Tokens are scoped to one exam, and only its owner gets one
+        self.assertEqual((await self.async_client.get(url, {'token': await sync_to_async(self.stream_token)(other_exam)})).status_code, 401)
+        other = await sync_to_async(User.objects.create_user)('other', password='x')
+        self.assertEqual(await sync_to_async(self.stream_token)(exam, other), 404)
+
+        token = await sync_to_async(self.stream_token)(exam)
+        self.assertEqual((await self.async_client.get(url, {'token': token})).status_code, 200)
+        with override_settings(PROGRESS_STREAM_TOKEN_MAX_AGE=0):
+            await asyncio.sleep(1.1)
+            self.assertEqual((await self.async_client.get(url, {'token': token})).status_code, 401)
+
+
+class ExamListTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.done = self.make_upload(title='End Term')
+        process_exam_file(self.done)
+        self.pending = [self.make_upload(title=f'CAT {i}') for i in range(3)]
+        self.url = '/api/analytics/exam-uploads/'
+
+    def test_list_rows_are_lean(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 4)
+        row = next(r for r in response.data['results'] if r['id'] == str(self.done.id))
+        self.assertEqual(set(row), {
+            'id', 'title', 'slug', 'status', 'message', 'uploaded_by_username', 'uploaded_at', 'updated_at', 'summary',
+        })
+        self.assertEqual(row['uploaded_by_username'], 'teacher')
+        self.assertEqual(row['summary']['student_count'], 20)
+        self.assertEqual(row['summary']['class_mean'], self.done.analysis_summary['class_mean'])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        # One aggregate for the ETag, one page query (owner joined, JSON keys in SQL)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        for i in range(5):
+            self.make_upload(title=f'Mock {i}')
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.data['results']), 9)
+
+    def test_cursor_pagination_and_filters(self):
+        first = self.client.get(self.url, {'page_size': 3})
+        self.assertEqual(len(first.data['results']), 3)
+        second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 1)
+        seen = {r['id'] for r in first.data['results'] + second.data['results']}
+        self.assertEqual(len(seen), 4)
+
+        completed = self.client.get(self.url, {'status': 'completed'}).data['results']
+        self.assertEqual([r['id'] for r in completed], [str(self.done.id)])
+        today = timezone.localdate()
+        self.assertEqual(len(self.client.get(self.url, {'from': today.isoformat()}).data['results']), 4)
+        self.assertEqual(len(self.client.get(self.url, {'to': (today - timedelta(days=1)).isoformat()}).data['results']), 0)
+        self.assertEqual(self.client.get(self.url, {'status': 'LOST'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'from': 'yesterday'}).status_code, 400)
+
+    def test_unchanged_list_and_detail_return_304(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.pending[0].delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        detail = f'{self.url}{self.done.id}/'
+        response = self.client.get(detail)
+        self.assertIn('grading_scheme', response.data)
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(
+            self.client.get(detail, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        self.done.title = 'End Term (final)'
+        self.done.save()
+        self.assertEqual(self.client.get(detail, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class MediaDeliveryTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.exam = self.make_upload()
+        process_exam_file(self.exam)
+        self.exam.refresh_from_db()
+        self.body = self.exam.processed_file.open('rb').read()
+        self.exam.processed_file.close()
+        self.detail = self.api.get(f'/api/analytics/exam-uploads/{self.exam.id}/').data
+
+    def test_media_links_are_signed(self):
+        from urllib.parse import urlsplit
+        link = urlsplit(self.detail['processed_file'])
+        self.assertEqual(self.client.get(link.path).status_code, 403)
+        self.assertEqual(self.client.get(f'{link.path}?{link.query.replace("sig=", "sig=x")}').status_code, 403)
+
+        response = self.client.get(f'{link.path}?{link.query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+
+        chart = urlsplit(self.detail['subject_chart'])
+        self.assertEqual(self.client.get(f'{chart.path}?{chart.query}')['Content-Type'], 'image/png')
+
+    def test_range_and_conditional_requests(self):
+        url = self.detail['artifacts']['processed_file']['url']
+        full = self.api.get(url)
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+        etag = full['ETag']
+
+        part = self.api.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part['Content-Range'], f'bytes 10-19/{len(self.body)}')
+        self.assertEqual(b''.join(part.streaming_content), self.body[10:20])
+        tail = self.api.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(tail.streaming_content), self.body[-5:])
+        self.assertEqual(self.api.get(url, HTTP_RANGE=f'bytes={len(self.body)}-').status_code, 416)
+        # A stale If-Range gets the whole (new) file instead of a mismatched slice
+        self.assertEqual(self.api.get(url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"').status_code, 200)
+
+        self.assertEqual(self.api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.api.get(url, HTTP_IF_MODIFIED_SINCE=full['Last-Modified']).status_code, 304)
+
+    @override_settings(MEDIA_OFFLOAD='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_offload_to_web_server(self):
+        response = self.api.get(self.detail['artifacts']['processed_file']['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.exam.processed_file.name}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+
+class BroadsheetExportTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.exam = self.make_upload(students=30)
+        process_exam_file(self.exam)
+        self.exam.refresh_from_db()
+
+    def test_workbook_is_styled_by_range(self):
+        import openpyxl
+
+        with self.exam.processed_file.open('rb') as fh:
+            workbook = openpyxl.load_workbook(io.BytesIO(fh.read()))
+        self.assertEqual(workbook.sheetnames, ['Broadsheet', 'Subject Analysis'])
+        sheet = workbook['Broadsheet']
+        self.assertEqual(sheet.freeze_panes, 'C2')  # header row + Adm No/Name
+        self.assertEqual(sheet.max_row, 31)
+        # One rule per grade band (4) on each subject (4) and on Overall Grade
+        rules = [rule for cf in sheet.conditional_formatting for rule in cf.rules]
+        self.assertEqual(len(rules), 4 * 5)
+        header = [cell.value for cell in sheet[1]]
+        self.assertEqual(header[:2], ['Adm No', 'Name'])
+        self.assertIn('Overall Grade', header)
+
+    def test_csv_and_parquet_exports(self):
+        url = f'/api/analytics/exam-uploads/{self.exam.id}/export'
+        response = self.api.get(f'{url}/csv/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Analyzed_Midterm.csv', response['Content-Disposition'])
+        csv = pd.read_csv(io.StringIO(b''.join(response.streaming_content).decode()))
+
+        response = self.api.get(f'{url}/parquet/')
+        self.assertEqual(response.status_code, 200)
+        parquet = pd.read_parquet(io.BytesIO(response.content))
+        self.assertEqual(len(csv), 30)
+        self.assertEqual(list(csv.columns), list(parquet.columns))
+        self.assertEqual(csv['Total'].tolist(), parquet['Total'].tolist())
+
+        pending = self.make_upload('Pending')
+        self.assertEqual(self.api.get(f'/api/analytics/exam-uploads/{pending.id}/export/csv/').status_code, 409)
+
+
+@override_settings(RESULT_CACHE_ENABLED=False)
+class ArtifactStorageTests(MediaTestCase):
+    def test_identical_artifacts_share_a_blob_until_unreferenced(self):
+        import os
+        from .storage import collect_garbage
+
+        first, second = self.make_upload(title='Midterm'), self.make_upload(title='Midterm')
+        process_exam_file(first)
+        process_exam_file(second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.subject_chart.name.startswith('cas/'))
+        self.assertEqual(first.subject_chart.name, second.subject_chart.name)
+        chart = first.subject_chart.path
+
+        first.delete()
+        collect_garbage(grace_seconds=0)
+        self.assertTrue(os.path.exists(chart))  # still used by the second exam
+
+        second.delete()
+        self.assertEqual(collect_garbage(grace_seconds=3600)[0], 0)  # too young to collect
+        removed, freed = collect_garbage(grace_seconds=0)
+        self.assertGreaterEqual(removed, 3)
+        self.assertGreater(freed, 0)
+        self.assertFalse(os.path.exists(chart))
+
+    def test_blob_reused_during_the_sweep_survives(self):
+        import os
+        from unittest import mock
+        from .storage import artifact_storage, collect_garbage
+
+        storage = artifact_storage()
+        name = storage.save('orphan.csv', ContentFile(b'adm,name\n' * 100))
+        path = storage.path(name)
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+
+        real_rename = os.rename
+
+        def reused_first(src, dst):
+            # A dedup hit lands between the sweep's stat and its removal
+            storage.save('again.csv', ContentFile(b'adm,name\n' * 100))
+            real_rename(src, dst)
+
+        with mock.patch('analytics.storage.os.rename', side_effect=reused_first):
+            self.assertEqual(collect_garbage(grace_seconds=60)[0], 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(collect_garbage(grace_seconds=0)[0], 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_leftover_lock_files_are_swept(self):
+        import os
+        from django.conf import settings
+        from .storage import collect_garbage
+
+        lock_dir = os.path.join(settings.MEDIA_ROOT, 'locks')
+        os.makedirs(lock_dir)
+        lock = os.path.join(lock_dir, 'exam-1-reports.lock')
+        open(lock, 'w').close()
+        collect_garbage(grace_seconds=3600)
+        self.assertTrue(os.path.exists(lock))
+        collect_garbage(grace_seconds=0)
+        self.assertFalse(os.path.exists(lock))
+
+    def test_text_blobs_get_a_gzip_variant(self):
+        from .media import serve_file
+        from .storage import artifact_storage, gzip_variant
+        from django.test import RequestFactory
+
+        storage = artifact_storage()
+        text = ('Adm,Name,Maths\n' + '1001,JANE,78\n' * 2000).encode()
+        name = storage.save('results.csv', ContentFile(text))
+        self.assertEqual(storage.save('copy.csv', ContentFile(text)), name)
+        self.assertIsNotNone(gzip_variant(storage.path(name)))
+        self.assertIsNone(gzip_variant(storage.path(storage.save('chart.png', ContentFile(b'\x89PNG' * 10)))))
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        response = serve_file(request, storage.path(name))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=31536000, immutable')
+        import gzip
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), text)
+        self.assertNotIn('Content-Encoding', serve_file(RequestFactory().get('/'), storage.path(name)))
+
+
+class BenchmarkHarnessTests(MediaTestCase):
+    def test_messy_sheet_runs_through_the_pipeline(self):
+        sheet = messy_scores(students=60, subjects=6)
+        exam = ExamUpload(title='Messy', uploaded_by=self.user)
+        exam.file.save('messy.csv', ContentFile(sheet_bytes(sheet, 'csv')), save=False)
+        exam.save()
+        process_exam_file(exam)
+
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.COMPLETED, exam.message)
+        subjects = exam.pipeline_state['subjects']
+        self.assertEqual(len(subjects), 6)
+        self.assertFalse({'Phone', 'KCPE Marks', 'UPI Number'} & set(subjects))
+        self.assertIsInstance(exam.analysis_summary['class_mean'], float)
+
+    def test_compare_results_flags_only_real_regressions(self):
+        def run(read, reports, rss=100 * 1024 ** 2):
+            return {'scenarios': {'csv-500x12': {'stages': {
+                'read': {'wall_seconds': read, 'peak_rss_bytes': rss},
+                'reports': {'wall_seconds': reports, 'peak_rss_bytes': rss},
+            }}}}
+
+        baseline = run(read=0.010, reports=2.0)
+        self.assertEqual(compare_results(baseline, run(read=0.030, reports=2.2)), [])  # noise / within 25%
+        regressions = compare_results(baseline, run(read=0.010, reports=3.0))
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('reports', regressions[0])
+        self.assertEqual(len(compare_results(baseline, run(read=0.010, reports=2.0, rss=400 * 1024 ** 2))), 2)
+
+
+class BatchUploadTests(MediaTestCase):
+    def make_batch(self, streams=('7 East', '7 West', '7 North'), students=15):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            for seed, stream in enumerate(streams):
+                sheet = synthetic_scores(students, 4, seed=seed).drop(columns='Stream')
+                archive.writestr(f'term1/{stream}.csv', sheet.to_csv(index=False))
+            archive.writestr('__MACOSX/term1/._7 East.csv', b'junk')
+        exam = ExamUpload(title='Term 1', uploaded_by=self.user)
+        exam.file.save('school.zip', ContentFile(buffer.getvalue()), save=False)
+        exam.save()
+        return exam
+
+    def test_zip_of_streams_is_one_job(self):
+        exam = self.make_batch()
+        stages = process_exam_file(exam)
+        exam.refresh_from_db()
+
+        self.assertEqual(exam.status, ExamUpload.Status.COMPLETED, exam.message)
+        self.assertEqual(stages['streams'], 'ran')
+        self.assertEqual([s['name'] for s in exam.pipeline_state['ingest']['streams']], ['7 East', '7 West', '7 North'])
+        self.assertEqual(exam.analysis_summary['student_count'], 45)
+        self.assertEqual(sorted(s['stream'] for s in exam.analysis_summary['streams']), ['7 East', '7 North', '7 West'])
+
+        broadsheet = pd.read_excel(exam.processed_file.path, sheet_name=None)
+        self.assertIn('Stream Analysis', broadsheet)
+        combined = broadsheet['Broadsheet']
+        self.assertEqual(combined['Rank'].min(), 1)
+        for _, rows in combined.groupby('Stream'):
+            expected = rows['Total'].rank(ascending=False, method='min')
+            self.assertTrue((rows['Stream Rank'] == expected).all())
+
+        with zipfile.ZipFile(exam.stream_artifacts.path) as archive:
+            self.assertIn('7 West/Broadsheet.xlsx', archive.namelist())
+            self.assertIn('7 West/sub_chart.png', archive.namelist())
+        with zipfile.ZipFile(exam.reports_zip.path) as archive:
+            names = archive.namelist()
+        self.assertEqual(len(names), 45)
+        self.assertTrue(all(name.split('/')[0] in ('7 East', '7 West', '7 North') for name in names))
+
+    def test_workbook_sheets_become_streams_but_notes_do_not(self):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            for seed, stream in enumerate(['8A', '8B']):
+                synthetic_scores(10, 4, seed=seed).drop(columns='Stream').to_excel(writer, sheet_name=stream, index=False)
+            pd.DataFrame({'Notes': ['Marked by Mr. Otieno']}).to_excel(writer, sheet_name='Notes', index=False)
+        exam = ExamUpload(title='Grade 8', uploaded_by=self.user, sheets_as_streams=True)
+        exam.file.save('grade8.xlsx', ContentFile(buffer.getvalue()), save=False)
+        exam.save()
+
+        process_exam_file(exam)
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.COMPLETED, exam.message)
+        self.assertEqual([s['name'] for s in exam.pipeline_state['ingest']['streams']], ['8A', '8B'])
+        self.assertEqual(exam.analysis_summary['student_count'], 20)
+
+    def test_similar_sheets_stay_a_single_sheet_upload_without_the_flag(self):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            for seed, name in enumerate(['Term 1', 'Term 1 (old copy)']):
+                synthetic_scores(10, 4, seed=seed).drop(columns='Stream').to_excel(writer, sheet_name=name, index=False)
+        exam = ExamUpload(title='Grade 8', uploaded_by=self.user)
+        exam.file.save('grade8.xlsx', ContentFile(buffer.getvalue()), save=False)
+        exam.save()
+
+        stages = process_exam_file(exam)
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, ExamUpload.Status.COMPLETED, exam.message)
+        self.assertNotIn('streams', stages)
+        self.assertNotIn('streams', exam.pipeline_state['ingest'])
+        self.assertEqual(exam.analysis_summary['student_count'], 10)
+
+
+class ChartEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.df = graded_frame(120, 6)
+        self.means = self.df[list(self.df.columns[3:9])].mean().reset_index()
+        self.means.columns = ['Subject', 'Mean Score']
+
+    def test_renders_png_and_memoizes_by_data(self):
+        engine = ChartEngine()
+        first = engine.subject_performance_chart(self.means).read()
+        self.assertTrue(first.startswith(b'\x89PNG'))
+        self.assertEqual(engine.subject_performance_chart(self.means.copy()).read(), first)
+        self.assertEqual((engine.hits, engine.misses), (1, 1))
+
+        changed = self.means.assign(**{'Mean Score': self.means['Mean Score'] + 1})
+        self.assertNotEqual(engine.subject_performance_chart(changed).read(), first)
+        self.assertEqual(engine.misses, 2)
+
+    def test_shared_engine_is_thread_safe(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def digest(png):
+            return hashlib.sha256(png.read()).hexdigest()
+
+        # Reused templates must draw exactly what a fresh figure draws, from any thread
+        frames = [self.df.assign(Average=self.df['Average'] + shift) for shift in (-20, -10, 0, 10)]
+        expected = [digest(ChartEngine(cache_size=0).pass_rate_chart(df)) for df in frames]
+
+        shared = ChartEngine(cache_size=0)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            rendered = list(pool.map(lambda df: digest(shared.pass_rate_chart(df)), frames * 3))
+        self.assertEqual(rendered, expected * 3)
+
+
+class ColumnClassifierTests(TestCase):
+    def setUp(self):
+        caches['columns'].clear()
+
+    def test_roles_of_a_messy_sheet(self):
+        df = messy_scores(40)
+        df.insert(5, 'English Composition', np.arange(40) % 100)
+        df.insert(6, 'S/No', np.arange(40))
+        roles = classify_columns(df, 'nemis, ')
+        self.assertEqual((roles.adm, roles.name), ('Adm No', 'Name'))
+        self.assertIn('English Composition', roles.subjects)
+        for column in ('Stream', 'Phone', 'KCPE Marks', 'UPI Number', 'S/No'):
+            self.assertIn(column, roles.ignored)
+        self.assertEqual(len(roles.subjects), 11)
+
+    def test_text_scores_are_sampled_and_parsed(self):
+        df = synthetic_scores(30, subjects=3)
+        df['English'] = df['English'].astype(str).where(df.index % 10 != 0, 'ABS')
+        self.assertIn('English', classify_columns(df).subjects)
+        graded = calculate_totals(df, detect_subject_columns(df))
+        self.assertEqual(graded['English'].dtype, np.float64)
+
+    def test_same_header_skips_detection(self):
+        df = synthetic_scores(20, subjects=4)
+        from unittest import mock
+
+        first = classify_columns(df, 'Kiswahili')
+        self.assertNotIn('Kiswahili', first.subjects)
+        with mock.patch('analytics.columns._classify') as classify:
+            again = classify_columns(synthetic_scores(50, subjects=4, seed=7), 'kiswahili')
+        classify.assert_not_called()
+        self.assertEqual(again, first)
+
+    def test_cached_header_still_checks_the_values(self):
+        df = synthetic_scores(20, subjects=3)
+        df['Club'] = df['Mathematics'].astype(str)
+        self.assertIn('Club', classify_columns(df).subjects)
+
+        # Same header and dtypes, but this sheet's Club column holds words
+        other = synthetic_scores(20, subjects=3, seed=5)
+        other['Club'] = 'Chess'
+        self.assertNotIn('Club', classify_columns(other).subjects)
+
+    def test_classifications_are_shared_across_cache_instances(self):
+        from unittest import mock
+        from django.core.cache.backends.locmem import LocMemCache
+
+        # Process memory is gone with the forked child that wrote it
+        self.assertNotIsInstance(caches['columns'], LocMemCache)
+        # A fresh cache connection stands in for another process (a forked analysis child's
+        # entries must outlive it and be seen by the web workers)
+        first = classify_columns(synthetic_scores(20, subjects=4))
+        other_process = caches.create_connection('columns')
+        self.assertIsNot(other_process, caches['columns'])
+        with mock.patch('analytics.columns.caches', {'columns': other_process}), \
+                mock.patch('analytics.columns._classify') as classify:
+            again = classify_columns(synthetic_scores(30, subjects=4, seed=3))
+        classify.assert_not_called()
+        self.assertEqual(again, first)
 
-# Create your tests here.
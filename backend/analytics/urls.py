@@ -1,16 +1,21 @@
 #backend/analytics/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ExamUploadViewSet, RegisterView
+from .views import ExamUploadViewSet, MetricsView, exam_progress_stream, RegisterView, StudentViewSet, SubjectViewSet
 
 # we wi;ll then create a router and register our viewset with it
 router = DefaultRouter()
 router.register(r'exam-uploads', ExamUploadViewSet, basename='exam-upload')
+router.register(r'students', StudentViewSet, basename='student')
+router.register(r'subjects', SubjectViewSet, basename='subject')
 
 # the API URLS are now determined automacally by the router
 urlpatterns = [
+    # Async SSE progress stream (needs the ASGI server, see core/asgi.py)
+    path('exam-uploads/<uuid:id>/events/', exam_progress_stream, name='exam-upload-events'),
     path('', include(router.urls)),
     # Add any additional endpoints here
     path('register/', RegisterView.as_view(), name='auth_register'), # <--- New Endpoint
+    path('metrics/', MetricsView.as_view(), name='metrics'),  # Prometheus scrape target
 
 ]
\ No newline at end of file
@@ -1,204 +1,266 @@
 #backend/analytics/utils.py
 
-import io
+import os
 import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from tempfile import SpooledTemporaryFile
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
+
+from .columns import classify_columns
+from .grading import compile_grading_scheme
+from .report_template import report_template
+
+# ZIP entry of the combined class PDF (REPORT_CLASS_PDF)
+CLASS_PDF_NAME = 'All Report Cards.pdf'
+
 
 # 1. DYNAMIC GRADING FUNCTION
 def get_grade_details(score, scheme):
     """
-    Loops through the user-defined scheme to find the grade.
+    Grades a single score against the user-defined scheme.
     scheme = [{"min": 80, "max": 100, "grade": "EE", "remark": "...", "points": 4}, ...]
     Returns: (Grade, Remark, Points)
+
+    Bulk callers should use grading.compile_grading_scheme(scheme).grade_exam(...)
+    instead of calling this once per cell.
     """
+    return compile_grading_scheme(scheme).grade_one(score)
+
+def get_school_name(exam_instance):
+    """School name printed on the report cards (upper-cased), with a safe fallback."""
     try:
-        s = round(float(score))
-
-    except (ValueError, TypeError):
-        return "-", "", 0
-
-    # Ensure scheme is a list
-    if not isinstance(scheme, list):
-        return "-", "Invalid Scheme", 0
-
-    for rule in scheme:
-        # Check if score falls in range
-        try:
-            if rule['min'] <= s <= rule['max']:
-                return rule['grade'], rule['remark'], rule['points']
-        except KeyError:
-            continue
-    
-    return "-", "Not Graded", 0
+        return exam_instance.uploaded_by.profile.school_name.upper()
+    except:
+        return "KENYA SCHOOL ANALYTICS"
+
+def safe_filename(name):
+    """Letters, digits, spaces, dashes and underscores only (ZIP entry and folder names)."""
+    return "".join(c for c in str(name) if c.isalnum() or c in ' -_').strip()
 
-def generate_student_reports(df, exam_instance):
+def generate_student_reports(df, exam_instance, grading=None, workers=None):
     """
     Generates professional PDF report cards using dynamic settings.
+    Returns the ZIP as a spooled temp file (rewound): small archives stay in
+    memory, big ones spill to disk after REPORT_SPOOL_MAX_MEMORY bytes.
+    Close it when done.
     """
-    zip_buffer = io.BytesIO()
-       # 1. Get School Name
+    from django.conf import settings
+
+    zip_file = SpooledTemporaryFile(max_size=getattr(settings, 'REPORT_SPOOL_MAX_MEMORY', 8 * 1024 * 1024), suffix='.zip')
     try:
-        school_name = exam_instance.uploaded_by.profile.school_name.upper()
-    except:
-        school_name = "KENYA SCHOOL ANALYTICS"
+        write_reports_zip(iter_student_reports(df, exam_instance, grading=grading, workers=workers), zip_file)
+    except BaseException:
+        zip_file.close()
+        raise
+    zip_file.seek(0)
+    return zip_file
+
+
+def write_reports_zip(reports, target):
+    """
+    Streams (filename, pdf_bytes) pairs into a ZIP written to `target` (any
+    seekable file). Only the current PDF and the ZIP index are held in memory.
+    """
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf_bytes in reports:
+            archive.writestr(filename, pdf_bytes)
+    return target
+
+
+def iter_student_reports(df, exam_instance, grading=None, workers=None):
+    """
+    Yields (filename, pdf_bytes) for every student, in class order, then the
+    combined class PDF when REPORT_CLASS_PDF is on.
+    `grading` is the compiled scheme from process_exam_file (compiled here if omitted).
+    `workers` overrides the REPORT_WORKERS setting for the rendering pool.
+    """
+    from django.conf import settings
+
+    header, _, student_payloads = report_card_inputs(df, exam_instance, grading=grading)
+
+    # Render (in parallel for big classes), in class order
+    reports = render_report_cards(header, student_payloads(), len(df), workers=workers)
+    if 'Stream Rank' not in df.columns:
+        yield from reports
+    else:
+        # Batch uploads: one folder per stream, so each class teacher gets their own set
+        folders = [safe_filename(s) or 'Stream' for s in df['Stream']]
+        for folder, (filename, pdf_bytes) in zip(folders, reports):
+            yield f"{folder}/{filename}", pdf_bytes
+
+    # Optionally every card again as one printable PDF (pages share the template's static layer)
+    if getattr(settings, 'REPORT_CLASS_PDF', False):
+        yield CLASS_PDF_NAME, report_template(header).render_class(student_payloads())
+
+
+def student_report_card(df, exam_instance, adm, grading=None):
+    """
+    One student's report card, looked up by admission number (case and a
+    trailing '.0' ignored). Returns (filename, pdf_bytes), or None when no
+    student matches.
+    """
+    header, adm_col_name, student_payloads = report_card_inputs(df, exam_instance, grading=grading)
+    if not adm_col_name:
+        return None
+    wanted = normalize_adm(adm)
+    matches = [pos for pos, value in enumerate(df[adm_col_name]) if normalize_adm(value) == wanted]
+    if not matches:
+        return None
+    return _render_report_card(header, next(student_payloads(matches[:1])))
+
+
+def find_adm_column(df):
+    """The admission number column (strong clues first, then weak ones), or None."""
+    # Strong clues (adm, reg, upi) catch "admision", "Adm No", "Reg"; weak ones (index, id) only if none
+    return classify_columns(df).adm
+
+
+def normalize_adm(value):
+    """Admission numbers as printed on the report card: 4344.0 -> '4344' (upper-cased for lookups)."""
+    return str(value).split('.')[0].strip().upper()
+
+
+class ReportCardRecords(NamedTuple):
+    """Per-student report card fields as parallel lists of plain Python values, in frame order."""
+    names: list
+    adms: list
+    ranks: list
+    totals: list
+    averages: list
+    overall_grades: list
+
+
+def _numbers(df, column):
+    """A numeric column as floats (missing or unreadable -> 0.0); zeros if the column is absent."""
+    if column not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[column], errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+
+def report_card_records(df, adm_col_name=None):
+    """
+    The student fields of a graded frame, cleaned column by column: upper-cased
+    names ('Student <n>' without a name column), admission numbers without
+    decimals (4344.0 -> '4344', 'N/A' without a column), integer ranks,
+    totals/averages as floats (unreadable -> 0.0) and the overall grade ('-').
+    """
+    name_col = 'Name' if 'Name' in df.columns else 'name' if 'name' in df.columns else None
+    if name_col is not None:
+        names = df[name_col].astype(str).str.upper()
+    else:
+        names = pd.Series([f'Student {index + 1}' for index in df.index], dtype=object).str.upper()
+
+    if adm_col_name:
+        adms = df[adm_col_name].astype(str).str.split('.', n=1).str[0].tolist()
+    else:
+        adms = ['N/A'] * len(df)
+
+    overall = df['Overall Grade'].tolist() if 'Overall Grade' in df.columns else ['-'] * len(df)
+    return ReportCardRecords(
+        names=names.tolist(),
+        adms=adms,
+        ranks=_numbers(df, 'Rank').astype(int).tolist(),
+        totals=_numbers(df, 'Total').tolist(),
+        averages=_numbers(df, 'Average').tolist(),
+        overall_grades=overall,
+    )
+
+
+def report_card_inputs(df, exam_instance, grading=None):
+    """
+    Everything the report card renderer needs from a graded frame:
+    (header, admission column or None, student_payloads), where
+    student_payloads(positions=None) yields the picklable per-student payloads
+    for those row positions (default: every row, in class order).
+    """
+       # 1. Get School Name
+    school_name = get_school_name(exam_instance)
     
    # 2. Get Grading Scheme
-    scheme = exam_instance.grading_scheme
+    if grading is None:
+        grading = compile_grading_scheme(exam_instance.grading_scheme)
     
-    # Base exclusion list
-     # 3. Detect Subjects (The Gatekeeper Logic - Keeps bad columns out)
-    exclude_keywords = [
-        'id', 'adm', 'admission', 'index', 'no.', 'number', 
-        'name', 'student', 'phone', 'stream', 'gender', 'sex',
-        'total', 'sum', 'average', 'avg', 'mean', 
-        'rank', 'position', 'pos', 'grade', 'points', 'comment', 'remark',
-        'overall grade', 'points'
-    ]
-
-    # Add User's Custom Ignore Columns
-    if exam_instance.custom_ignore_columns:
-        extras = [x.strip().lower() for x in exam_instance.custom_ignore_columns.split(',')]
-        exclude_keywords.extend(extras)
-
-    # Detect subjects for the PDF table
-    
-    subject_cols = []
-    for col in df.columns:
-        c_clean = col.lower().strip()
-        if not any(k == c_clean or k in c_clean for k in exclude_keywords):
-            # Double check if it looks numeric
-            if pd.to_numeric(df[col], errors='coerce').notnull().sum() > 0:
-                subject_cols.append(col)
-
- # 4. Detect Admission Column (The Detective Logic - Finds the Right ID)
-    # We do this ONCE before the loop to save processing time
-    adm_col_name = None
-    
-    # Priority 1: Strong clues (adm, reg, upi) - Catches "admision", "Adm No", "Reg"
-    for col in df.columns:
-        if any(x in col.lower() for x in ['adm', 'reg', 'upi']):
-            adm_col_name = col
-            break
-            
-    # Priority 2: Weak clues (index, id) - Only if Priority 1 failed
-    if not adm_col_name:
-        for col in df.columns:
-            if any(x in col.lower() for x in ['index', 'student id', 'unique']):
-                adm_col_name = col
-                break
-
-
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        
-        for index, row in df.iterrows():
-            pdf_buffer = io.BytesIO()
-            p = canvas.Canvas(pdf_buffer, pagesize=A4)
-            width, height = A4
-            
-            # --- HEADER ---
-            p.setFont("Helvetica-Bold", 18)
-            p.drawCentredString(width / 2, height - 50, school_name) 
-            
-            p.setFont("Helvetica-Bold", 12)
-            p.drawCentredString(width / 2, height - 75, "COMPETENCY BASED ASSESSMENT")
-            p.drawCentredString(width / 2, height - 95, exam_instance.title)
-            
-            p.setLineWidth(2)
-            p.line(30, height - 105, width - 30, height - 105)
-
-            # --- STUDENT DETAILS ---
-            student_name = str(row.get('Name', row.get('name', f'Student {index+1}'))).upper()
-            rank = int(row.get('Rank', 0))
-            
-            # Safely get totals/averages
-            try: total_score = float(row.get('Total', 0))
-            except: total_score = 0.0
-            
-            try: avg_score = float(row.get('Average', 0))
-            except: avg_score = 0.0
-                
-            overall_grade = row.get('Overall Grade', '-')
-
-            # # Find Admission Number safely
-            # adm = "N/A"
-            # for k in ['Adm', 'adm', 'Admission', 'admission', 'Index']:
-            #     if k in df.columns:
-            #         adm = row[k]
-            #         break
-             # --- USE DETECTED ADMISSION COLUMN ---
-            if adm_col_name:
-                raw_adm = row.get(adm_col_name, "N/A")
-                # Remove decimals (e.g., 4344.0 -> 4344)
-                adm = str(raw_adm).split('.')[0]
-            else:
-                adm = "N/A"
-
-            p.setFont("Helvetica-Bold", 11)
-            p.drawString(50, height - 140, f"NAME: {student_name}")
-            p.drawString(50, height - 160, f"ADM NO: {adm}")
-            
-            p.drawString(350, height - 140, f"POSITION: {rank} / {len(df)}")
-            p.drawString(350, height - 160, f"PERFORMANCE: {overall_grade}")
-
-            # --- RESULTS TABLE ---
-            y = height - 200
-            
-            # Table Headers
-            p.setFillColor(colors.lightgrey)
-            p.rect(50, y-5, 500, 20, fill=True, stroke=False)
-            p.setFillColor(colors.black)
-            p.setFont("Helvetica-Bold", 10)
-            p.drawString(60, y, "SUBJECT")
-            p.drawString(250, y, "SCORE")
-            p.drawString(330, y, "LEVEL")
-            p.drawString(400, y, "REMARK")
-            
-            y -= 25
-            p.setFont("Helvetica", 10)
-
-            for subject in subject_cols:
-                raw_score = row.get(subject, 0)
-                try:
-                    score = float(raw_score)
-                except (ValueError, TypeError):
-                    score = 0.0
-
-                # USE DYNAMIC GRADING
-                grade, remark, points = get_grade_details(score, scheme)
-                
-                p.drawString(60, y, str(subject).title())
-                p.drawString(250, y, f"{score:.0f}") 
-                p.drawString(330, y, grade)
-                p.drawString(400, y, remark)
-                
-                p.setLineWidth(0.5)
-                p.setStrokeColor(colors.lightgrey)
-                p.line(50, y-5, 550, y-5)
-                y -= 20
-
-            # --- FOOTER SUMMARY ---
-            y -= 30
-            p.setStrokeColor(colors.black)
-            p.setLineWidth(1)
-            p.rect(50, y-40, 500, 40)
-            p.setFont("Helvetica-Bold", 12)
-            
-            p.drawString(60, y-25, f"TOTAL: {total_score:.0f}")
-            p.drawString(200, y-25, f"AVERAGE: {avg_score:.2f}")
-            p.drawString(400, y-25, f"LEVEL: {overall_grade}")
-
-            p.setFont("Helvetica-Oblique", 8)
-            p.drawCentredString(width/2, 30, "Generated by School Analytics System")
-            
-            p.showPage()
-            p.save()
-
-            pdf_buffer.seek(0)
-            clean_name = "".join([c for c in student_name if c.isalnum() or c==' ']).strip()
-            zip_file.writestr(f"{rank}_{clean_name}.pdf", pdf_buffer.read())
-
-    zip_buffer.seek(0)
-    return zip_buffer
\ No newline at end of file
+    # 3. Detect Subjects and the Admission Column (one cached pass, see columns.py)
+    roles = classify_columns(df, exam_instance.custom_ignore_columns)
+    subject_cols, adm_col_name = roles.subjects, roles.adm
+
+    # 5. Grade every subject score up front (one vectorized pass, not one call per cell)
+    # Unreadable scores count as 0, exactly like the old float() fallback.
+    scores = df[subject_cols].apply(pd.to_numeric, errors='coerce').fillna(0.0)
+    score_matrix = scores.to_numpy(dtype=float)
+    subject_grades, subject_remarks, _ = grading.grade(score_matrix)
+
+    # 6. Materialize every per-student field as a plain column (vectorized cleaning, no row objects)
+    records = report_card_records(df, adm_col_name)
+    scores_rows, grade_rows, remark_rows = score_matrix.tolist(), subject_grades.tolist(), subject_remarks.tolist()
+
+    # 7. One compact, picklable payload per student (no DataFrame rows cross processes).
+    # A generator, so payloads are produced only as fast as they are rendered.
+    def student_payloads(positions=None):
+        if positions is None:
+            positions = range(len(df))
+        for pos in positions:
+            yield (
+                records.names[pos], records.adms[pos], records.ranks[pos], records.totals[pos],
+                records.averages[pos], records.overall_grades[pos],
+                tuple(scores_rows[pos]), tuple(grade_rows[pos]), tuple(remark_rows[pos]),
+            )
+
+    header = (school_name, exam_instance.title, tuple(str(s) for s in subject_cols), len(df))
+    return header, adm_col_name, student_payloads
+
+
+def report_workers():
+    """Renderer processes per job: REPORT_WORKERS, where 0 means one per CPU core."""
+    from django.conf import settings
+
+    workers = getattr(settings, 'REPORT_WORKERS', 0) or os.cpu_count() or 1
+    return max(1, workers)
+
+
+def render_report_cards(header, students, count, workers=None, chunk_size=None):
+    """
+    Renders report cards, yielding (filename, pdf_bytes) in the same order as
+    the `students` iterable (`count` items).
+
+    Serially, one PDF exists at a time. With more than one worker, chunks of
+    students are rendered in a process pool; at most two chunks per worker are
+    in flight and results are consumed in submission order, so the ZIP layout
+    is deterministic and memory stays bounded however big the class is.
+    """
+    if workers is None:
+        workers = report_workers()
+    if chunk_size is None:
+        # Enough chunks to keep every worker busy, but not so small that pickling dominates
+        chunk_size = max(25, min(250, -(-count // (workers * 4))))
+
+    n_chunks = -(-count // chunk_size)
+    if workers <= 1 or n_chunks <= 1:
+        for student in students:
+            yield _render_report_card(header, student)
+        return
+
+    students = iter(students)
+    with ProcessPoolExecutor(max_workers=min(workers, n_chunks)) as pool:
+        in_flight = deque()
+        while chunk := list(islice(students, chunk_size)):
+            in_flight.append(pool.submit(_render_chunk, header, chunk))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def _render_chunk(header, students):
+    """Pool task: renders a list of student payloads. Must stay module-level (picklable)."""
+    return [_render_report_card(header, student) for student in students]
+
+
+def _render_report_card(header, student):
+    """Draws one student's report card on the exam's template. Returns (filename, pdf_bytes)."""
+    return report_template(header).render(student)
@@ -1,17 +1,51 @@
 # backend/analytics/views.py
-import threading
-from rest_framework import viewsets, permissions, status, parsers, generics
+import hashlib
+import logging
+import os
+import uuid
+
+from asgiref.sync import sync_to_async
+
+from rest_framework import viewsets, permissions, status, parsers, generics, exceptions
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
+from rest_framework.throttling import UserRateThrottle
+from rest_framework.pagination import CursorPagination
+from rest_framework.views import APIView
+from django.conf import settings
+from django.db.models import Count, FloatField, IntegerField, Max
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import content_disposition_header, http_date, quote_etag
 from django.contrib.auth.models import User
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.core.signing import BadSignature, TimestampSigner
 
 
 
-from .models import ExamUpload
-from .serializers import ExamUploadSerializer, RegisterSerializer
-# Import the analysis engine
-from .analysis import process_exam_file 
+from .models import ExamUpload, Student, Subject
+from .serializers import (
+    ExamUploadListSerializer, ExamUploadSerializer, RegisterSerializer, StudentSerializer,
+    SubjectSerializer,
+)
+# Import the analysis engine, job queue and result cache
+from .cache import artifact_filename, cache_stats, restore_cached_result
+from .jobs import enqueue_analysis, queue_metrics, requeue_analysis
+from .artifacts import FIELD_ARTIFACTS, ArtifactPending, ArtifactUnavailable, ensure_artifact, graded_snapshot, student_report
+from .instrumentation import progress_snapshot, prometheus_metrics
+from .events import progress_events
+from .exports import iter_csv, parquet_bytes
+from .identity import TYPEAHEAD_MAX, search_students
+from .ingest import HAS_PYARROW
+from .media import serve_file
+from .scores import exam_series_trends, student_history, subject_trend
+
+logger = logging.getLogger(__name__)
 
 
 class RegisterView(generics.CreateAPIView):
@@ -21,28 +55,127 @@ class RegisterView(generics.CreateAPIView):
     
 
 
+class ProgressRateThrottle(UserRateThrottle):
+    """Progress polls are cheap, so they get their own, higher budget."""
+    scope = 'progress'
+
+
+class TypeaheadRateThrottle(UserRateThrottle):
+    """Student search fires on every keystroke."""
+    scope = 'typeahead'
+
+
+class ExamUploadCursorPagination(CursorPagination):
+    """Newest first; stable under concurrent uploads, and no COUNT(*) over the table."""
+    ordering = ('-uploaded_at', '-id')
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+# Columns the history list reads; the summary numbers are pulled out of the JSON in SQL
+LIST_ONLY = ('id', 'title', 'slug', 'status', 'message', 'uploaded_at', 'updated_at', 'uploaded_by__username')
+LIST_SUMMARY = {
+    'summary_student_count': Cast(KT('analysis_summary__student_count'), IntegerField()),
+    'summary_class_mean': Cast(KT('analysis_summary__class_mean'), FloatField()),
+    'summary_pass_rate': Cast(KT('analysis_summary__pass_rate'), FloatField()),
+    'summary_top_student': KT('analysis_summary__top_student'),
+}
+
+
+def _timestamp(value):
+    return int(value.timestamp()) if value else None
+
+
+def _list_etag(request, stamp):
+    """Who is asking, which page/filters, and how many rows matched with what latest change."""
+    latest = stamp['latest'].isoformat() if stamp['latest'] else ''
+    key = f"{request.user.pk}|{request.GET.urlencode()}|{stamp['count']}|{latest}"
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
 class ExamUploadViewSet(viewsets.ModelViewSet):
     serializer_class = ExamUploadSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [parsers.MultiPartParser, parsers.FormParser]
+    pagination_class = ExamUploadCursorPagination
     lookup_field = 'id'
 
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return ExamUpload.objects.all()
-        return ExamUpload.objects.filter(uploaded_by=user)
+        queryset = ExamUpload.objects.all() if user.is_staff else ExamUpload.objects.filter(uploaded_by=user)
+        if self.action == 'list':
+            return queryset.select_related('uploaded_by').only(*LIST_ONLY).annotate(**LIST_SUMMARY)
+        if self.action == 'retrieve':
+            return queryset.select_related('uploaded_by')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ExamUploadListSerializer
+        return super().get_serializer_class()
+
+    def filter_queryset(self, queryset):
+        """
+        List filters: ?status=COMPLETED,FAILED and ?from=YYYY-MM-DD&to=YYYY-MM-DD (upload date).
+        """
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        statuses = [x.strip().upper() for x in params.get('status', '').split(',') if x.strip()]
+        if any(x not in ExamUpload.Status.values for x in statuses):
+            raise exceptions.ValidationError({"status": f"Choose from {', '.join(ExamUpload.Status.values)}."})
+        if statuses:
+            queryset = queryset.filter(status__in=statuses)
+        for param, lookup in (('from', 'uploaded_at__date__gte'), ('to', 'uploaded_at__date__lte')):
+            if params.get(param):
+                day = parse_date(params[param])
+                if day is None:
+                    raise exceptions.ValidationError({param: "Dates must be YYYY-MM-DD."})
+                queryset = queryset.filter(**{lookup: day})
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        Lean, cursor-paginated history (?page_size= up to 100). The ETag covers every
+        upload matching the filters, so an unchanged list answers 304 without serializing.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        stamp = queryset.order_by().aggregate(latest=Max('updated_at'), count=Count('id'))
+        etag = _list_etag(request, stamp)
+        # Last-Modified is informational only: a deletion doesn't move it, the count in the ETag does
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response['ETag'] = etag
+        if stamp['latest']:
+            response['Last-Modified'] = http_date(_timestamp(stamp['latest']))
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """Full detail, with ETag/Last-Modified from updated_at (304 when unchanged)."""
+        exam = self.get_object()
+        etag = quote_etag(f"{exam.pk}-{exam.updated_at.isoformat()}")
+        not_modified = get_conditional_response(request, etag=etag, last_modified=_timestamp(exam.updated_at))
+        if not_modified is not None:
+            return not_modified
+        response = Response(self.get_serializer(exam).data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(_timestamp(exam.updated_at))
+        return response
 
     def perform_create(self, serializer):
         """
-        Save the file, then immediately trigger analysis in a background thread.
+        Save the file, then put it on the analysis queue.
         """
         # 1. Save to DB
         instance = serializer.save(uploaded_by=self.request.user)
         
-        # 2. Trigger Analysis (Background Thread)
-        # In a massive scale app (1000s of uploads/min), use Celery.
-        # For a startup/SaaS, Threading is perfect and free.
+        # 2. Queue Analysis (picked up by `manage.py run_analysis_workers`)
         self._trigger_analysis(instance)
 
     @action(detail=True, methods=['post'])
@@ -51,30 +184,336 @@ class ExamUploadViewSet(viewsets.ModelViewSet):
         Manually retry analysis if it failed.
         """
         exam = self.get_object()
-        
-        if exam.status == ExamUpload.Status.PROCESSING:
-             return Response(
-                {"detail": "File is already being processed."}, 
+
+        # Reset and requeue, unless a worker holds it right now
+        statuses = (ExamUpload.Status.COMPLETED, ExamUpload.Status.FAILED, ExamUpload.Status.PENDING)
+        if not requeue_analysis(exam, "Retry queued...", statuses=statuses):
+            return Response(
+                {"detail": "File is already being processed."},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Reset and run
-        exam.status = ExamUpload.Status.PENDING
-        exam.message = "Retry started..."
-        exam.save()
-        
-        self._trigger_analysis(exam)
-        
         serializer = self.get_serializer(exam)
         return Response(serializer.data)
 
-    def _trigger_analysis(self, instance):
+    @action(detail=True, methods=['post'], parser_classes=[parsers.JSONParser, parsers.MultiPartParser, parsers.FormParser])
+    def regrade(self, request, id=None):
+        """
+        Re-run the analysis with a new grading_scheme and/or custom_ignore_columns.
+        Queued like any analysis (202): the worker reuses the parsed sheet and only
+        recomputes the stages whose inputs changed. Which stages ran and which
+        were skipped is reported in progress['stages'] once it completes.
+        """
+        exam = self.get_object()
+
+        changes = {k: request.data[k] for k in ('grading_scheme', 'custom_ignore_columns') if k in request.data}
+        serializer = self.get_serializer(exam, data=changes, partial=True)
+        serializer.is_valid(raise_exception=True)
+
+        # The new settings are saved in the same conditional UPDATE that queues the job
+        if not requeue_analysis(exam, "Regrade queued.", incremental=True, **serializer.validated_data):
+            return Response(
+                {"detail": "File is still being processed."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({"exam": self.get_serializer(exam).data}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], throttle_classes=[ProgressRateThrottle])
+    def progress(self, request, id=None):
+        """
+        Lightweight polling target: status, stage progress and (as soon as the
+        calculations are done) the dashboard summary, without the full payload.
+        """
+        exam = get_object_or_404(
+            self.get_queryset().only('id', 'status', 'message', 'progress', 'analysis_summary'), id=id
+        )
+        self.check_object_permissions(request, exam)
+        return Response(progress_snapshot(exam))
+
+    @action(detail=True, methods=['post'], url_path='stream-token')
+    def stream_token(self, request, id=None):
+        """
+        Short-lived token for this upload's progress stream. EventSource cannot
+        send the Authorization header, and the JWT must not end up in a URL.
+        """
+        exam = get_object_or_404(self.get_queryset().only('id'), id=id)
+        self.check_object_permissions(request, exam)
+        token = _stream_signer().sign_object({'exam': str(exam.id), 'user': request.user.pk})
+        return Response({"token": token, "expires_in": settings.PROGRESS_STREAM_TOKEN_MAX_AGE})
+
+    @action(detail=True, methods=['get'], url_path=r'download/(?P<field>[a-z_]+)')
+    def download(self, request, id=None, field=None):
+        """
+        Downloads one artifact (processed_file, subject_chart, passrate_chart,
+        reports_zip, stream_artifacts). An artifact the pipeline deferred is
+        queued for the workers on first request (202 with Retry-After: poll
+        until 200), then served from storage.
+        """
+        if field not in FIELD_ARTIFACTS:
+            raise Http404("Unknown artifact.")
+        exam = self.get_object()
+        try:
+            exam = ensure_artifact(exam, FIELD_ARTIFACTS[field])
+        except ArtifactPending as e:
+            return Response({"detail": str(e)}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+        except ArtifactUnavailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        stored = getattr(exam, field)
+        if not stored:
+            raise Http404("This exam has no such artifact.")
+        return serve_file(
+            request, stored.path,
+            filename=artifact_filename(exam, field),
+            as_attachment=not stored.name.endswith('.png'),
+        )
+
+    @action(detail=True, methods=['get'], url_path=r'export/(?P<kind>csv|parquet)')
+    def export(self, request, id=None, kind=None):
+        """
+        The graded broadsheet as CSV (streamed) or Parquet, for bulk consumers.
+        Built from the stored snapshot on each request; nothing is kept.
+        """
+        exam = self.get_object()
+        try:
+            df = graded_snapshot(exam)
+        except ArtifactUnavailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+
+        stem = os.path.splitext(artifact_filename(exam, 'processed_file'))[0]
+        if kind == 'csv':
+            response = StreamingHttpResponse(iter_csv(df), content_type='text/csv; charset=utf-8')
+        elif HAS_PYARROW:
+            response = HttpResponse(parquet_bytes(df), content_type='application/vnd.apache.parquet')
+        else:
+            raise Http404("Parquet export is not available on this server.")
+        response['Content-Disposition'] = content_disposition_header(True, f"{stem}.{kind}")
+        return response
+
+    @action(detail=True, methods=['get'], url_path=r'report-card/(?P<adm>[^/]+)')
+    def report_card(self, request, id=None, adm=None):
+        """
+        One student's PDF report card, rendered on demand by admission number
+        (no need to build or download the whole class ZIP).
+        """
+        exam = self.get_object()
+        try:
+            report = student_report(exam, adm)
+        except ArtifactUnavailable as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        if report is None:
+            raise Http404("No student with that admission number.")
+        filename, pdf_bytes = report
+        response = HttpResponse(pdf_bytes, content_type='application/pdf')
+        response['Content-Disposition'] = f'inline; filename="{filename}"'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def profile(self, request, id=None):
+        """
+        Staff only: download the cProfile stats of the last profiled run.
+        Enable profiling for an exam in the admin (or ANALYSIS_PROFILE_ALL), then retry it.
+        """
+        exam = self.get_object()
+        if not exam.profile_file:
+            raise Http404("No profile captured for this exam.")
+        return serve_file(request, exam.profile_file.path, filename=f"{exam.slug}.prof", as_attachment=True)
+
+    @action(detail=False, methods=['get'])
+    def trends(self, request):
+        """
+        Cross-exam trends for ?exams=<id>,<id>,... (2 to 20 of your completed exams, in
+        the order to compare): subject mean deltas, rank movement and value added per student.
+        """
+        ids = [x.strip() for x in request.query_params.get('exams', '').split(',') if x.strip()]
+        if not 2 <= len(ids) <= 20:
+            return Response({"detail": "Pass 2 to 20 exam ids in ?exams=."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            ids = [uuid.UUID(x) for x in ids]
+        except ValueError:
+            return Response({"detail": "Exam ids must be UUIDs."}, status=status.HTTP_400_BAD_REQUEST)
+
+        found = {
+            exam.pk: exam
+            for exam in self.get_queryset().filter(id__in=ids, status=ExamUpload.Status.COMPLETED)
+            .only('id', 'title', 'uploaded_at', 'analysis_summary')
+        }
+        missing = [str(x) for x in ids if x not in found]
+        if missing:
+            return Response({"detail": "Unknown or unfinished exams.", "exams": missing}, status=status.HTTP_404_NOT_FOUND)
+        return Response(exam_series_trends([found[x] for x in dict.fromkeys(ids)]))
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def queue_stats(self, request):
+        """
+        Staff only: queue depth, in-flight jobs and wait/run latency.
+        """
+        return Response(queue_metrics())
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def result_cache_stats(self, request):
         """
-        Helper to run the heavy analysis in a separate thread
+        Staff only: result cache hits, misses, evictions and disk usage.
+        """
+        return Response(cache_stats())
+
+    def _trigger_analysis(self, instance, message="Queued for analysis."):
+        """
+        Helper to queue the heavy analysis for the worker pool
         so the user gets a generic '201 Created' response instantly.
+        Identical uploads that were analyzed before complete right here from the
+        cache (a worker fills their score tables).
         """
-        instance.status = ExamUpload.Status.PROCESSING
-        instance.save()
-        
-        task = threading.Thread(target=process_exam_file, args=(instance,))
-        task.start()
\ No newline at end of file
+        try:
+            if restore_cached_result(instance, defer_scores=True):
+                return
+        except Exception:
+            logger.exception("Result cache error for exam %s", instance.pk)
+        enqueue_analysis(instance, message=message)
+
+class StudentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Students of the signed-in school, from the score tables.
+    ?search= matches the start of an admission number, UPI or any word of a name (50 results).
+    """
+    serializer_class = StudentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Student.objects.all() if self.request.user.is_staff else Student.objects.filter(owner=self.request.user)
+        search = self.request.query_params.get('search', '').strip()
+        if search and self.action == 'list':
+            return search_students(queryset, search, limit=TYPEAHEAD_MAX, owner_id=self._school_id())
+        if self.action == 'list':
+            queryset = queryset[:50]
+        return queryset
+
+    def _school_id(self):
+        """The owner the students are scoped to (None for staff, who see every school)."""
+        return None if self.request.user.is_staff else self.request.user.pk
+
+    @action(detail=False, methods=['get'], throttle_classes=[TypeaheadRateThrottle])
+    def search(self, request):
+        """
+        Typeahead: ?q= (admission number, UPI or name words in any order), ?limit= (10, max 50).
+        Exact admission numbers come first, then prefixes, then names alphabetically.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), TYPEAHEAD_MAX)
+        except ValueError:
+            limit = 10
+        queryset = Student.objects.all() if request.user.is_staff else Student.objects.filter(owner=request.user)
+        students = search_students(
+            queryset.only('id', 'adm_no', 'upi', 'name'), request.query_params.get('q', ''), limit, owner_id=self._school_id()
+        )
+        return Response(self.get_serializer(students, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """Every exam this student sat, oldest first: totals, rank, grade and subject scores."""
+        student = self.get_object()
+        return Response({"student": self.get_serializer(student).data, "exams": student_history(student)})
+
+
+class SubjectViewSet(viewsets.ReadOnlyModelViewSet):
+    """Subjects of the signed-in school, from the score tables."""
+    serializer_class = SubjectSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Subject.objects.all()
+        return Subject.objects.filter(owner=self.request.user)
+
+    @action(detail=True, methods=['get'])
+    def trend(self, request, pk=None):
+        """
+        Mean, highest, lowest and pass rate per exam, oldest first.
+        Optional ?from=YYYY-MM-DD&to=YYYY-MM-DD limits the exams by upload date.
+        """
+        subject = self.get_object()
+        start, end = (request.query_params.get(k) for k in ('from', 'to'))
+        if (start and not parse_date(start)) or (end and not parse_date(end)):
+            return Response({"detail": "Dates must be YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "subject": self.get_serializer(subject).data,
+            "exams": subject_trend(subject, start=start and parse_date(start), end=end and parse_date(end)),
+        })
+
+
+def _has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f"Bearer {token}")
+
+
+class IsStaffOrMetricsToken(permissions.BasePermission):
+    """Staff users, or a scraper presenting 'Authorization: Bearer <METRICS_TOKEN>'."""
+
+    def has_permission(self, request, view):
+        return _has_metrics_token(request) or bool(request.user and request.user.is_staff)
+
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape target: per-stage pipeline timings and queue gauges.
+    """
+    permission_classes = [IsStaffOrMetricsToken]
+    throttle_classes = []
+
+    def get_authenticators(self):
+        # The scrape token is not a JWT, so don't let JWTAuthentication reject it
+        if _has_metrics_token(self.request):
+            return []
+        return super().get_authenticators()
+
+    def get(self, request):
+        return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# --- LIVE PROGRESS STREAM (async, served through core.asgi) ---
+
+def _stream_signer():
+    return TimestampSigner(salt='analytics.progress-stream')
+
+
+def _stream_user(request, id):
+    """
+    The user a ?token= from the stream-token endpoint was issued to, if it is
+    unexpired and issued for this upload. Returns None otherwise.
+    """
+    try:
+        claims = _stream_signer().unsign_object(
+            request.GET.get('token', ''), max_age=settings.PROGRESS_STREAM_TOKEN_MAX_AGE
+        )
+    except BadSignature:  # SignatureExpired included
+        return None
+    if claims.get('exam') != str(id):
+        return None
+    return User.objects.filter(pk=claims.get('user'), is_active=True).first()
+
+
+def _stream_snapshot(request, id):
+    user = _stream_user(request, id)
+    if user is None:
+        return None, 401
+    exams = ExamUpload.objects.all() if user.is_staff else ExamUpload.objects.filter(uploaded_by=user)
+    exam = exams.only('id', 'status', 'message', 'progress', 'analysis_summary').filter(id=id).first()
+    if exam is None:
+        return None, 404
+    return progress_snapshot(exam), 200
+
+
+async def exam_progress_stream(request, id):
+    """
+    Server-sent events for one upload: status transitions and stage progress,
+    pushed as the worker reports them, until the analysis completes or fails.
+    """
+    snapshot, code = await sync_to_async(_stream_snapshot)(request, id)
+    if snapshot is None:
+        return JsonResponse({"detail": "Not found." if code == 404 else "Authentication required."}, status=code)
+
+    response = StreamingHttpResponse(progress_events(str(id), snapshot), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
@@ -1,96 +1,234 @@
 # backend/analytics/visualizer.py
-import matplotlib.pyplot as plt
-import seaborn as sns
+"""
+Dashboard charts, drawn with matplotlib's object-oriented API.
+
+No pyplot: every chart type has a pre-styled template Figure (one per thread,
+so an engine can be shared by several workers) and each render only swaps the
+plotted data. Finished PNGs are memoized by a hash of that data, so the same
+means/pass split never gets drawn twice.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
 from io import BytesIO
 
-# Non-GUI backend for server safety
-plt.switch_backend('Agg')
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.patches import Circle
+
 sns.set_theme(style="whitegrid") # Makes charts look modern
 
-def subject_performance_chart(subject_means_df):
+# 8-4-4 grade order for the distribution chart
+GRADE_ORDER = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'D-', 'E']
+
+
+class _Template:
+    """A styled Figure plus the data artists drawn on it last time."""
+
+    def __init__(self, figure, ax):
+        self.figure = figure
+        self.ax = ax
+        self.bars = []
+        self.labels = []
+        self.artists = []
+        self.layout_key = None
+        params = figure.subplotpars
+        self._margins = dict(left=params.left, right=params.right, bottom=params.bottom, top=params.top)
+
+    def png(self, layout_key=None):
+        # tight_layout costs a full draw: only redo it when the text around the axes changed.
+        # It starts from the template's original margins, so a reused figure lays out
+        # exactly like a fresh one.
+        if layout_key is None or layout_key != self.layout_key:
+            self.figure.subplots_adjust(**self._margins)
+            self.figure.tight_layout()
+            self.layout_key = layout_key
+        img_buffer = BytesIO()
+        self.figure.savefig(img_buffer, format='png', dpi=100)
+        return img_buffer.getvalue()
+
+
+class ChartEngine:
     """
-    Horizontal Bar Chart: Subject vs Mean Score
+    Renders the dashboard charts. Safe to share between threads: templates are
+    thread-local and the PNG cache is guarded by a lock.
+    cache_size is the number of PNGs kept (0 turns memoization off).
     """
-    data = subject_means_df.sort_values('Mean Score', ascending=True)
-    
-    plt.figure(figsize=(10, 6))
-    
-    # Modern color palette
-    colors = ['#e74c3c' if x < 50 else '#2ecc71' for x in data['Mean Score']]
-    
-    bars = plt.barh(data['Subject'], data['Mean Score'], color=colors, alpha=0.8)
-    
-    plt.title('Subject Performance Analysis', fontsize=14, pad=20)
-    plt.xlabel('Mean Score', fontsize=12)
-    plt.xlim(0, 100)
-    
-    # Add values to the end of bars
-    for bar in bars:
-        width = bar.get_width()
-        plt.text(width + 1, bar.get_y() + bar.get_height()/2, 
-                 f'{width:.1f}', va='center', fontsize=10)
-
-    plt.tight_layout()
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=100)
-    img_buffer.seek(0)
-    plt.close()
-    return img_buffer
+
+    def __init__(self, cache_size=256):
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    # --- PUBLIC CHARTS ---
+
+    def subject_performance_chart(self, subject_means_df):
+        """
+        Horizontal Bar Chart: Subject vs Mean Score
+        """
+        data = subject_means_df.sort_values('Mean Score', ascending=True)
+        subjects = [str(s) for s in data['Subject']]
+        means = [float(m) for m in data['Mean Score']]
+        return self._render('subjects', (subjects, means), self._draw_subjects)
+
+    def pass_rate_chart(self, df):
+        """
+        Donut Chart: Pass vs Fail
+        """
+        pass_count = int((df['Average'] >= 50).sum())
+        fail_count = int((df['Average'] < 50).sum())
+        return self._render('pass_rate', (pass_count, fail_count), self._draw_pass_rate)
+
+    def grade_distribution_chart(self, df):
+        """
+        Shows count of A, B, C, etc.
+        This is CRITICAL for Kenyan Exam Analysis.
+        """
+        grade_counts = df['Overall Grade'].value_counts().reindex(GRADE_ORDER, fill_value=0)
+        return self._render('grades', [int(c) for c in grade_counts.values], self._draw_grades)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # --- MEMOIZATION ---
+
+    def _render(self, kind, data, draw):
+        key = hashlib.sha256(json.dumps([kind, data]).encode()).hexdigest()
+        with self._lock:
+            png = self._cache.get(key)
+            if png is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return BytesIO(png)
+            self.misses += 1
+
+        png = draw(data)
+
+        if self.cache_size:
+            with self._lock:
+                self._cache[key] = png
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return BytesIO(png)
+
+    def _template(self, kind, build):
+        tpl = getattr(self._local, kind, None)
+        if tpl is None:
+            tpl = build()
+            setattr(self._local, kind, tpl)
+        return tpl
+
+    # --- DRAWING ---
+
+    def _draw_subjects(self, data):
+        subjects, means = data
+        tpl = self._template('subjects', _subjects_template)
+        ax = tpl.ax
+        # Modern color palette
+        colors = ['#e74c3c' if x < 50 else '#2ecc71' for x in means]
+
+        if len(tpl.bars) == len(means):
+            # Same number of subjects as last time: just move the bars and labels
+            for bar, label, width, color in zip(tpl.bars, tpl.labels, means, colors):
+                bar.set_width(width)
+                bar.set_facecolor(color)
+                label.set_x(width + 1)
+                label.set_text(f'{width:.1f}')
+        else:
+            # Different subject count: replace the bars (Container.remove also drops them from ax.containers)
+            for artist in tpl.artists + tpl.labels:
+                artist.remove()
+            container = ax.barh(range(len(means)), means, color=colors, alpha=0.8)
+            tpl.artists = [container]
+            tpl.bars = list(container)
+            # Add values to the end of bars
+            tpl.labels = [
+                ax.text(bar.get_width() + 1, bar.get_y() + bar.get_height() / 2,
+                        f'{bar.get_width():.1f}', va='center', fontsize=10)
+                for bar in tpl.bars
+            ]
+            ax.set_ylim(-0.6, len(means) - 0.4)
+        ax.set_yticks(range(len(subjects)), labels=subjects)
+        return tpl.png(layout_key=tuple(subjects))
+
+    def _draw_pass_rate(self, data):
+        tpl = self._template('pass_rate', _pass_rate_template)
+        for artist in tpl.artists:
+            artist.remove()
+        # Donut chart style (the centre circle is part of the template)
+        wedges, texts, autotexts = tpl.ax.pie(
+            list(data),
+            labels=['Pass (>=50)', 'Fail (<50)'],
+            autopct='%1.1f%%',
+            startangle=90,
+            colors=['#3498db', '#e67e22'],
+            pctdistance=0.85,
+            explode=(0.05, 0)
+        )
+        tpl.artists = [*wedges, *texts, *autotexts]
+        return tpl.png()
+
+    def _draw_grades(self, counts):
+        tpl = self._template('grades', _grades_template)
+        for bar, count in zip(tpl.bars, counts):
+            bar.set_height(count)
+        tpl.ax.set_ylim(0, max(max(counts), 1) * 1.05)
+        return tpl.png(layout_key='fixed')
+
+
+# --- TEMPLATES (styled once per thread) ---
+
+def _figure(figsize):
+    figure = Figure(figsize=figsize)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+
+def _subjects_template():
+    figure, ax = _figure((10, 6))
+    ax.set_title('Subject Performance Analysis', fontsize=14, pad=20)
+    ax.set_xlabel('Mean Score', fontsize=12)
+    ax.set_xlim(0, 100)
+    return _Template(figure, ax)
+
+
+def _pass_rate_template():
+    figure, ax = _figure((6, 6))
+    # Draw circle for donut effect, above the wedges
+    ax.add_artist(Circle((0, 0), 0.70, fc='white', zorder=3))
+    ax.set_title('Class Pass Rate', fontsize=14)
+    return _Template(figure, ax)
+
+
+def _grades_template():
+    figure, ax = _figure((10, 6))
+    palette = sns.color_palette("viridis", len(GRADE_ORDER))
+    tpl = _Template(figure, ax)
+    tpl.bars = list(ax.bar(GRADE_ORDER, [0] * len(GRADE_ORDER), color=palette))
+    ax.set_title('Grade Distribution', fontsize=14)
+    ax.set_ylabel('Number of Students')
+    ax.set_xlabel('Grade')
+    return tpl
+
+
+# Shared engine behind the module-level functions the pipeline calls
+default_engine = ChartEngine()
+
+
+def subject_performance_chart(subject_means_df):
+    return default_engine.subject_performance_chart(subject_means_df)
+
 
 def pass_rate_chart(df):
-    """
-    Donut Chart: Pass vs Fail
-    """
-    pass_count = len(df[df['Average'] >= 50])
-    fail_count = len(df[df['Average'] < 50])
-    
-    plt.figure(figsize=(6, 6))
-    
-    # Donut chart style
-    wedges, texts, autotexts = plt.pie(
-        [pass_count, fail_count],
-        labels=['Pass (>=50)', 'Fail (<50)'],
-        autopct='%1.1f%%',
-        startangle=90,
-        colors=['#3498db', '#e67e22'],
-        pctdistance=0.85,
-        explode=(0.05, 0)
-    )
-    
-    # Draw circle for donut effect
-    centre_circle = plt.Circle((0,0), 0.70, fc='white')
-    fig = plt.gcf()
-    fig.gca().add_artist(centre_circle)
-    
-    plt.title('Class Pass Rate', fontsize=14)
-    plt.tight_layout()
-    
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=100)
-    img_buffer.seek(0)
-    plt.close()
-    return img_buffer
+    return default_engine.pass_rate_chart(df)
+
 
 def grade_distribution_chart(df):
-    """
-    New Chart: Shows count of A, B, C, etc.
-    This is CRITICAL for Kenyan Exam Analysis.
-    """
-    # Order of grades
-    grade_order = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'D-', 'E']
-    
-    # Count grades
-    grade_counts = df['Overall Grade'].value_counts().reindex(grade_order, fill_value=0)
-    
-    plt.figure(figsize=(10, 6))
-    sns.barplot(x=grade_counts.index, y=grade_counts.values, palette="viridis")
-    
-    plt.title('Grade Distribution', fontsize=14)
-    plt.ylabel('Number of Students')
-    plt.xlabel('Grade')
-    
-    img_buffer = BytesIO()
-    plt.savefig(img_buffer, format='png', dpi=100)
-    img_buffer.seek(0)
-    plt.close()
-    return img_buffer
\ No newline at end of file
+    return default_engine.grade_distribution_chart(df)
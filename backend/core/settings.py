@@ -99,6 +99,9 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Analysis workers write from several processes: take the write lock up front
+            # in transactions and wait for it instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
         }
     }
 # --- END DATABASE CONFIGURATION ---
@@ -141,6 +144,13 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 os.makedirs(MEDIA_ROOT, exist_ok=True)
 
+# --- MEDIA DELIVERY (signed /media/ links, see analytics/media.py) ---
+MEDIA_URL_TTL = int(os.getenv('MEDIA_URL_TTL', str(7 * 24 * 3600)))       # Signed links stay valid this long (rounded up to the day)
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '')                             # '' = Django streams; 'nginx' = X-Accel-Redirect; 'sendfile' = X-Sendfile
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')  # nginx `internal` location aliased to MEDIA_ROOT
+MEDIA_GC_INTERVAL = int(os.getenv('MEDIA_GC_INTERVAL', str(6 * 3600)))    # Seconds between sweeps of unreferenced artifact blobs (run_analysis_workers; 0 = off)
+MEDIA_GC_GRACE = int(os.getenv('MEDIA_GC_GRACE', str(24 * 3600)))          # Never delete blobs younger than this (jobs still saving)
+
 # --- REST FRAMEWORK ---
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
@@ -158,9 +168,65 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',  # Guests can only try 5 times/min (Register/Login)
         'user': '10/minute', # Logged in users can make 10 requests/min
+        'progress': '120/minute', # Progress polling (one cheap request every 0.5s)
+        'typeahead': '240/minute', # Student search, one request per keystroke
     }
 }
 
+# --- ANALYSIS JOB QUEUE (python manage.py run_analysis_workers) ---
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '2'))                      # Size of the worker process pool
+ANALYSIS_PER_USER_LIMIT = int(os.getenv('ANALYSIS_PER_USER_LIMIT', '2'))        # Max jobs running at once per uploader
+ANALYSIS_HEARTBEAT_INTERVAL = int(os.getenv('ANALYSIS_HEARTBEAT_INTERVAL', '30'))
+ANALYSIS_VISIBILITY_TIMEOUT = int(os.getenv('ANALYSIS_VISIBILITY_TIMEOUT', '600'))  # No heartbeat for this long -> requeue
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', '3'))
+ANALYSIS_POLL_INTERVAL = float(os.getenv('ANALYSIS_POLL_INTERVAL', '2'))
+
+# --- ANALYSIS SANDBOX (every run in a child process, see analytics/sandbox.py) ---
+ANALYSIS_SANDBOX = os.getenv('ANALYSIS_SANDBOX', 'True').lower() in ('true', '1', 'yes')
+ANALYSIS_TIMEOUT = float(os.getenv('ANALYSIS_TIMEOUT', '900'))                  # Wall-clock seconds before the run is killed
+ANALYSIS_CPU_LIMIT = int(os.getenv('ANALYSIS_CPU_LIMIT', '600'))                 # CPU seconds (RLIMIT_CPU)
+ANALYSIS_MEMORY_LIMIT_MB = int(os.getenv('ANALYSIS_MEMORY_LIMIT_MB', '2048'))    # Resident memory of the run (renderer pool included)
+ANALYSIS_ADDRESS_SPACE_LIMIT_MB = int(os.getenv('ANALYSIS_ADDRESS_SPACE_LIMIT_MB', '0'))  # RLIMIT_AS per process (0 = off; BLAS reserves a lot of virtual memory)
+
+# --- LIVE PROGRESS (SSE at /api/analytics/exam-uploads/<id>/events/) ---
+PROGRESS_POLL_INTERVAL = float(os.getenv('PROGRESS_POLL_INTERVAL', '1'))       # SQLite: seconds between re-reads of watched uploads
+PROGRESS_RESYNC_INTERVAL = float(os.getenv('PROGRESS_RESYNC_INTERVAL', '30'))  # Postgres: safety re-read between NOTIFYs
+PROGRESS_KEEPALIVE = int(os.getenv('PROGRESS_KEEPALIVE', '15'))                # Comment line on idle streams (proxy timeouts)
+PROGRESS_STREAM_SECONDS = int(os.getenv('PROGRESS_STREAM_SECONDS', '600'))     # Close long streams; the browser reconnects
+PROGRESS_STREAM_TOKEN_MAX_AGE = int(os.getenv('PROGRESS_STREAM_TOKEN_MAX_AGE', '60'))  # Seconds a stream token can open (or reopen) a stream
+
+# --- REPORT CARDS ---
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', '0'))  # PDF renderer processes per job (0 = one per CPU core, 1 = no pool)
+REPORT_SPOOL_MAX_MEMORY = int(os.getenv('REPORT_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))  # Reports.zip spills to disk past this size
+REPORT_CLASS_PDF = os.getenv('REPORT_CLASS_PDF', 'False').lower() in ('true', '1', 'yes')  # Also put every card in one combined PDF in the ZIP
+
+# --- RESULT CACHE (identical re-uploads reuse finished artifacts) ---
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))  # LRU-evicted past this size
+COLUMN_CACHE_TIMEOUT = int(os.getenv('COLUMN_CACHE_TIMEOUT', str(90 * 24 * 3600)))  # Column roles per header signature ('columns' cache)
+
+# 'default' (API throttle counters) stays in process memory. 'columns' must be shared by every web
+# process and forked analysis child: a table in the main database (created by migrate), or Redis
+# when REDIS_URL is set.
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'columns': (
+        {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.getenv('REDIS_URL')}
+        if os.getenv('REDIS_URL') else
+        {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'analytics_column_cache'}
+    ),
+}
+
+# --- SCORE TABLES (normalized per-student / per-subject results) ---
+SCORE_BATCH_SIZE = int(os.getenv('SCORE_BATCH_SIZE', '5000'))  # Rows per bulk INSERT (Django lowers it to fit SQLite's parameter limit)
+
+# --- ARTIFACTS (what the pipeline renders up front; the rest is built on first download) ---
+ARTIFACT_PREFETCH = os.getenv('ARTIFACT_PREFETCH', 'charts')  # Comma-separated: excel, charts, streams, reports (or 'all' / 'none')
+
+# --- INSTRUMENTATION (stage timings, profiling, Prometheus metrics) ---
+ANALYSIS_PROFILE_ALL = os.getenv('ANALYSIS_PROFILE_ALL', 'False').lower() in ('true', '1', 'yes')  # cProfile every run, not just opted-in exams
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # Bearer token for /api/analytics/metrics/ (staff can always read it)
+
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60), 
@@ -1,9 +1,7 @@
 # backend/core/urls.py
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
+from analytics.media import protected_media
 from django.http import JsonResponse, HttpResponse
 from django.contrib.auth.models import User # Import User model
 
@@ -60,8 +58,7 @@ urlpatterns = [
     path('api/auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     # 3. FORCE MEDIA SERVING (Critical for Render Free Tier)
-    # This tells Django to serve files from the 'media' folder even if DEBUG=False
-    re_path(r'^media/(?P<path>.*)$', serve, {
-        'document_root': settings.MEDIA_ROOT,
-    }),
+    # Serves the 'media' folder even if DEBUG=False, but only through signed links from the
+    # API (or to staff), with Range/ETag support and optional X-Accel-Redirect offload
+    re_path(r'^media/(?P<path>.*)$', protected_media),
 ]
\ No newline at end of file
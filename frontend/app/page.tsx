@@ -7,7 +7,7 @@ import { useRouter } from "next/navigation";
 import { isAxiosError } from "axios";
 import api from "@/lib/api"; 
 import Image from "next/image"; 
-import ExamList from "@/components/ExamList"; 
+import ExamList, { type ExamListItem } from "@/components/ExamList"; 
 
 import { 
   UploadCloud, FileSpreadsheet, Download, CheckCircle, Loader2, 
@@ -30,12 +30,24 @@ interface ExamResult {
   message: string;
   processed_file: string | null;
   reports_zip: string | null;
+  stream_artifacts?: string | null;
   subject_chart: string | null;
   passrate_chart: string | null;
+  // Download links per file field; files not built yet are generated on first download
+  artifacts?: Record<string, { ready: boolean; url: string }>;
   analysis_summary: AnalysisSummary;
   uploaded_at: string; 
 }
 
+// GET /exam-uploads/<id>/progress/ (summary is null until the calculations are done)
+interface ExamProgress {
+  id: string;
+  status: ExamResult['status'];
+  message: string;
+  progress: { stage?: string; percent?: number; summary_ready?: boolean; failed?: boolean };
+  analysis_summary: AnalysisSummary | null;
+}
+
 interface GradingRule {
   min: number;
   max: number;
@@ -74,12 +86,15 @@ export default function Home() {
   const [progressMsg, setProgressMsg] = useState("");
   const [resultData, setResultData] = useState<ExamResult | null>(null);
   
+  const [downloading, setDownloading] = useState<string | null>(null);
+
   // Controls updating the sidebar list
   const [refreshTrigger, setRefreshTrigger] = useState(0);
 
   // Settings
   const [showSettings, setShowSettings] = useState(false);
   const [ignoreColumns, setIgnoreColumns] = useState(""); 
+  const [sheetsAsStreams, setSheetsAsStreams] = useState(false);
   const [gradingScheme, setGradingScheme] = useState<GradingRule[]>(SCHEME_CBC);
   const [activePreset, setActivePreset] = useState<"CBC" | "844" | "Custom">("CBC");
 
@@ -162,13 +177,14 @@ export default function Home() {
     formData.append("file", file);
     
     if (ignoreColumns) formData.append("custom_ignore_columns", ignoreColumns);
+    if (sheetsAsStreams) formData.append("sheets_as_streams", "true");
     formData.append("grading_scheme", JSON.stringify(gradingScheme));
 
     try {
       const response = await api.post<ExamResult>(`/api/analytics/exam-uploads/`, formData, {
         headers: { 'Content-Type': 'multipart/form-data' }
       });
-      pollStatus(response.data.id);
+      watchProgress(response.data.id);
     } catch (err: unknown) {
       console.error(err);
       setStatus("error");
@@ -178,39 +194,126 @@ export default function Home() {
     }
   };
 
+  // Applies one progress snapshot; returns true once the analysis has finished
+  const applyProgress = async (uuid: string, data: ExamProgress) => {
+    if (data.status === 'COMPLETED') {
+      const exam = await api.get<ExamResult>(`/api/analytics/exam-uploads/${uuid}/`);
+      setResultData(exam.data);
+      setStatus("completed");
+      setLoading(false);
+      setRefreshTrigger(prev => prev + 1); 
+      return true;
+    }
+    if (data.status === 'FAILED') {
+      setStatus("error");
+      setLoading(false);
+      alert(`Error: ${data.message}`);
+      return true;
+    }
+    const { stage, percent } = data.progress;
+    const summary = data.analysis_summary;
+    if (summary) {
+      // The numbers are final before the workbook and charts are: show them straight away
+      setProgressMsg(`Mean ${summary.class_mean} · Pass rate ${summary.pass_rate}% · Preparing files (${percent}%)`);
+    } else {
+      setProgressMsg(stage ? `Analyzing results: ${stage} (${percent}%)` : "Analyzing results...");
+    }
+    return false;
+  };
+
+  // Server-sent events: the server pushes each stage as the worker reaches it
+  const watchProgress = async (uuid: string) => {
+    if (typeof EventSource === "undefined") {
+      pollStatus(uuid);
+      return;
+    }
+    let token: string;
+    try {
+      // EventSource can't send the Authorization header: a short-lived token for this upload only
+      const res = await api.post<{ token: string }>(`/api/analytics/exam-uploads/${uuid}/stream-token/`);
+      token = res.data.token;
+    } catch {
+      pollStatus(uuid);
+      return;
+    }
+
+    const url = `${api.defaults.baseURL}/api/analytics/exam-uploads/${uuid}/events/?token=${encodeURIComponent(token)}`;
+    const source = new EventSource(url);
+    let finished = false;
+    let opened = false;
+    source.onopen = () => { opened = true; };
+    source.addEventListener("progress", async (event) => {
+      const data: ExamProgress = JSON.parse((event as MessageEvent).data);
+      if (data.status === 'COMPLETED' || data.status === 'FAILED') {
+        finished = true;
+        source.close();
+      }
+      await applyProgress(uuid, data);
+    });
+    source.onerror = () => {
+      // The browser reconnects on its own after a server-side close; once the stream token
+      // has expired that reconnect is refused, so reopen with a fresh one. A stream that never
+      // opened (e.g. a WSGI-only deployment) falls back to polling
+      if (finished || source.readyState !== EventSource.CLOSED) return;
+      if (opened) watchProgress(uuid);
+      else pollStatus(uuid);
+    };
+  };
+
   const pollStatus = async (uuid: string) => {
+    // Polls the lightweight progress endpoint; the full exam is fetched once, when it completes
     const interval = setInterval(async () => {
       try {
-        const res = await api.get<ExamResult>(`/api/analytics/exam-uploads/${uuid}/`);
-        if (res.data.status === 'COMPLETED') {
-          clearInterval(interval);
-          setResultData(res.data);
-          setStatus("completed");
-          setLoading(false);
-          setRefreshTrigger(prev => prev + 1); 
-        } else if (res.data.status === 'FAILED') {
-          clearInterval(interval);
-          setStatus("error");
-          setLoading(false);
-          alert(`Error: ${res.data.message}`);
-        } else {
-          setProgressMsg("Analyzing results...");
-        }
+        const res = await api.get<ExamProgress>(`/api/analytics/exam-uploads/${uuid}/progress/`);
+        if (await applyProgress(uuid, res.data)) clearInterval(interval);
       } catch (error) {
         console.error(error);
         clearInterval(interval);
         setLoading(false);
         setStatus("error");
       }
-    }, 2000);
+    }, 1000);
   };
 
   // --- CLICKING A HISTORY ITEM ---
-  // FIX: Replaced 'any' with 'ExamResult' to silence the linter
-  const handleHistorySelect = (exam: ExamResult) => {
-    setResultData(exam);
-    setStatus("completed");
-    window.scrollTo({ top: 0, behavior: 'smooth' });
+  // The list rows are lean: fetch the full exam (files, charts, downloads) when one is opened
+  const handleHistorySelect = async (exam: ExamListItem) => {
+    try {
+      const res = await api.get<ExamResult>(`/api/analytics/exam-uploads/${exam.id}/`);
+      setResultData(res.data);
+      setStatus("completed");
+      window.scrollTo({ top: 0, behavior: 'smooth' });
+    } catch (error) {
+      console.error(error);
+      alert("Could not load this exam.");
+    }
+  };
+
+  // --- DOWNLOADS (built by the server on first request) ---
+  const handleDownload = async (field: string, fallbackName: string) => {
+    const artifact = resultData?.artifacts?.[field];
+    if (!artifact) return;
+    setDownloading(field);
+    try {
+      // A deferred artifact answers 202 while the workers build it: ask again until it's served
+      let res = await api.get(artifact.url, { responseType: "blob" });
+      while (res.status === 202) {
+        const wait = Number(res.headers["retry-after"]) || 2;
+        await new Promise((resolve) => setTimeout(resolve, wait * 1000));
+        res = await api.get(artifact.url, { responseType: "blob" });
+      }
+      const match = /filename="?([^"]+)"?/.exec(res.headers["content-disposition"] || "");
+      const link = document.createElement("a");
+      link.href = URL.createObjectURL(res.data);
+      link.download = match ? match[1] : fallbackName;
+      link.click();
+      URL.revokeObjectURL(link.href);
+    } catch (err) {
+      console.error(err);
+      alert("Download failed. Please try again.");
+    } finally {
+      setDownloading(null);
+    }
   };
 
   // --- GO BACK TO UPLOAD FORM ---
@@ -298,15 +401,21 @@ export default function Home() {
 
               {/* DOWNLOADS */}
               <div className="grid grid-cols-1 gap-4">
-                {resultData.processed_file && (
-                  <a href={resultData.processed_file} className="flex items-center justify-center w-full py-4 bg-emerald-600 hover:bg-emerald-700 text-white text-lg font-bold rounded-xl shadow-md transition hover:scale-[1.01]">
-                    <Download className="mr-2 h-6 w-6" /> Download Broadsheet (Excel)
-                  </a>
+                {resultData.artifacts?.processed_file && (
+                  <button onClick={() => handleDownload("processed_file", "Broadsheet.xlsx")} disabled={downloading !== null} className="flex items-center justify-center w-full py-4 bg-emerald-600 hover:bg-emerald-700 disabled:opacity-60 text-white text-lg font-bold rounded-xl shadow-md transition hover:scale-[1.01]">
+                    {downloading === "processed_file" ? <Loader2 className="mr-2 h-6 w-6 animate-spin" /> : <Download className="mr-2 h-6 w-6" />} Download Broadsheet (Excel)
+                  </button>
                 )}
-                {resultData.reports_zip && (
-                  <a href={resultData.reports_zip} className="flex items-center justify-center w-full py-4 bg-blue-600 hover:bg-blue-700 text-white text-lg font-bold rounded-xl shadow-md transition hover:scale-[1.01]">
-                    <FileArchive className="mr-2 h-6 w-6" /> Download Report Cards (PDF)
-                  </a>
+                {resultData.artifacts?.reports_zip && (
+                  <button onClick={() => handleDownload("reports_zip", "Reports.zip")} disabled={downloading !== null} className="flex items-center justify-center w-full py-4 bg-blue-600 hover:bg-blue-700 disabled:opacity-60 text-white text-lg font-bold rounded-xl shadow-md transition hover:scale-[1.01]">
+                    {downloading === "reports_zip" ? <Loader2 className="mr-2 h-6 w-6 animate-spin" /> : <FileArchive className="mr-2 h-6 w-6" />}
+                    {downloading === "reports_zip" && !resultData.artifacts.reports_zip.ready ? "Preparing Report Cards..." : "Download Report Cards (PDF)"}
+                  </button>
+                )}
+                {resultData.artifacts?.stream_artifacts && (
+                  <button onClick={() => handleDownload("stream_artifacts", "Streams.zip")} disabled={downloading !== null} className="flex items-center justify-center w-full py-4 bg-slate-700 hover:bg-slate-800 disabled:opacity-60 text-white text-lg font-bold rounded-xl shadow-md transition hover:scale-[1.01]">
+                    {downloading === "stream_artifacts" ? <Loader2 className="mr-2 h-6 w-6 animate-spin" /> : <FileArchive className="mr-2 h-6 w-6" />} Download Per-Stream Broadsheets &amp; Charts
+                  </button>
                 )}
               </div>
             </div>
@@ -393,6 +502,12 @@ export default function Home() {
                         <p className="text-xs text-slate-400 mb-2">Does your Excel file have Fees, UPI, or Phone numbers?</p>
                         <input type="text" placeholder="e.g. UPI, Fees Balance, Phone Number" value={ignoreColumns} onChange={(e) => setIgnoreColumns(e.target.value)} className="w-full p-3 border border-slate-300 rounded-lg text-sm text-black placeholder:text-slate-400"/>
                       </div>
+
+                      {/* Batch Workbooks */}
+                      <label className="flex items-start gap-2 text-sm text-slate-600">
+                        <input type="checkbox" checked={sheetsAsStreams} onChange={(e) => setSheetsAsStreams(e.target.checked)} className="mt-1"/>
+                        <span>Each sheet of my workbook is a stream (otherwise only the first sheet is read)</span>
+                      </label>
                     </div>
                   )}
                 </div>
@@ -412,7 +527,7 @@ export default function Home() {
                   </div>
 
                   <div className="border-2 border-dashed border-slate-300 rounded-xl p-8 flex flex-col items-center justify-center hover:bg-blue-50 hover:border-blue-400 transition cursor-pointer relative group">
-                    <input type="file" accept=".xlsx, .csv" className="absolute inset-0 w-full h-full opacity-0 cursor-pointer" onChange={handleFileChange}/>
+                    <input type="file" accept=".xlsx, .csv, .zip" className="absolute inset-0 w-full h-full opacity-0 cursor-pointer" onChange={handleFileChange}/>
                     {file ? (
                       <div className="flex flex-col items-center text-blue-600">
                         <FileSpreadsheet className="h-10 w-10 mb-2" />
@@ -422,7 +537,7 @@ export default function Home() {
                     ) : (
                       <div className="flex flex-col items-center text-slate-400 group-hover:text-blue-500">
                         <UploadCloud className="h-10 w-10 mb-2" />
-                        <span className="font-medium">Click to upload marksheet (.xlsx)</span>
+                        <span className="font-medium">Click to upload marksheet (.xlsx, or .zip with one sheet per stream)</span>
                       </div>
                     )}
                   </div>
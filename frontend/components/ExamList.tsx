@@ -4,36 +4,38 @@ import { useEffect, useState, useCallback } from "react";
 import api from "@/lib/api";
 import { FileText, Calendar, ChevronRight, TrendingUp, Loader2, Trash2 } from "lucide-react";
 
-// --- TYPES (Matching page.tsx to avoid errors) ---
-interface AnalysisSummary {
-  student_count: number;
-  class_mean: number;
-  pass_rate: number;
-  top_student: string;
-}
-
-// Important: This interface matches page.tsx structure so we can pass it back
-export interface ExamResult {
+// --- TYPES ---
+// One row of the (lean) history list; the full exam is fetched when a row is opened
+export interface ExamListItem {
   id: string;
   title: string;
   status: 'PENDING' | 'PROCESSING' | 'COMPLETED' | 'FAILED'; 
   message: string;
   uploaded_at: string;
-  analysis_summary: AnalysisSummary;
-  // These fields come from the backend but might be null
-  processed_file: string | null;
-  reports_zip: string | null;
-  subject_chart: string | null;
-  passrate_chart: string | null;
+  updated_at: string;
+  summary: {
+    student_count: number | null;
+    class_mean: number | null;
+    pass_rate: number | null;
+    top_student: string | null;
+  };
+}
+
+// Cursor-paginated list response
+interface ExamPage {
+  next: string | null;
+  previous: string | null;
+  results: ExamListItem[];
 }
 
 interface ExamListProps {
-  onSelectExam: (exam: ExamResult) => void; 
+  onSelectExam: (exam: ExamListItem) => void; 
   refreshTrigger: number;
 }
 
 export default function ExamList({ onSelectExam, refreshTrigger }: ExamListProps) {
-  const [exams, setExams] = useState<ExamResult[]>([]);
+  const [exams, setExams] = useState<ExamListItem[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
   const [loading, setLoading] = useState(true);
 
   const fetchExams = useCallback(async () => {
@@ -41,8 +43,9 @@ export default function ExamList({ onSelectExam, refreshTrigger }: ExamListProps
       // Don't show loading spinner if it's just a background refresh (trigger > 0)
       if (refreshTrigger === 0) setLoading(true); 
       
-      const res = await api.get<ExamResult[]>("/api/analytics/exam-uploads/");
-      setExams(res.data);
+      const res = await api.get<ExamPage>("/api/analytics/exam-uploads/");
+      setExams(res.data.results);
+      setNextPage(res.data.next);
     } catch (error) {
       console.error("Failed to fetch exams", error);
     } finally {
@@ -50,6 +53,17 @@ export default function ExamList({ onSelectExam, refreshTrigger }: ExamListProps
     }
   }, [refreshTrigger]);
 
+  const loadMore = async () => {
+    if (!nextPage) return;
+    try {
+      const res = await api.get<ExamPage>(nextPage);
+      setExams(prev => [...prev, ...res.data.results]);
+      setNextPage(res.data.next);
+    } catch (error) {
+      console.error("Failed to fetch exams", error);
+    }
+  };
+
   useEffect(() => {
     fetchExams();
   }, [fetchExams]); 
@@ -103,10 +117,10 @@ export default function ExamList({ onSelectExam, refreshTrigger }: ExamListProps
                   {new Date(exam.uploaded_at).toLocaleDateString()}
                 </span>
                 
-                {exam.analysis_summary?.class_mean > 0 && (
+                {(exam.summary.class_mean ?? 0) > 0 && (
                   <span className="flex items-center text-blue-600 bg-blue-100 px-2 py-0.5 rounded-full font-bold">
                     <TrendingUp className="w-3 h-3 mr-1" />
-                    {exam.analysis_summary.class_mean}
+                    {exam.summary.class_mean}
                   </span>
                 )}
               </div>
@@ -132,6 +146,11 @@ export default function ExamList({ onSelectExam, refreshTrigger }: ExamListProps
             </div>
           </div>
         ))}
+        {nextPage && (
+          <button onClick={loadMore} className="w-full p-3 text-xs font-semibold text-blue-600 hover:bg-blue-50 transition">
+            Load older exams
+          </button>
+        )}
       </div>
     </div>
   );